@@ -2,6 +2,7 @@ import calendar
 import json
 import os
 from uuid import uuid4
+from dataclasses import dataclass
 from typing import Dict, List, Optional
 import re
 
@@ -14,6 +15,12 @@ from langgraph.prebuilt import create_react_agent
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_gigachat.chat_models import GigaChat
 
+from catalog import (CATALOG_DIR, Catalog, GeoIndex, IntervalIndex, city_matches, event_bounds, parse_hhmm,
+                     within_interval)
+from catalog_db import CatalogDB
+from categories import CategoryIndex, split_categories
+from city_resolver import GAZETTEER_CSV, Gazetteer
+
 import sys
 try:
     sys.stdout.reconfigure(encoding="utf-8", errors="replace")
@@ -43,6 +50,13 @@ def _safe_print(*parts):
     sys.stdout.buffer.flush()
 
 
+@dataclass(frozen=True)
+class CatalogIndexes:
+    interval: Optional[IntervalIndex]
+    geo: GeoIndex
+    categories: CategoryIndex
+
+
 class Agent:
     def __init__(self):
         self.history_length: Optional[int] = None
@@ -52,11 +66,39 @@ class Agent:
         self.url_request_: Optional[str] = None
         self.url_auth_: Optional[str] = None
         self.data_path_: Optional[str] = None
+        self.catalog_dir_: str = CATALOG_DIR
+        self.catalog_poll_seconds_: float = 30.0
+        self.catalog_backend_: str = "json"
+        self.catalog_db_path_: str = ":memory:"
+        self.catalog_db_: Optional[CatalogDB] = None
+        # Индексы одной версии каталога (интервалы, гео, категории) — подменяются вместе
+        self.indexes_: Optional[CatalogIndexes] = None
+        self.gazetteer_path_: str = GAZETTEER_CSV
+        self.nearby_steps_km_: List[float] = [15, 40, 80, 150]
         self.is_corp: bool = False
 
         self.set_config("cfg.json")
+        # Каталог живёт в памяти и сам подхватывает новые снимки от планировщика парсера
+        self.catalog_ = Catalog(self.catalog_dir_, fallback=self.data_path_)
+        if self.catalog_backend_ == "sqlite":
+            # База перестраивается при каждой новой версии каталога
+            self.catalog_db_ = CatalogDB(self.catalog_db_path_)
+            self.catalog_.add_listener(self.catalog_db_.load)
+        # Координаты городов — для поиска рядом, когда в самом городе ничего нет
+        self.gazetteer_ = Gazetteer(self.gazetteer_path_)
+        self.catalog_.add_listener(self._rebuild_indexes)
+        self.catalog_.watch(self.catalog_poll_seconds_)
         self.create_agent()
 
+    def _rebuild_indexes(self, events):
+        # Все индексы собираются до подмены: поиск видит либо старую версию, либо новую целиком
+        self.indexes_ = CatalogIndexes(
+            # Индекс по интервалам дат: многодневные события без полного прохода по каталогу
+            interval=IntervalIndex(events) if self.catalog_db_ is None else None,
+            geo=GeoIndex(events, self.gazetteer_),
+            categories=CategoryIndex(events),
+        )
+
     def set_config(self, path_to_config: str):
         with open(path_to_config, 'r', encoding='utf-8') as f:
             data = json.load(f)
@@ -67,6 +109,12 @@ class Agent:
             self.is_corp = data["is_corp"]
             self.history_length = data["history_length"]
             self.data_path_ = data["data_path"]
+            self.catalog_dir_ = data.get("catalog_dir", CATALOG_DIR)
+            self.catalog_poll_seconds_ = data.get("catalog_poll_seconds", 30)
+            self.catalog_backend_ = data.get("catalog_backend", "json")
+            self.catalog_db_path_ = data.get("catalog_db_path", ":memory:")
+            self.gazetteer_path_ = data.get("gazetteer_path", GAZETTEER_CSV)
+            self.nearby_steps_km_ = data.get("nearby_steps_km", [15, 40, 80, 150])
             sys_path = data.get("path_to_system_promt")
             if sys_path and os.path.exists(sys_path):
                 with open(sys_path, 'r', encoding='utf-8') as sf:
@@ -105,8 +153,10 @@ class Agent:
                 parsed = json.loads(parsed)
                 print(f'PARSED: {parsed}')
                 city, date, time_ = parsed["city"], parsed["date"], parsed["time_start"]
+                radius = parsed.get("radius_km")
             except:
                 city, date, time_ = "null", "null", "null"
+                radius = None
 
             results = self.search_events_from_json(
                 city=city,
@@ -115,6 +165,7 @@ class Agent:
                 time_window_minutes=180,
                 max_results=5,
                 user_text=user_text,
+                radius_km=radius,
             )
 
             return _scrub(results)
@@ -145,31 +196,10 @@ class Agent:
         result = resp.json()
         return result["choices"][0]["message"]["content"]
 
-    @staticmethod
-    def _parse_hhmm(s: Optional[str] = None) -> Optional[dtime]:
-        if not s:
-            return None
-        return datetime.strptime(s.strip(), "%H:%M").time()
+    _parse_hhmm = staticmethod(parse_hhmm)
+    _within_interval = staticmethod(within_interval)
+    _city_matches = staticmethod(city_matches)
 
-    @staticmethod
-    def _within_interval(user_start: datetime, user_end: datetime,
-                         ev_start: datetime, ev_end: datetime) -> bool:
-        # Пересечение интервалов (касание краями НЕ считается)
-        return not (user_end <= ev_start or ev_end <= user_start)
-
-    @staticmethod
-    def _city_matches(user_city: Optional[str], ev_city: Optional[str],
-                      address: str, title: str, description: str) -> bool:
-        if not user_city:
-            return True
-        uc = user_city.strip().lower()
-        fields = [
-            (ev_city or "").lower(),
-            (address or "").lower(),
-            (title or "").lower(),
-            (description or "").lower(),
-        ]
-        return any(uc in f for f in fields if f)
     def search_events_from_json(
         self,
         *,
@@ -179,56 +209,96 @@ class Agent:
         time_window_minutes=180,
         max_results=None,
         user_text=None,
+        radius_km=None,
     ):
         """
-        Ищет события в self.data_path_ по городу/дате/времени.
+        Ищет события текущей версии каталога (self.catalog_) по городу/дате/времени.
         Поддерживает даты формата:
         - YYYY-MM-DD (точный день с окном +- time_window_minutes вокруг time_start|12:00)
         - YYYY-MM-XX (весь месяц)
         - YYYY-XX-XX (весь год)
+        С radius_km ищет в радиусе от города (по справочнику координат);
+        если в самом городе ничего нет — в ближайших городах, расширяя радиус
+        по шагам nearby_steps_km.
+        Если в user_text названа категория («экология», «животные»), события
+        сначала отбираются по тегам категорий; LLM_Filter проверяет их, только
+        если в запросе есть что-то сверх категории, города и даты.
         """
         user_start, user_end, gran = Agent._compute_search_range(date, time_start, time_window_minutes)
         if not user_start or not user_end:
             return "Не удалось распознать дату, возможно ваш запрос связан с чувствительными темами, на которые я не могу отвечать. Если вы уверены в корректности, уточните день/месяц/год, пожалуйста."
 
-        with open(self.data_path_, "r", encoding="utf-8") as f:
-            dataset = json.load(f)
+        try:
+            radius_km = float(radius_km) if radius_km else None
+        except (TypeError, ValueError):
+            radius_km = None
+
+        # Категория из запроса — пересечение с индексом категорий; остаток запроса — для LLM_Filter
+        categories, rest = split_categories(user_text, ignore=(city,)) if user_text else ([], "")
+
+        # Берём ссылку один раз: перезагрузка каталога посреди поиска её не изменит
+        idx = self.indexes_
+        ranked = False
+        distances = {}
+        origin = self.gazetteer_.lookup(city) if city else None
+        if origin is None or idx is None:
+            radius_km = None
+
+        if radius_km:
+            # «В радиусе N км от города» — по пространственному индексу, ближайшие первыми
+            nearby = idx.geo.search(lat=origin.lat, lon=origin.lon, radius_km=radius_km,
+                                    start=user_start, end=user_end)
+            if categories:
+                nearby = [(km, ev) for km, ev in nearby if idx.categories.matches(ev, categories)]
+            matched = [ev for _, ev in nearby]
+            distances = {id(ev): km for km, ev in nearby}
+            ranked = True
+        elif self.catalog_db_ is not None:
+            # Город, интервал, категории и слова запроса — один индексированный SQL-запрос.
+            # В FTS идёт только остаток запроса: служебные слова, город и дата ранжирование не сбивают
+            matched = self.catalog_db_.search(city=city, start=user_start, end=user_end,
+                                              text=rest or None, categories=categories or None)
+            ranked = bool(matched) and bool(rest)
+            if not matched and rest:
+                matched = self.catalog_db_.search(city=city, start=user_start, end=user_end,
+                                                  categories=categories or None)
+        elif idx is not None:
+            matched = idx.interval.search(city=city, start=user_start, end=user_end)
+            if categories:
+                matched = idx.categories.filter(matched, categories)
+        else:
+            matched = []
+
+        if not matched and not radius_km and origin is not None and idx is not None:
+            # В самом городе пусто — ищем в ближайших, расширяя радиус
+            for step in self.nearby_steps_km_:
+                nearby = idx.geo.search(lat=origin.lat, lon=origin.lon, radius_km=step,
+                                        start=user_start, end=user_end)
+                if categories:
+                    nearby = [(km, ev) for km, ev in nearby if idx.categories.matches(ev, categories)]
+                if nearby:
+                    matched = [ev for _, ev in nearby]
+                    distances = {id(ev): km for km, ev in nearby}
+                    ranked = True
+                    break
 
         results = []
-        for ev in dataset:
-            sch = ev.get("schedule") or {}
+        for ev in matched:
             loc = ev.get("location") or {}
             org = ev.get("organizer") or {}
+            ev_start, ev_end = event_bounds(ev)
 
-            ev_date_str = sch.get("date")
-            if not ev_date_str:
-                continue
-            try:
-                ev_date = datetime.strptime(ev_date_str, "%Y-%m-%d").date()
-            except ValueError:
-                continue
-
-            ev_ts = Agent._parse_hhmm(sch.get("time_start")) or dtime(0, 0)
-            ev_te = Agent._parse_hhmm(sch.get("time_end")) or dtime(23, 59)
-            ev_start = datetime.combine(ev_date, ev_ts)
-            ev_end = datetime.combine(ev_date, ev_te)
-
-            if not Agent._within_interval(user_start, user_end, ev_start, ev_end):
-                continue
-
-            if not Agent._city_matches(
-                city,
-                loc.get("city"),
-                loc.get("address_full") or "",
-                ev.get("title") or "",
-                ev.get("description") or ev.get("title"),
-            ):
-                continue
-
-            date_line = f"{ev_date.strftime('%d.%m.%Y')} {ev_ts.strftime('%H:%M')}-{ev_te.strftime('%H:%M')}"
+            if ev_start.date() == ev_end.date():
+                date_line = f"{ev_start.strftime('%d.%m.%Y %H:%M')}-{ev_end.strftime('%H:%M')}"
+            else:
+                # Многодневное: период и ежедневные часы
+                date_line = (f"{ev_start.strftime('%d.%m.%Y')}-{ev_end.strftime('%d.%m.%Y')} "
+                             f"{ev_start.strftime('%H:%M')}-{ev_end.strftime('%H:%M')}")
             address = loc.get("address_full") or "Адрес не указан"
             org_name = org.get("name") or "Организатор не указан"
             content = f"{date_line} || {address} || {org_name}"
+            if origin is not None and distances.get(id(ev), 0) >= 1:
+                content += f" || ≈{distances[id(ev)]:.0f} км от г. {origin.name}"
 
             results.append({
                 "title": _safe_text(ev.get("title") or "Без названия"),
@@ -236,7 +306,7 @@ class Agent:
                 "content": _safe_text(content),
             })
 
-        if user_text and results:
+        if user_text and results and (rest or not categories):
             pref = LLM_Filter("cfg_filter.json")
             filtered = []
             for r in results:
@@ -249,7 +319,8 @@ class Agent:
                     filtered.append(r)
             results = filtered
 
-        results.sort(key=lambda r: r["content"])
+        if not ranked:
+            results.sort(key=lambda r: r["content"])
         if max_results is not None:
             results = results[:max_results]
 
@@ -0,0 +1,179 @@
+# bench_catalog.py
+"""
+Поиск событий: полный проход по JSON против индекса интервалов (catalog.IntervalIndex)
+и SQLite с индексами и FTS5 на синтетических каталогах из 1k/10k/100k событий,
+собранных из data/events.json (часть событий — многодневные), а также поиск
+«в радиусе N км от города» по сетке catalog.GeoIndex против полного прохода.
+
+    python bench_catalog.py
+    python bench_catalog.py --sizes 1000 50000 --queries 200
+"""
+import argparse
+import copy
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from catalog import GeoIndex, IntervalIndex, event_bounds, event_point, occurs_within, scan_events
+from catalog_db import CatalogDB
+from city_resolver import Gazetteer, haversine_km
+
+CITIES = ["Москва", "Санкт-Петербург", "Екатеринбург", "Ростов-на-Дону", "Ярославль", "Краснодар",
+          "Казань", "Новосибирск", "Нижний Новгород", "Севастополь", "Волгоград", "Самара"]
+KEYWORDS = ["животные", "экология", "помощь пожилым", "донорство", "дети", "спорт", "культура",
+            "уборка парка", "поиск пропавших", "наставничество"]
+
+
+def synthetic_catalog(templates, n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    start = date(2025, 11, 1)
+    events = []
+    for i in range(n):
+        ev = copy.deepcopy(rnd.choice(templates))
+        day = start + timedelta(days=rnd.randrange(365))
+        h = rnd.randrange(7, 20)
+        city = rnd.choice(CITIES)
+        ev["url"] = f"https://dobro.ru/event/{20_000_000 + i}"
+        ev["title"] = f"{ev.get('title') or 'Событие'} — {rnd.choice(KEYWORDS)}"
+        # Каждое шестое — акция на несколько дней или недель
+        last = day + timedelta(days=rnd.randrange(1, 30)) if rnd.random() < 0.17 else day
+        ev["schedule"] = {"date": day.isoformat(), "date_end": last.isoformat(), "time_start": f"{h:02d}:00",
+                          "time_end": f"{h + rnd.randrange(1, 4):02d}:00", "datetime_raw": ""}
+        ev["location"] = {"address_full": f"г {city}, ул Ленина, д {rnd.randrange(1, 200)}",
+                          "city": city, "region": None}
+        events.append(ev)
+    return events
+
+
+def synthetic_queries(n: int, seed: int = 2):
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        day = date(2025, 11, 1) + timedelta(days=rnd.randrange(365))
+        kind = rnd.random()
+        if kind < 0.4:
+            # конкретный день ±3 часа
+            center = datetime.combine(day, datetime.min.time()) + timedelta(hours=rnd.randrange(8, 19))
+            start, end = center - timedelta(hours=3), center + timedelta(hours=3)
+        elif kind < 0.8:
+            start = datetime(day.year, day.month, 1)
+            end = start + timedelta(days=30, hours=23, minutes=59)
+        else:
+            start = datetime.combine(day, datetime.min.time())
+            end = start + timedelta(hours=23, minutes=59)
+        city = rnd.choice(CITIES + [None])
+        text = f"хочу помочь: {rnd.choice(KEYWORDS)}" if rnd.random() < 0.5 else None
+        queries.append((city, start, end, text))
+    return queries
+
+
+def scan_nearby(events, gazetteer, lat, lon, radius_km, start, end):
+    """Поиск в радиусе без индекса: расстояние до каждого события каталога."""
+    found = []
+    for ev in events:
+        point = event_point(ev, gazetteer)
+        if point is None:
+            continue
+        km = haversine_km(lat, lon, *point)
+        bounds = event_bounds(ev)
+        if km <= radius_km and bounds is not None and occurs_within(bounds, start, end):
+            found.append((km, ev))
+    return found
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--source", default="data/events.json", help="шаблоны событий")
+    args = ap.parse_args()
+
+    templates = json.loads(Path(args.source).read_text(encoding="utf-8"))
+    queries = synthetic_queries(args.queries)
+    gazetteer = Gazetteer()
+    # Точки поиска «рядом»: города-спутники и города без событий в каталоге
+    origins = [gazetteer.lookup(name) for name in ("Химки", "Пушкин", "Верхняя Пышма", "Аксай", "Тольятти")]
+
+    print(f"{'событий':>8} {'JSON загрузка':>14} {'скан ms/запр':>13} {'файл ms/запр':>13} "
+          f"{'индекс сборка':>14} {'индекс ms/запр':>15} "
+          f"{'SQLite сборка':>14} {'SQL ms/запр':>12} {'ускорение':>10}")
+    for n in args.sizes:
+        events = synthetic_catalog(templates, n)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "events.json"
+            path.write_text(json.dumps(events, ensure_ascii=False), encoding="utf-8")
+
+            t0 = time.perf_counter()
+            loaded = json.loads(path.read_text(encoding="utf-8"))
+            load_s = time.perf_counter() - t0
+
+            # Скан по каталогу в памяти (Agent после перехода на catalog.Catalog)
+            t0 = time.perf_counter()
+            scan_hits = 0
+            for city, start, end, _ in queries:
+                scan_hits += len(scan_events(loaded, city=city, start=start, end=end))
+            scan_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            # Старый путь: каждый запрос заново читает JSON с диска
+            file_ms = scan_ms + load_s * 1000
+
+            t0 = time.perf_counter()
+            index = IntervalIndex(loaded)
+            index_build_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            index_hits = 0
+            for city, start, end, _ in queries:
+                index_hits += len(index.search(city=city, start=start, end=end))
+            index_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+            db = CatalogDB()
+            t0 = time.perf_counter()
+            db.load(loaded)
+            build_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            sql_hits = 0
+            for city, start, end, _ in queries:
+                sql_hits += len(db.search(city=city, start=start, end=end))
+            sql_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+            t0 = time.perf_counter()
+            for city, start, end, text in queries:
+                db.search(city=city, start=start, end=end, text=text, limit=20)
+            fts_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+            t0 = time.perf_counter()
+            geo = GeoIndex(loaded, gazetteer)
+            geo_build_s = time.perf_counter() - t0
+            geo_queries = [(origins[i % len(origins)], start, end) for i, (_, start, end, _) in enumerate(queries)]
+            t0 = time.perf_counter()
+            geo_hits = 0
+            for origin, start, end in geo_queries:
+                geo_hits += len(geo.search(lat=origin.lat, lon=origin.lon, radius_km=50, start=start, end=end))
+            geo_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            t0 = time.perf_counter()
+            near_hits = 0
+            for origin, start, end in geo_queries:
+                near_hits += len(scan_nearby(loaded, gazetteer, origin.lat, origin.lon, 50, start, end))
+            near_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        if not scan_hits == index_hits == sql_hits:
+            print(f"  ! результаты расходятся: скан {scan_hits}, индекс {index_hits}, SQLite {sql_hits}")
+        best_ms = min(index_ms, sql_ms)
+        print(f"{n:>8} {load_s * 1000:>12.0f}ms {scan_ms:>13.2f} {file_ms:>13.1f} "
+              f"{index_build_s * 1000:>12.0f}ms {index_ms:>15.2f} "
+              f"{build_s * 1000:>12.0f}ms {sql_ms:>12.2f} {scan_ms / best_ms if best_ms else 0:>9.1f}x")
+        print(f"{'':>8} с ключевыми словами (FTS5, bm25, top-20): {fts_ms:.2f} ms/запрос")
+        if geo_hits != near_hits:
+            print(f"  ! результаты расходятся: сетка {geo_hits}, полный проход {near_hits}")
+        print(f"{'':>8} в радиусе 50 км: сетка {geo_ms:.2f} ms/запрос (сборка {geo_build_s * 1000:.0f}ms), "
+              f"полный проход {near_ms:.2f} ms/запрос")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# bench_image_prep.py
+"""
+Сравнение подготовки изображений перед upload_file:
+старый путь (полное декодирование + PNG без потерь) против image_prep.prepare_image.
+
+    python bench_image_prep.py photo1.jpg screenshot.png ...
+    python bench_image_prep.py            # синтетические образцы
+"""
+import argparse
+import random
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from image_prep import MAX_UPLOAD_PIXELS, prepare_image
+
+
+def legacy_prepare(raw: bytes) -> int:
+    img = Image.open(BytesIO(raw))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    out = BytesIO()
+    img.save(out, format="PNG")
+    return out.tell()
+
+
+def synthetic_samples():
+    rnd = random.Random(42)
+
+    # Фото с телефона: 12 Мп, шум + градиент, EXIF
+    photo = Image.radial_gradient("L").resize((4032, 3024)).convert("RGB")
+    noise = Image.effect_noise((4032, 3024), 40).convert("RGB")
+    photo = Image.blend(photo, noise, 0.35)
+    exif = Image.Exif()
+    exif[0x0112] = 1
+    exif[0x010F] = "Phone"
+    buf = BytesIO()
+    photo.save(buf, format="JPEG", quality=92, exif=exif)
+    yield "photo_4032x3024.jpg", buf.getvalue()
+
+    # Скриншот dobro.ru: светлый фон, много текста
+    shot = Image.new("RGB", (1170, 2532), (250, 250, 250))
+    draw = ImageDraw.Draw(shot)
+    for y in range(40, 2500, 28):
+        line = "".join(rnd.choice("абвгдежзиклмнопрстуфхцч 0123456789") for _ in range(70))
+        draw.text((30, y), line, fill=(30, 30, 30))
+    buf = BytesIO()
+    shot.save(buf, format="PNG")
+    yield "screenshot_1170x2532.png", buf.getvalue()
+
+    # Небольшая фотография сертификата
+    small = photo.resize((1024, 768))
+    buf = BytesIO()
+    small.save(buf, format="JPEG", quality=85)
+    yield "small_1024x768.jpg", buf.getvalue()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("files", nargs="*", help="изображения для замера")
+    ap.add_argument("--max-pixels", type=int, default=MAX_UPLOAD_PIXELS, help="бюджет площади в пикселях")
+    ap.add_argument("--quality", type=int, default=85)
+    ap.add_argument("--format", default="JPEG", choices=["JPEG", "WEBP"])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    if args.files:
+        samples = [(Path(p).name, Path(p).read_bytes()) for p in args.files]
+    else:
+        samples = list(synthetic_samples())
+
+    print(f"{'файл':28} {'исходник':>10} {'PNG(старый)':>12} {'ms':>7} {'новый':>10} {'ms':>7}  результат")
+    total_src = total_legacy = total_new = 0
+    for name, raw in samples:
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            legacy_bytes = legacy_prepare(raw)
+        legacy_ms = (time.perf_counter() - t0) * 1000 / args.repeat
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            out, _, stats = prepare_image(
+                raw, max_pixels=args.max_pixels, quality=args.quality, image_format=args.format
+            )
+        new_ms = (time.perf_counter() - t0) * 1000 / args.repeat
+
+        total_src += len(raw)
+        total_legacy += legacy_bytes
+        total_new += stats["out_bytes"]
+        result = f"{stats['out_format']} {stats['out_size'][0]}x{stats['out_size'][1]}"
+        if stats["passthrough"]:
+            result += " (как есть)"
+        print(f"{name[:28]:28} {len(raw):>10} {legacy_bytes:>12} {legacy_ms:>7.0f} "
+              f"{stats['out_bytes']:>10} {new_ms:>7.0f}  {result}")
+
+    print(f"{'ИТОГО':28} {total_src:>10} {total_legacy:>12} {'':>7} {total_new:>10}")
+    if total_legacy:
+        print(f"Объём загрузки: {total_new / total_legacy:.1%} от старого пути")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# bench_prescreen.py
+"""
+Точность локальной предпроверки (prescreen.py) на размеченном наборе —
+том же, что у bench_vision.py: каталог с картинками и labels.json
+({"файл": {"is_volunteer_proof": true|false}, ...}). Сеть не нужна.
+
+    python bench_prescreen.py data/vision_labelled
+    python bench_prescreen.py data/vision_labelled --reject-threshold 0.15 --ocr
+
+Главная метрика — точность отказов: каждое подтверждение, отклонённое
+без модели, — потерянные очки пользователя. Таблица по порогам помогает
+выбрать prescreen_reject_threshold для cfg.json.
+"""
+import argparse
+import statistics
+import sys
+from pathlib import Path
+
+from bench_vision import load_set, percentile
+from prescreen import (ACCEPT_THRESHOLD, CANDIDATE, MAX_ASPECT, REFS_PATH, REJECT, REJECT_THRESHOLD, ReferenceLayouts,
+                       prescreen)
+
+SWEEP = [0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5]
+
+
+def ratio(part: int, whole: int) -> str:
+    return f"{part / whole:.1%} ({part}/{whole})" if whole else "—"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("dataset", help="каталог с изображениями и labels.json")
+    ap.add_argument("--reject-threshold", type=float, default=REJECT_THRESHOLD)
+    ap.add_argument("--accept-threshold", type=float, default=ACCEPT_THRESHOLD)
+    ap.add_argument("--refs", default=REFS_PATH, help="эталонные скриншоты (prescreen.py --add-ref)")
+    ap.add_argument("--ocr", action="store_true")
+    args = ap.parse_args()
+
+    samples = [s for s in load_set(Path(args.dataset)) if s["label"] is not None]
+    if not samples:
+        print("Нет размеченных изображений", file=sys.stderr)
+        return 1
+    refs = ReferenceLayouts(args.refs)
+
+    rows = []
+    print(f"{'файл':32} {'разметка':>8} {'решение':>9} {'оценка':>7} {'ms':>6}  причины")
+    for sample in samples:
+        res = prescreen(sample["raw"], reject_threshold=args.reject_threshold,
+                        accept_threshold=args.accept_threshold, refs=refs, ocr=args.ocr)
+        proof = bool(sample["label"].get("is_volunteer_proof"))
+        rows.append((proof, res))
+        flag = "  <-- отклонено подтверждение" if proof and res.decision == REJECT else ""
+        print(f"{sample['name'][:32]:32} {'да' if proof else 'нет':>8} {res.decision:>9} {res.score:>7.2f} "
+              f"{res.ms:>6.0f}  {'; '.join(res.reasons)[:80]}{flag}")
+
+    proofs = sum(proof for proof, _ in rows)
+    others = len(rows) - proofs
+    rejected = [proof for proof, res in rows if res.decision == REJECT]
+    candidates = [proof for proof, res in rows if res.decision == CANDIDATE]
+    ms = [res.ms for _, res in rows]
+
+    print(f"\nнабор: {len(rows)} изображений, подтверждений {proofs}, остальных {others}")
+    print(f"порог отказа {args.reject_threshold:.2f}, порог кандидата {args.accept_threshold:.2f}, "
+          f"эталонов {len(refs.refs)}, OCR {'да' if args.ocr else 'нет'}")
+    print(f"отказы:     точность {ratio(rejected.count(False), len(rejected))}, "
+          f"отсеяно не-подтверждений {ratio(rejected.count(False), others)}, "
+          f"ошибочно отклонено подтверждений {ratio(rejected.count(True), proofs)}")
+    print(f"кандидаты:  точность {ratio(candidates.count(True), len(candidates))}, "
+          f"охват подтверждений {ratio(candidates.count(True), proofs)}")
+    print(f"запросов к модели сэкономлено: {ratio(len(rejected), len(rows))}; "
+          f"время предпроверки: среднее {statistics.mean(ms):.0f} ms, p95 {percentile(ms, 0.95):.0f} ms")
+
+    print(f"\n{'порог':>6} {'отказов':>8} {'точность':>10} {'полнота':>9} {'ложных':>7}")
+    for threshold in SWEEP:
+        # Жёсткие отказы (размер, пропорции без текста, пустое изображение) идут с оценкой 0
+        # и отсекаются при любом пороге; вытянутые изображения с текстом по оценке не отклоняются
+        rej = [proof for proof, res in rows
+               if (res.decision == REJECT and res.score == 0)
+               or (res.score < threshold and res.features.get("aspect", 0) <= MAX_ASPECT)]
+        precision = rej.count(False) / len(rej) if rej else 1.0
+        recall = rej.count(False) / others if others else 0.0
+        print(f"{threshold:>6.2f} {len(rej):>8} {precision:>10.1%} {recall:>9.1%} {rej.count(True):>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
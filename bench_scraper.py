@@ -0,0 +1,204 @@
+# bench_scraper.py
+"""
+Офлайн-замер разбора страниц dobro_scraper на корпусе сохранённых HTML
+(fixtures/scraper): лента, карточки, Яндекс.Карты и строки с датами.
+Браузер и сеть не нужны.
+
+    python bench_scraper.py                  # скорость, время по функциям, пик памяти
+    python bench_scraper.py --check          # сверить результаты с golden.json
+    python bench_scraper.py --update-golden  # перезаписать golden.json
+    python bench_scraper.py --record 20      # снять свежий корпус с сайта (нужен Chrome)
+"""
+import argparse
+import functools
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import dobro_scraper as ds
+from city_resolver import GAZETTEER_CSV, CityResolver
+
+CORPUS_DIR = "fixtures/scraper"
+TIMED_FUNCTIONS = [
+    "extract_from_detail",
+    "collect_detail_links_from_feed",
+    "read_city_from_yamaps_html",
+    "ru_date_to_iso",
+    "ru_date_range_to_iso",
+    "extract_times",
+]
+
+
+class FrozenDatetime(datetime):
+    """Даты без года парсер дополняет текущим годом — для golden.json «сегодня» фиксировано."""
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 11, 1, tzinfo=tz)
+
+
+def load_corpus(root: Path) -> dict:
+    feed = {p.name: p.read_text(encoding="utf-8") for p in sorted((root / "feed").glob("*.html"))}
+    detail = ds.load_saved_pages(str(root / "detail"))
+    maps = {p.name: p.read_text(encoding="utf-8") for p in sorted((root / "maps").glob("*.html"))}
+    dates_file = root / "dates.txt"
+    dates = dates_file.read_text(encoding="utf-8").splitlines() if dates_file.exists() else []
+    return {"feed": feed, "detail": detail, "maps": maps, "dates": [d for d in dates if d.strip()]}
+
+
+def run_corpus(corpus: dict) -> dict:
+    """Один проход по корпусу; результат — то, что сравнивается с golden.json."""
+    return {
+        "feed": {name: ds.collect_detail_links_from_feed(html) for name, html in corpus["feed"].items()},
+        "detail": {url: ds.extract_from_detail(html, url) for url, html in corpus["detail"].items()},
+        "maps": {name: ds.read_city_from_yamaps_html(html) for name, html in corpus["maps"].items()},
+        "dates": {
+            text: {
+                "date": ds.ru_date_to_iso(text),
+                "range": list(ds.ru_date_range_to_iso(text)),
+                "times": list(ds.extract_times(text)),
+            }
+            for text in corpus["dates"]
+        },
+    }
+
+
+def timed_pass(corpus: dict) -> dict:
+    """Проход с обёртками вокруг TIMED_FUNCTIONS: вложенные вызовы тоже учитываются."""
+    stats = defaultdict(lambda: [0, 0.0])
+    originals = {name: getattr(ds, name) for name in TIMED_FUNCTIONS}
+
+    def wrap(name, fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                s = stats[name]
+                s[0] += 1
+                s[1] += time.perf_counter() - t0
+        return inner
+
+    for name, fn in originals.items():
+        setattr(ds, name, wrap(name, fn))
+    try:
+        run_corpus(corpus)
+    finally:
+        for name, fn in originals.items():
+            setattr(ds, name, fn)
+    return stats
+
+
+def diff_golden(expected: dict, actual: dict) -> list:
+    problems = []
+    for section in sorted(set(expected) | set(actual)):
+        exp, act = expected.get(section, {}), actual.get(section, {})
+        for key in sorted(set(exp) | set(act)):
+            if key not in act:
+                problems.append(f"{section}/{key}: нет в корпусе")
+            elif key not in exp:
+                problems.append(f"{section}/{key}: нет в golden.json")
+            elif exp[key] != act[key]:
+                if isinstance(exp[key], dict) and isinstance(act[key], dict):
+                    fields = sorted(k for k in set(exp[key]) | set(act[key]) if exp[key].get(k) != act[key].get(k))
+                    for f in fields:
+                        problems.append(f"{section}/{key}.{f}: {exp[key].get(f)!r} -> {act[key].get(f)!r}")
+                else:
+                    problems.append(f"{section}/{key}: {exp[key]!r} -> {act[key]!r}")
+    return problems
+
+
+def record_corpus(root: Path, limit: int):
+    """Сохраняет ленту и первые limit карточек в том виде, в каком их видит парсер."""
+    ds.setup_logging("a")
+    (root / "feed").mkdir(parents=True, exist_ok=True)
+    (root / "detail").mkdir(parents=True, exist_ok=True)
+    drv = ds.driver_build("off")
+    try:
+        drv.get(ds.BASE_URL)
+        ds.wait_ready(drv, 60)
+        html = drv.page_source or ""
+        (root / "feed" / "volunteers.html").write_text(html, encoding="utf-8")
+        for url in ds.collect_detail_links_from_feed(html)[:limit]:
+            drv.get(url)
+            ds.wait_ready(drv, 45)
+            ds.expand_description(drv)
+            (root / "detail" / f"{ds.event_id(url)}.html").write_text(drv.page_source or "", encoding="utf-8")
+            print(f"сохранено: {url}")
+    finally:
+        drv.quit()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default=CORPUS_DIR, help="каталог корпуса (feed/, detail/, maps/, dates.txt)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--check", action="store_true", help="сверить результаты с golden.json и выйти")
+    ap.add_argument("--update-golden", action="store_true", help="перезаписать golden.json текущими результатами")
+    ap.add_argument("--record", type=int, metavar="N", help="снять с сайта ленту и N карточек в корпус")
+    args = ap.parse_args()
+
+    root = Path(args.corpus)
+    if args.record:
+        record_corpus(root, args.record)
+        return 0
+
+    # Кэш городов в памяти: замер не должен зависеть от data/city_cache.db
+    ds._city_resolver = CityResolver(GAZETTEER_CSV, ":memory:")
+    ds.datetime = FrozenDatetime
+    corpus = load_corpus(root)
+    golden_path = root / "golden.json"
+
+    actual = run_corpus(corpus)
+    if args.update_golden:
+        golden_path.write_text(json.dumps(actual, ensure_ascii=False, indent=1, sort_keys=True) + "\n",
+                               encoding="utf-8")
+        print(f"Записано: {golden_path}")
+        return 0
+    if args.check:
+        expected = json.loads(golden_path.read_text(encoding="utf-8"))
+        problems = diff_golden(expected, json.loads(json.dumps(actual)))
+        for p in problems:
+            print(p)
+        print("golden: OK" if not problems else f"golden: расхождений {len(problems)}")
+        return 1 if problems else 0
+
+    n_detail = len(corpus["detail"])
+    detail_bytes = sum(len(h.encode("utf-8")) for h in corpus["detail"].values())
+    print(f"Корпус: лента {len(corpus['feed'])}, карточек {n_detail} ({detail_bytes / 1024:.0f} КБ), "
+          f"карт {len(corpus['maps'])}, строк с датами {len(corpus['dates'])}")
+
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        for url, html in corpus["detail"].items():
+            ds.extract_from_detail(html, url)
+    detail_s = (time.perf_counter() - t0) / args.repeat
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        run_corpus(corpus)
+    total_s = (time.perf_counter() - t0) / args.repeat
+    print(f"Карточки: {n_detail / detail_s:.1f} записей/с ({detail_s / n_detail * 1000:.1f} ms на карточку)")
+    print(f"Весь корпус: {total_s * 1000:.0f} ms за проход")
+
+    stats = timed_pass(corpus)
+    print(f"\n{'функция':32} {'вызовов':>8} {'всего ms':>10} {'ms/вызов':>10}")
+    for name in TIMED_FUNCTIONS:
+        calls, total = stats.get(name, (0, 0.0))
+        per_call = total / calls * 1000 if calls else 0.0
+        print(f"{name:32} {calls:>8} {total * 1000:>10.1f} {per_call:>10.3f}")
+
+    tracemalloc.start()
+    run_corpus(corpus)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"\nПик памяти за проход: {peak / 1024 / 1024:.1f} МБ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
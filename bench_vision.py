@@ -0,0 +1,168 @@
+# bench_vision.py
+"""
+Проверка документов: двухшаговый путь (описание → классификатор) против
+однопроходного (изображение → сразу JSON-вердикт) на размеченном наборе.
+
+Набор — каталог с картинками и labels.json:
+
+    {"dobro_18h.png": {"is_volunteer_proof": true, "hours": 18},
+     "meme.jpg": {"is_volunteer_proof": false}}
+
+    python bench_vision.py data/vision_labelled
+    python bench_vision.py data/vision_labelled --repeat 2 --json bench_vision.json
+
+Для каждого изображения оба режима запускаются по очереди (порядок чередуется),
+кэш вердиктов не используется. Печатаются задержки (среднее, p50, p95),
+точность по разметке, согласие режимов между собой и доля откатов
+однопроходного режима на двухшаговый путь. Нужны ключи GigaChat из cfg.json.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from vision import CLASSIFIER_PROMPT, ClassifierLlm
+
+MODES = ("two_step", "single_pass")
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def load_set(root: Path) -> List[Dict]:
+    labels_path = root / "labels.json"
+    labels = json.loads(labels_path.read_text(encoding="utf-8")) if labels_path.exists() else {}
+    samples = []
+    for path in sorted(root.iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTS:
+            continue
+        samples.append({"name": path.name, "raw": path.read_bytes(), "label": labels.get(path.name)})
+    missing = [s["name"] for s in samples if s["label"] is None]
+    if missing:
+        print(f"без разметки ({len(missing)}): {', '.join(missing[:5])}{' …' if len(missing) > 5 else ''}",
+              file=sys.stderr)
+    return samples
+
+
+def run_mode(clf: ClassifierLlm, mode: str, raw: bytes) -> Dict:
+    t0 = time.perf_counter()
+    try:
+        if mode == "single_pass":
+            result = clf._check_single_pass(raw, CLASSIFIER_PROMPT)
+        else:
+            result = clf._check_two_step(raw, CLASSIFIER_PROMPT)
+    except Exception as e:
+        return {"seconds": time.perf_counter() - t0, "error": f"{type(e).__name__}: {e}"}
+    verdict = result["classification"]
+    return {
+        "seconds": time.perf_counter() - t0,
+        "mode": result.get("mode", mode),
+        "proof": bool(verdict.get("is_volunteer_proof")),
+        "hours": verdict.get("hours", 0),
+        "category": verdict.get("category"),
+    }
+
+
+def hours_equal(a, b) -> bool:
+    try:
+        return abs(float(a or 0) - float(b or 0)) < 1e-6
+    except (TypeError, ValueError):
+        return False
+
+
+def correct(run: Dict, label: Optional[Dict]) -> Optional[bool]:
+    if label is None or "error" in run:
+        return None
+    if run["proof"] != bool(label.get("is_volunteer_proof")):
+        return False
+    # Часы сверяем, только если они размечены и документ засчитан
+    if run["proof"] and "hours" in label:
+        return hours_equal(run["hours"], label["hours"])
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("dataset", help="каталог с изображениями и labels.json")
+    ap.add_argument("--repeat", type=int, default=1, help="прогонов на изображение")
+    ap.add_argument("--json", help="сохранить результаты по каждому изображению")
+    args = ap.parse_args()
+
+    samples = load_set(Path(args.dataset))
+    if not samples:
+        print("В каталоге нет изображений", file=sys.stderr)
+        return 1
+    clf = ClassifierLlm(cache_path=":memory:")
+
+    rows = []
+    print(f"{'файл':28} {'разметка':>9} | {'2 шага':>14} {'s':>6} | {'1 проход':>14} {'s':>6}  согласие")
+    for i, sample in enumerate(samples):
+        for r in range(args.repeat):
+            # Чередуем порядок, чтобы прогрев соединения не доставался одному режиму
+            order = MODES if (i + r) % 2 == 0 else MODES[::-1]
+            runs = {mode: run_mode(clf, mode, sample["raw"]) for mode in order}
+            row = {"name": sample["name"], "label": sample["label"], **runs}
+            ok = [runs[m] for m in MODES if "error" not in runs[m]]
+            row["agree"] = (
+                len(ok) == 2 and ok[0]["proof"] == ok[1]["proof"] and hours_equal(ok[0]["hours"], ok[1]["hours"])
+            )
+            rows.append(row)
+
+            def cell(run):
+                if "error" in run:
+                    return "ошибка"
+                tag = "да" if run["proof"] else "нет"
+                tag += f" {run['hours']}ч"
+                if run.get("mode") == "fallback":
+                    tag += " (откат)"
+                return tag
+
+            label = sample["label"]
+            label_text = "-" if label is None else ("да" if label.get("is_volunteer_proof") else "нет")
+            print(f"{sample['name'][:28]:28} {label_text:>9} | {cell(runs['two_step']):>14} "
+                  f"{runs['two_step']['seconds']:>6.2f} | {cell(runs['single_pass']):>14} "
+                  f"{runs['single_pass']['seconds']:>6.2f}  {'да' if row['agree'] else 'НЕТ'}")
+
+    print()
+    for mode in MODES:
+        runs = [row[mode] for row in rows]
+        seconds = [run["seconds"] for run in runs if "error" not in run]
+        errors = sum("error" in run for run in runs)
+        marks = [correct(row[mode], row["label"]) for row in rows]
+        marks = [m for m in marks if m is not None]
+        line = (f"{mode:12} среднее {statistics.mean(seconds) if seconds else 0:6.2f}s  "
+                f"p50 {percentile(seconds, 0.5):6.2f}s  p95 {percentile(seconds, 0.95):6.2f}s  ошибок {errors}")
+        if marks:
+            line += f"  точность {sum(marks) / len(marks):.1%} ({sum(marks)}/{len(marks)})"
+        if mode == "single_pass":
+            fallbacks = sum(run.get("mode") == "fallback" for run in runs)
+            line += f"  откатов {fallbacks}/{len(runs)}"
+        print(line)
+
+    both = [row for row in rows if "error" not in row["two_step"] and "error" not in row["single_pass"]]
+    if both:
+        agree = sum(row["agree"] for row in both)
+        proof_agree = sum(row["two_step"]["proof"] == row["single_pass"]["proof"] for row in both)
+        print(f"согласие режимов: вердикт {proof_agree / len(both):.1%}, вердикт и часы {agree / len(both):.1%}")
+        speedup = (statistics.mean(r["two_step"]["seconds"] for r in both)
+                   / statistics.mean(r["single_pass"]["seconds"] for r in both))
+        print(f"ускорение однопроходного режима: ×{speedup:.2f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
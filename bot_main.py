@@ -7,11 +7,16 @@ import sys
 import time
 import urllib3
 import faulthandler
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from aiomax import fsm
 # from aiomax.fsm import FSMStorage
 # from aiomax import WebAppInfo
 
 from fsm_file_storage import FSMFileStorage
+from leaderboard import Leaderboard
+from verify_queue import MAX_ATTEMPTS, VERIFY_QUEUE_DB, Job, PermanentError, VerifyQueue, VerifyWorkers
 
 # Создаём постоянное хранилище
 
@@ -64,6 +69,93 @@ async def invoke_with_timeout(agent_obj: Agent, text: str, config: dict, timeout
         faulthandler.cancel_dump_traceback_later()
 
 
+def _verify_job(job: Job) -> dict:
+    """
+    Проверка одного задания очереди; выполняется в пуле vision_executor.
+    Вложения бота скачиваются по ссылке, загрузки мини-приложения берутся
+    из памяти (если их положил этот же процесс) или из uploads/.
+    """
+    t0 = time.perf_counter()
+    try:
+        if job.source == "upload":
+            raw = verify_queue.take_bytes(job.id)
+            if raw is None:
+                with open(job.file_path, "rb") as f:
+                    raw = f.read()
+            return vision_llm.check_raw(raw, user_id=job.user_id)
+        return vision_llm.check_doc(file_url=job.file_url, user_id=job.user_id)
+    except FileNotFoundError as e:
+        raise PermanentError(f"Файл загрузки не найден: {e.filename}")
+    except RuntimeError as e:
+        # Сетевой сбой при скачивании стоит повторить, остальное (не картинка,
+        # слишком большой файл, модерация) повтор не исправит
+        if isinstance(e.__cause__, requests.RequestException):
+            raise
+        raise PermanentError(str(e)) from e
+    finally:
+        logging.info("check_doc #%d: %.2fs (%s)", job.id, time.perf_counter() - t0, job.file_url or job.file_path)
+
+
+async def deliver_verdict(job: Job, info: Optional[dict], error: Optional[str]):
+    """
+    Начисляет очки по результату проверки и присылает его пользователю.
+    Повторная отправка (сбой сети, перезапуск) берёт сохранённый текст и очки не начисляет.
+    """
+    meta = job.meta
+    if meta.get("chat_id") is not None:
+        target = {"chat_id": meta["chat_id"], "reply_to": meta.get("message_id")}
+    else:
+        target = {"user_id": int(job.user_id)}
+
+    if info is None:
+        await bot.send_message(
+            f"❌ Не удалось проверить документ: {error}\nПопробуйте отправить его ещё раз.", **target
+        )
+        return
+
+    text = job.reply
+    if text is None:
+        text = _settle_verdict(job, info)
+        await asyncio.to_thread(verify_queue.set_reply, job.id, text)
+        job.reply = text
+    await bot.send_message(text, **target)
+
+
+def _settle_verdict(job: Job, info: dict) -> str:
+    """Начисляет очки за проверенный документ и возвращает текст ответа."""
+    meta = job.meta
+    # Данные читаем уже после проверки: пока она шла, пользователь мог отправить другие файлы
+    cursor = fsm.FSMCursor(fsm_storage, int(job.user_id))
+    current_data = cursor.get_data() or {}
+    uploaded_files = current_data.get("uploaded_files", [])
+    score = current_data.get("score", 0)
+    name = meta.get("name") or current_data.get("name")
+    file_ref = job.file_url or job.file_path
+
+    logging.info("Проверка #%d: %s", job.id, info["classification"])
+    duplicate = info.get("duplicate") or {}
+    if duplicate.get("similar_users"):
+        logging.warning("Похожий документ уже присылали: %s (пользователь %s, ранее %s)",
+                        file_ref, job.user_id, duplicate["similar_users"])
+
+    # Документ засчитывается только здесь, вместе с начислением очков: отказ
+    # не блокирует повторную отправку, а текст ответа сохраняется до отправки
+    if info["classification"]['is_volunteer_proof'] == True and (
+        duplicate.get("already_sent") or duplicate.get("other_users")
+        or not vision_llm.record_submission(info, job.user_id)
+    ):
+        text = f"❌ Этот документ уже был засчитан ранее, повторно очки не начисляются.\nВолонтерских очков: {score}"
+    elif info["classification"]['is_volunteer_proof'] == True:
+        uploaded_files.append(file_ref)
+        score += (1+info["classification"]["hours"])
+        cursor.change_data({"uploaded_files": uploaded_files, "score": score, "name": name})
+        leaderboard.update(int(job.user_id), score, name=name)
+        text = f"✅ Документ успешно сохранён в вашем профиле!\nНачислено очков: {info["classification"]["hours"]}\nТеперь у вас всего очков: {score}"
+    else:
+        text = f"❌ Документ не прошел проверку!\nПричина: {' '.join(info["classification"]["reasons"])}\nВолонтерских очков: {score}"
+    return text
+
+
 def _ensure_text(x) -> str:
     if isinstance(x, str):
         return x
@@ -76,14 +168,38 @@ def _ensure_text(x) -> str:
 with open("cfg.json", "r", encoding="utf-8") as f:
     data = json.load(f)
 TOKEN = data["Token_MAX"]
+VISION_WORKERS = data.get("vision_workers", 4)
+VISION_TIMEOUT = data.get("vision_timeout", 90.0)
+
+vision_executor = ThreadPoolExecutor(max_workers=VISION_WORKERS, thread_name_prefix="vision")
+# Общая с мини-приложением очередь: оно только ставит загрузки, проверяет и отвечает бот
+verify_queue = VerifyQueue(
+    data.get("verify_queue_path", VERIFY_QUEUE_DB),
+    max_attempts=data.get("verify_max_attempts", MAX_ATTEMPTS),
+)
 
 bot = aiomax.Bot(TOKEN, default_format="markdown")
 fsm_storage = FSMFileStorage("fsm_data.json")
 bot.storage = fsm_storage
+leaderboard = Leaderboard.from_storage(fsm_storage)
 
 agent = Agent()
 
+verify_workers = VerifyWorkers(
+    verify_queue,
+    _verify_job,
+    deliver_verdict,
+    workers=VISION_WORKERS,
+    timeout=VISION_TIMEOUT,
+    poll=data.get("verify_poll_seconds", 2.0),
+    executor=vision_executor,
+)
+
 
+@bot.on_ready()
+async def on_ready():
+    await verify_workers.start()
+    logging.info("Очередь проверки: %s", await asyncio.to_thread(verify_queue.counts))
 
 
 @bot.on_bot_start()
@@ -109,7 +225,9 @@ async def on_start(pd: aiomax.BotStartPayload):
     await pd.send(
         "Или просто отправь мне картинкой/документом своё доброе достижение и я засчитаю тебе это в рейтинг!\n"
         "Команда /files позволит просмотреть загруженные достижения\n"
-        "Команда /score - узнать своё количество очков"
+        "Команда /score - узнать своё количество очков\n"
+        "Команда /checks - статус проверки отправленных документов\n"
+        "Команда /top - посмотреть рейтинг волонтёров"
         )
 
 
@@ -132,34 +250,62 @@ async def on_message(message: aiomax.Message, cursor: fsm.FSMCursor):
     if message.content == "/score":
         data = cursor.get_data() or {}
         score = data.get("score", 0)
-        await message.reply(f"Ваше количество очков: {score}")
+        rank = leaderboard.rank(message.sender.user_id)
+        if rank is None:
+            await message.reply(f"Ваше количество очков: {score}")
+        else:
+            await message.reply(f"Ваше количество очков: {score}\nМесто в рейтинге: {rank} из {len(leaderboard)}")
+        return
+
+    if message.content == "/checks":
+        jobs = await asyncio.to_thread(verify_queue.user_jobs, user_id, limit=10)
+        if not jobs:
+            await message.reply("Вы пока не отправляли документов на проверку.")
+            return
+        labels = {"queued": "⏳ в очереди", "running": "🔍 проверяется",
+                  "verified": "📨 проверен, отправляем результат", "done": "✅ проверен", "failed": "❌ ошибка"}
+        lines = [
+            f"#{job.id} {time.strftime('%d.%m %H:%M', time.localtime(job.created_at))} — {labels[job.status]}"
+            for job in jobs
+        ]
+        await message.reply("Ваши проверки:\n" + "\n".join(lines))
+        return
+
+    if message.content == "/top":
+        top = leaderboard.top(10)
+        if not top:
+            await message.reply("Рейтинг пока пуст. Отправьте своё первое доброе достижение!")
+            return
+        lines = [f"{row['rank']}. {row['name'] or 'Волонтёр'} — {row['score']}" for row in top]
+        rank = leaderboard.rank(message.sender.user_id)
+        if rank is not None and rank > len(top):
+            lines.append(f"…\nВаше место: {rank}")
+        await message.reply("🏆 Топ волонтёров:\n" + "\n".join(lines))
         return
 
     if message.body.attachments:
         try:
             
             for doc in message.body.attachments:
-                current_data = cursor.get_data() or {}
-                uploaded_files = current_data.get("uploaded_files", [])
-                score = current_data.get("score", 0)
                 print(type(doc))
                 if type(doc) != aiomax.types.FileAttachment and type(doc) != aiomax.types.PhotoAttachment:
                     await message.reply("❌ Не удалось сохранить файл. Допустимы только фото и файлы.", attachments=doc)
                     continue
                 
-                file_url = doc.url
-                msg_first = await message.send("Обрабатываю ваш запрос...", attachments=doc)
-                info = vision_llm.check_doc(file_url=file_url)
-                await msg_first.delete()
-                print(info["classification"])
-                
-                if info["classification"]['is_volunteer_proof'] == True:
-                    uploaded_files.append(file_url)
-                    score += (1+info["classification"]["hours"])
-                    cursor.change_data({"uploaded_files": uploaded_files,"score": score})
-                    await message.reply(f"✅ Документ успешно сохранён в вашем профиле!\nНачислено очков: {info["classification"]["hours"]}\nТеперь у вас всего очков: {score}", attachments=doc)
-                else:
-                    await message.reply(f"❌ Документ не прошел проверку!\nПричина: {' '.join(info["classification"]["reasons"])}\nВолонтерских очков: {score}", attachments=doc)
+                # Проверка идёт в фоне: обработчик сразу свободен, результат придёт ответом на это сообщение
+                job_id = await asyncio.to_thread(
+                    verify_queue.enqueue,
+                    user_id,
+                    source="bot",
+                    file_url=doc.url,
+                    meta={
+                        "chat_id": message.recipient.chat_id,
+                        "message_id": message.body.message_id,
+                        "name": message.sender.first_name,
+                    },
+                )
+                verify_workers.notify()
+                await message.reply(f"⏳ Документ принят на проверку (#{job_id}). Пришлю результат, как только он будет готов.")
 
         except Exception as e:
             logging.exception("Ошибка при обработке вложения")
@@ -0,0 +1,291 @@
+# build_assets.py
+"""
+Сборка статики мини-приложения: index.html + miniapp_data/ → dist/.
+
+    python build_assets.py                  # собрать в dist/
+    python build_assets.py --out /tmp/dist --no-avif
+
+- маскот: варианты 1x/2x по ширине показа в AVIF, WebP и PNG, <picture> с srcset;
+- иконки категорий: спрайт 1x/2x в тех же форматах, его CSS встраивается в index.html;
+- в имени каждого файла из assets/ — хэш содержимого, список файлов — в dist/manifest.json;
+- текстовые файлы сжимаются заранее (.gz, и .br при установленном пакете brotli).
+
+miniApp.py отдаёт результат через static_assets.StaticAssets.
+"""
+import argparse
+import gzip
+import html
+import json
+import logging
+import re
+import shutil
+import sys
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import xxhash
+from PIL import Image, features
+
+from static_assets import DIST_DIR, MANIFEST_NAME, PRECOMPRESSED_SUFFIX
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него только .gz
+    brotli = None
+
+SOURCE_HTML = "index.html"
+SOURCE_DIR = "miniapp_data"
+
+MASCOT = "mascot.png"
+# Ширина маскота в колонке .hero на десктопе; на телефоне он во всю ширину экрана
+MASCOT_WIDTH = 440
+MASCOT_SIZES = "(max-width: 720px) calc(100vw - 80px), 440px"
+# .cat-icon — кружок 16×16
+ICON_SIZE = 16
+# Зазор между иконками в спрайте, чтобы при дробном масштабе не просвечивали соседи
+SPRITE_GAP = 2
+SCALES = (1, 2)
+# У <img> маскота теперь есть width/height (место резервируется до загрузки),
+# а max-width: 100% без height: auto исказил бы пропорции
+PICTURE_CSS = "picture img{height:auto}"
+
+WEBP_QUALITY = 82
+AVIF_QUALITY = 60
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+FORMATS = [
+    # (формат Pillow, расширение, MIME)
+    ("AVIF", "avif", "image/avif"),
+    ("WEBP", "webp", "image/webp"),
+    ("PNG", "png", "image/png"),
+]
+TEXT_TYPES = {"text/html", "text/css", "application/json"}
+
+MASCOT_IMG_RX = re.compile(r'<img src="miniapp_data/mascot\.png" alt="([^"]*)"\s*/?>')
+ICON_IMG_RX = re.compile(r'<img src="miniapp_data/categories/([\w-]+)\.png" alt="[^"]*">')
+
+log = logging.getLogger("build_assets")
+
+
+def _hash(data: bytes) -> str:
+    return xxhash.xxh3_64_hexdigest(data)
+
+
+def _resize(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    if img.size == size:
+        return img.copy()
+    # Масштабируем с предумноженной альфой: иначе по краям прозрачных областей тёмная кайма
+    return img.convert("RGBa").resize(size, Image.LANCZOS).convert("RGBA")
+
+
+def encode(img: Image.Image, fmt: str) -> bytes:
+    out = BytesIO()
+    if fmt == "AVIF":
+        img.save(out, format="AVIF", quality=AVIF_QUALITY)
+    elif fmt == "WEBP":
+        img.save(out, format="WEBP", quality=WEBP_QUALITY, method=6)
+    else:
+        img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+class Builder:
+    """Пишет файлы в out/ и собирает манифест."""
+
+    def __init__(self, out: Path, formats: List[Tuple[str, str, str]]):
+        self.out = out
+        self.formats = formats
+        self.files: Dict[str, Dict] = {}
+        (out / "assets").mkdir(parents=True, exist_ok=True)
+
+    def emit(self, name: str, data: bytes, content_type: str, *, hashed: bool = True) -> str:
+        """Сохраняет файл; hashed — хэш в имени (assets/<stem>.<hash>.<ext>) и бессрочный кэш."""
+        digest = _hash(data)
+        if hashed:
+            stem, _, ext = name.rpartition(".")
+            name = f"assets/{stem}.{digest}.{ext}"
+        (self.out / name).write_bytes(data)
+        encodings = []
+        if content_type in TEXT_TYPES:
+            variants = [("gzip", gzip.compress(data, GZIP_LEVEL, mtime=0))]
+            if brotli is not None:
+                variants.append(("br", brotli.compress(data, quality=BROTLI_QUALITY)))
+            for encoding, body in variants:
+                # Сжатая копия нужна, только если она заметно меньше
+                if len(body) < len(data) * 0.9:
+                    (self.out / (name + PRECOMPRESSED_SUFFIX[encoding])).write_bytes(body)
+                    encodings.append(encoding)
+        self.files[name] = {
+            "hash": digest,
+            "bytes": len(data),
+            "type": content_type,
+            "immutable": hashed,
+            "encodings": encodings,
+        }
+        return name
+
+    def image_variants(self, stem: str, img: Image.Image) -> List[Dict]:
+        """Все форматы одного растра; лучший формат — первым."""
+        variants = []
+        for fmt, ext, mime in self.formats:
+            data = encode(img, fmt)
+            variants.append({
+                "file": self.emit(f"{stem}.{ext}", data, mime),
+                "type": mime,
+                "width": img.width,
+                "height": img.height,
+                "bytes": len(data),
+            })
+        return variants
+
+
+def build_mascot(builder: Builder, src: Path) -> Tuple[Dict, str]:
+    """Варианты маскота и разметка <picture> (alt подставляется при переписывании HTML)."""
+    img = Image.open(src).convert("RGBA")
+    widths = sorted({min(MASCOT_WIDTH * scale, img.width) for scale in SCALES})
+    variants = []
+    for width in widths:
+        height = round(img.height * width / img.width)
+        variants += builder.image_variants(f"mascot.{width}w", _resize(img, (width, height)))
+
+    sources = []
+    for _, _, mime in builder.formats:
+        srcset = ", ".join(f"{v['file']} {v['width']}w" for v in variants if v["type"] == mime)
+        sources.append((mime, srcset))
+    fallback = [v for v in variants if v["type"] == "image/png"][0]
+    picture = "<picture>" + "".join(
+        f'<source type="{mime}" srcset="{srcset}" sizes="{MASCOT_SIZES}">' for mime, srcset in sources[:-1]
+    ) + (
+        f'<img src="{fallback["file"]}" srcset="{sources[-1][1]}" sizes="{MASCOT_SIZES}" '
+        f'width="{img.width}" height="{img.height}" alt="{{alt}}" decoding="async" fetchpriority="high">'
+        "</picture>"
+    )
+    return {"width": img.width, "height": img.height, "variants": variants}, picture
+
+
+def build_sprite(builder: Builder, icons: List[Tuple[str, Path]]) -> Tuple[Dict, str]:
+    """Спрайт иконок категорий: один столбец, 1x и 2x. Возвращает (манифест, CSS)."""
+    pitch = ICON_SIZE + SPRITE_GAP
+    sheets: Dict[str, Dict[str, str]] = {}
+    for scale in SCALES:
+        cell = ICON_SIZE * scale
+        sheet = Image.new("RGBA", (cell, pitch * scale * len(icons) - SPRITE_GAP * scale), (0, 0, 0, 0))
+        for i, (_, path) in enumerate(icons):
+            icon = Image.open(path).convert("RGBA")
+            w, h = icon.size
+            ratio = cell / max(w, h)
+            icon = _resize(icon, (max(1, round(w * ratio)), max(1, round(h * ratio))))
+            # Как object-fit: contain — по центру ячейки
+            sheet.paste(icon, ((cell - icon.width) // 2, i * pitch * scale + (cell - icon.height) // 2))
+        variants = builder.image_variants(f"categories.{scale}x", sheet)
+        sheets[f"{scale}x"] = {v["type"]: v["file"] for v in variants}
+
+    height = pitch * len(icons) - SPRITE_GAP
+    candidates = ", ".join(
+        f'url({sheets[f"{scale}x"][mime]}) type("{mime}") {scale}x'
+        for _, _, mime in builder.formats
+        for scale in SCALES
+    )
+    largest = f"{SCALES[-1]}x"
+    rules = [
+        ".cat-sprite{display:block;width:%dpx;height:%dpx;background-repeat:no-repeat;"
+        "background-size:%dpx %dpx;background-image:url(%s);background-image:image-set(%s)}"
+        % (ICON_SIZE, ICON_SIZE, ICON_SIZE, height, sheets[largest]["image/png"], candidates)
+    ]
+    positions = {}
+    for i, (slug, _) in enumerate(icons):
+        positions[slug] = {"x": 0, "y": i * pitch}
+        rules.append(".cat-sprite--%s{background-position:0 -%dpx}" % (slug, i * pitch))
+    manifest = {"cell": ICON_SIZE, "pitch": pitch, "sheets": sheets, "icons": positions}
+    return manifest, "\n".join(rules)
+
+
+def rewrite_html(source: str, picture: str, sprite_css: str, slugs: List[str]) -> str:
+    def mascot(m: re.Match) -> str:
+        return picture.replace("{alt}", m.group(1))
+
+    def icon(m: re.Match) -> str:
+        slug = m.group(1)
+        if slug not in slugs:
+            raise SystemExit(f"В index.html иконка без файла: {slug}")
+        return f'<i class="cat-sprite cat-sprite--{html.escape(slug)}" aria-hidden="true"></i>'
+
+    out, n = MASCOT_IMG_RX.subn(mascot, source)
+    if n != 1:
+        raise SystemExit("В index.html не найден <img> маскота")
+    out = ICON_IMG_RX.sub(icon, out)
+    # CSS спрайта маленький — встраиваем, чтобы не было лишнего запроса до первой отрисовки
+    return out.replace("</head>", f"<style>\n{PICTURE_CSS}\n{sprite_css}\n</style>\n</head>", 1)
+
+
+def build(src_html: Path, src_dir: Path, out: Path, *, avif: bool = True) -> Dict:
+    formats = [f for f in FORMATS if f[0] != "AVIF" or avif]
+    if avif and not features.check("avif"):
+        log.warning("Pillow собран без AVIF — варианты AVIF пропущены")
+        formats = [f for f in formats if f[0] != "AVIF"]
+
+    # Собираем рядом и подменяем каталог целиком: сервер не увидит половину сборки
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    builder = Builder(tmp, formats)
+
+    mascot, picture = build_mascot(builder, src_dir / MASCOT)
+    icons = sorted((p.stem, p) for p in (src_dir / "categories").glob("*.png"))
+    sprite, sprite_css = build_sprite(builder, icons)
+
+    page = rewrite_html(src_html.read_text(encoding="utf-8"), picture, sprite_css, [slug for slug, _ in icons])
+    builder.emit("index.html", page.encode("utf-8"), "text/html", hashed=False)
+
+    manifest = {
+        "version": _hash("".join(f"{k}:{v['hash']}" for k, v in sorted(builder.files.items())).encode("ascii")),
+        "images": {MASCOT: mascot, "categories": sprite},
+        "files": builder.files,
+    }
+    (tmp / MANIFEST_NAME).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    old = out.with_name(out.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if out.exists():
+        out.rename(old)
+    tmp.rename(out)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def report(manifest: Dict, src_dir: Path):
+    source = sum(p.stat().st_size for p in src_dir.rglob("*.png"))
+    files = manifest["files"]
+    print(f"{'файл':<48} {'байт':>8}  сжатые копии")
+    for name, info in sorted(files.items()):
+        print(f"{name:<48} {info['bytes']:>8}  {','.join(info['encodings']) or '-'}")
+
+    def first_paint(mime: str, scale: int) -> int:
+        mascot = [v for v in manifest["images"][MASCOT]["variants"] if v["type"] == mime]
+        width = min(MASCOT_WIDTH * scale, manifest["images"][MASCOT]["width"])
+        pick = next((v for v in mascot if v["width"] >= width), mascot[-1])
+        sheet = manifest["images"]["categories"]["sheets"][f"{scale}x"][mime]
+        return pick["bytes"] + files[sheet]["bytes"]
+
+    print(f"\nисходные PNG: {source} байт, версия сборки {manifest['version']}")
+    for mime in sorted({v["type"] for v in manifest["images"][MASCOT]["variants"]}):
+        print(f"картинки первого экрана, {mime:<10}: 1x {first_paint(mime, 1):>7} байт, 2x {first_paint(mime, 2):>7} байт")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+    ap = argparse.ArgumentParser(description="Сборка статики мини-приложения")
+    ap.add_argument("--html", default=SOURCE_HTML)
+    ap.add_argument("--src", default=SOURCE_DIR, help="каталог с mascot.png и categories/")
+    ap.add_argument("--out", default=DIST_DIR)
+    ap.add_argument("--no-avif", action="store_true", help="не кодировать AVIF (быстрее)")
+    args = ap.parse_args(argv)
+
+    manifest = build(Path(args.html), Path(args.src), Path(args.out), avif=not args.no_avif)
+    report(manifest, Path(args.src))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,387 @@
+# catalog.py
+import json
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time as dtime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from city_resolver import EARTH_RADIUS_KM, Gazetteer, haversine_km
+
+CATALOG_DIR = "data/catalog"
+CURRENT_POINTER = "CURRENT"
+SNAPSHOT_PREFIX = "events-"
+# Ячейка пространственного индекса: полградуса широты ≈ 55 км
+GEO_CELL_DEG = 0.5
+KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+
+log = logging.getLogger("catalog")
+
+
+def parse_hhmm(s: Optional[str] = None) -> Optional[dtime]:
+    if not s:
+        return None
+    return datetime.strptime(s.strip(), "%H:%M").time()
+
+
+def within_interval(user_start: datetime, user_end: datetime,
+                    ev_start: datetime, ev_end: datetime) -> bool:
+    # Пересечение интервалов (касание краями НЕ считается)
+    return not (user_end <= ev_start or ev_end <= user_start)
+
+
+def city_matches(user_city: Optional[str], ev_city: Optional[str],
+                 address: str, title: str, description: str) -> bool:
+    if not user_city:
+        return True
+    uc = user_city.strip().lower()
+    fields = [
+        (ev_city or "").lower(),
+        (address or "").lower(),
+        (title or "").lower(),
+        (description or "").lower(),
+    ]
+    return any(uc in f for f in fields if f)
+
+
+def event_bounds(ev: Dict) -> Optional[Tuple[datetime, datetime]]:
+    """
+    Начало первого дня и конец последнего дня события по schedule
+    (date … date_end, в каждый день с time_start до time_end);
+    None, если даты нет или она битая.
+    """
+    sch = ev.get("schedule") or {}
+    try:
+        first = datetime.strptime(sch.get("date") or "", "%Y-%m-%d").date()
+        last = datetime.strptime(sch.get("date_end") or sch.get("date"), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    try:
+        ev_ts = parse_hhmm(sch.get("time_start")) or dtime(0, 0)
+        ev_te = parse_hhmm(sch.get("time_end")) or dtime(23, 59)
+    except ValueError:
+        ev_ts, ev_te = dtime(0, 0), dtime(23, 59)
+    return datetime.combine(first, ev_ts), datetime.combine(max(first, last), ev_te)
+
+
+def occurs_within(bounds: Tuple[datetime, datetime], start: datetime, end: datetime) -> bool:
+    """
+    Идёт ли многодневное событие в окне (start, end): окно должно задеть
+    ежедневные часы хотя бы одного дня, а не просто попасть между датами.
+    """
+    ev_start, ev_end = bounds
+    if not within_interval(start, end, ev_start, ev_end):
+        return False
+    ts, te = ev_start.time(), ev_end.time()
+    first = max(ev_start.date(), start.date())
+    last = min(ev_end.date(), end.date())
+    if (last - first).days >= 2:
+        # Окно целиком покрывает хотя бы один день между first и last
+        return True
+    day = first
+    while day <= last:
+        if within_interval(start, end, datetime.combine(day, ts), datetime.combine(day, te)):
+            return True
+        day += timedelta(days=1)
+    return False
+
+
+def event_in_city(ev: Dict, city: Optional[str]) -> bool:
+    loc = ev.get("location") or {}
+    return city_matches(
+        city,
+        loc.get("city"),
+        loc.get("address_full") or "",
+        ev.get("title") or "",
+        ev.get("description") or ev.get("title"),
+    )
+
+
+def scan_events(events: List[Dict], *, city: Optional[str], start: datetime, end: datetime) -> List[Dict]:
+    """Полный проход по каталогу: события, идущие в окне (start, end) и подходящие по городу."""
+    found = []
+    for ev in events:
+        bounds = event_bounds(ev)
+        if bounds is None or not occurs_within(bounds, start, end):
+            continue
+        if event_in_city(ev, city):
+            found.append(ev)
+    return found
+
+
+class IntervalIndex:
+    """
+    Индекс событий по интервалу [начало первого дня, конец последнего дня].
+
+    Пересечение с окном (qs, qe) раскладывается на две непересекающиеся части:
+      - события, начавшиеся не позже qs и ещё идущие в qs, — запрос «протыкания»
+        к центрированному дереву интервалов;
+      - события, начавшиеся внутри (qs, qe), — бинарный поиск по отсортированным началам.
+    Обе части — O(log n + k); затем кандидаты проверяются по ежедневным часам и городу.
+    Индекс неизменяемый: при новой версии каталога строится заново.
+    """
+
+    def __init__(self, events: List[Dict]):
+        items = []
+        for ev in events:
+            bounds = event_bounds(ev)
+            if bounds is not None:
+                items.append((bounds[0], bounds[1], len(items), ev))
+        items.sort(key=lambda it: it[0])
+        self._items = items
+        self._starts = [it[0] for it in items]
+        self._root = self._build(items)
+
+    def __len__(self):
+        return len(self._items)
+
+    @classmethod
+    def _build(cls, items):
+        if not items:
+            return None
+        points = sorted({it[0] for it in items} | {it[1] for it in items})
+        center = points[len(points) // 2]
+        left, right, here = [], [], []
+        for it in items:
+            if it[1] < center:
+                left.append(it)
+            elif it[0] > center:
+                right.append(it)
+            else:
+                here.append(it)
+        by_start = sorted(here, key=lambda it: it[0])
+        by_end = sorted(here, key=lambda it: it[1], reverse=True)
+        return center, by_start, by_end, cls._build(left), cls._build(right)
+
+    def _stab(self, qs: datetime, out: list):
+        # Интервалы с start <= qs < end
+        node = self._root
+        while node is not None:
+            center, by_start, by_end, left, right = node
+            if qs < center:
+                # Все интервалы узла заканчиваются не раньше center > qs
+                for it in by_start:
+                    if it[0] > qs:
+                        break
+                    if it[1] > qs:
+                        out.append(it)
+                node = left
+            else:
+                # Все интервалы узла начинаются не позже center <= qs
+                for it in by_end:
+                    if it[1] <= qs:
+                        break
+                    out.append(it)
+                node = right
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Dict]:
+        """События, чей интервал пересекается с (start, end), в порядке начала."""
+        found = []
+        self._stab(start, found)
+        lo = bisect_right(self._starts, start)
+        hi = bisect_left(self._starts, end, lo)
+        found.extend(self._items[lo:hi])
+        found.sort(key=lambda it: (it[0], it[2]))
+        return [it[3] for it in found]
+
+    def search(self, *, city: Optional[str], start: datetime, end: datetime) -> List[Dict]:
+        """То же, что scan_events, но через индекс."""
+        return [
+            ev for ev in self.overlapping(start, end)
+            if occurs_within(event_bounds(ev), start, end) and event_in_city(ev, city)
+        ]
+
+
+def event_point(ev: Dict, gazetteer: Optional[Gazetteer] = None) -> Optional[Tuple[float, float]]:
+    """
+    Координаты события: location.lat/lon, проставленные парсером,
+    а для старых снимков — город события по справочнику.
+    """
+    loc = ev.get("location") or {}
+    if loc.get("lat") is not None and loc.get("lon") is not None:
+        return float(loc["lat"]), float(loc["lon"])
+    if gazetteer is not None and loc.get("city"):
+        city = gazetteer.lookup(loc["city"], loc.get("region") or "")
+        if city is not None:
+            return city.lat, city.lon
+    return None
+
+
+class GeoIndex:
+    """
+    Пространственный индекс событий: сетка из ячеек GEO_CELL_DEG × GEO_CELL_DEG.
+
+    Запрос «в радиусе R км от точки» просматривает только ячейки, попадающие
+    в описанный вокруг круга прямоугольник, и проверяет расстояние по
+    haversine — стоимость зависит от плотности событий рядом, а не от размера
+    каталога. События без координат в индекс не попадают.
+    Как и IntervalIndex, индекс неизменяемый и строится заново на каждую версию.
+    """
+
+    def __init__(self, events: List[Dict], gazetteer: Optional[Gazetteer] = None):
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, int, Dict]]] = {}
+        self.missing = 0
+        for seq, ev in enumerate(events):
+            point = event_point(ev, gazetteer)
+            if point is None:
+                self.missing += 1
+                continue
+            self._cells.setdefault(self._cell(*point), []).append((point[0], point[1], seq, ev))
+
+    def __len__(self):
+        return sum(len(items) for items in self._cells.values())
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / GEO_CELL_DEG), math.floor(lon / GEO_CELL_DEG)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, Dict]]:
+        """(расстояние км, событие) в радиусе radius_km, ближайшие первыми."""
+        dlat = radius_km / KM_PER_DEG
+        dlon = radius_km / (KM_PER_DEG * max(math.cos(math.radians(lat)), 0.01))
+        i0, j0 = self._cell(lat - dlat, lon - dlon)
+        i1, j1 = self._cell(lat + dlat, lon + dlon)
+        found = []
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                for ev_lat, ev_lon, seq, ev in self._cells.get((i, j), ()):
+                    km = haversine_km(lat, lon, ev_lat, ev_lon)
+                    if km <= radius_km:
+                        found.append((km, seq, ev))
+        found.sort(key=lambda it: (it[0], it[1]))
+        return [(km, ev) for km, _, ev in found]
+
+    def search(self, *, lat: float, lon: float, radius_km: float,
+               start: datetime, end: datetime) -> List[Tuple[float, Dict]]:
+        """События в радиусе, идущие в окне (start, end), ближайшие первыми."""
+        found = []
+        for km, ev in self.within(lat, lon, radius_km):
+            bounds = event_bounds(ev)
+            if bounds is not None and occurs_within(bounds, start, end):
+                found.append((km, ev))
+        return found
+
+
+def _fsync_write(path: Path, text: str):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def publish_snapshot(objects: List[Dict], directory: str = CATALOG_DIR, keep: int = 5) -> str:
+    """
+    Публикует каталог новой версией: снимок events-<время>.json пишется целиком,
+    и только потом указатель CURRENT атомарно переключается на него rename'ом.
+    Читатель видит либо старый снимок, либо новый — никогда не половину файла.
+    Старые снимки, кроме keep последних, удаляются.
+    """
+    root = Path(directory)
+    root.mkdir(parents=True, exist_ok=True)
+    # Имена сортируются по времени публикации
+    name = f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.json"
+
+    _fsync_write(root / name, json.dumps(objects, ensure_ascii=False, indent=2))
+    _fsync_write(root / CURRENT_POINTER, name + "\n")
+    log.info("Опубликован снимок каталога %s (%d событий)", name, len(objects))
+
+    snapshots = sorted(root.glob(f"{SNAPSHOT_PREFIX}*.json"))
+    for old in snapshots[:-max(keep, 1)]:
+        old.unlink(missing_ok=True)
+    return str(root / name)
+
+
+def current_snapshot(directory: str = CATALOG_DIR) -> Optional[str]:
+    """Путь к снимку, на который указывает CURRENT, или None, если публикаций ещё не было."""
+    pointer = Path(directory) / CURRENT_POINTER
+    try:
+        name = pointer.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    path = Path(directory) / name
+    return str(path) if name and path.exists() else None
+
+
+class Catalog:
+    """
+    Каталог событий в памяти процесса бота.
+
+    Источник — текущий снимок из directory (см. publish_snapshot), а пока
+    публикаций не было — fallback (data/events.json). Фоновый поток следит
+    за указателем и при смене версии загружает новый снимок целиком, после
+    чего подменяет ссылку на список; слушатели (индексы поиска) получают
+    уже готовый список. Списки событий не меняются на месте.
+    """
+
+    def __init__(self, directory: str = CATALOG_DIR, fallback: Optional[str] = None):
+        self.directory = directory
+        self.fallback = fallback
+        self.version: Optional[str] = None
+        self._events: List[Dict] = []
+        self._source: Optional[Tuple[str, int]] = None
+        self._listeners: List[Callable[[List[Dict]], None]] = []
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self.reload()
+
+    @property
+    def events(self) -> List[Dict]:
+        return self._events
+
+    def add_listener(self, callback: Callable[[List[Dict]], None]):
+        """callback(events) вызывается сразу и после каждой перезагрузки."""
+        with self._lock:
+            self._listeners.append(callback)
+            events = self._events
+        callback(events)
+
+    def _locate(self) -> Optional[Tuple[str, int]]:
+        path = current_snapshot(self.directory) or self.fallback
+        if not path:
+            return None
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self) -> bool:
+        """Перечитывает каталог, если сменилась версия; True — если данные обновились."""
+        source = self._locate()
+        if source is None or source == self._source:
+            return False
+        with open(source[0], "r", encoding="utf-8") as f:
+            events = json.load(f)
+        with self._lock:
+            self._events = events
+            self._source = source
+            self.version = os.path.basename(source[0])
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(events)
+            except Exception:
+                log.exception("Не удалось перестроить индекс каталога")
+        log.info("Каталог загружен: %s (%d событий)", self.version, len(events))
+        return True
+
+    def watch(self, interval: float = 30.0):
+        """Запускает фоновый поток, который раз в interval секунд проверяет указатель."""
+        if self._watcher is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception:
+                    log.exception("Ошибка при перезагрузке каталога")
+
+        self._watcher = threading.Thread(target=loop, name="catalog-watch", daemon=True)
+        self._watcher.start()
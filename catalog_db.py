@@ -0,0 +1,235 @@
+# catalog_db.py
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from catalog import event_bounds, occurs_within
+from categories import event_categories
+
+TS_FORMAT = "%Y-%m-%d %H:%M"
+
+# Лёгкий стеммер: FTS5 не умеет в русскую морфологию, поэтому окончания
+# отрезаются у слов запроса, а поиск идёт по префиксу («животным» → «животн*»)
+RU_ENDINGS_RX = re.compile(
+    r"(иями|ями|ами|ого|его|ому|ему|ыми|ими|ией|иях|ях|ах|ых|их|ым|им|ой|ей|ий|ый|ая|яя|ое|ее|"
+    r"ые|ие|ом|ем|ам|ям|ов|ев|ую|юю|ть|ся|а|я|ы|и|о|е|у|ю|ь)$"
+)
+WORD_RX = re.compile(r"[0-9A-Za-zА-Яа-яЁё]+")
+STOP_WORDS = {
+    "хочу", "хотел", "хотела", "могу", "можно", "нужно", "надо", "где", "как", "что", "это",
+    "для", "или", "при", "над", "под", "все", "всё", "меня", "мне", "нас", "есть", "какие",
+    "какое", "найди", "найти", "покажи", "подбери", "помоги", "пожалуйста", "завтра",
+    "сегодня", "послезавтра", "году", "года", "месяц", "неделе", "мероприятие", "мероприятия",
+}
+
+SCHEMA = """
+CREATE TABLE events (
+    id INTEGER PRIMARY KEY,
+    url TEXT,
+    title TEXT,
+    description TEXT,
+    date TEXT,
+    date_end TEXT,
+    start_ts TEXT,
+    end_ts TEXT,
+    city_key TEXT,
+    organizer TEXT,
+    haystack TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX events_date ON events(date);
+CREATE INDEX events_start ON events(start_ts);
+CREATE INDEX events_end ON events(end_ts);
+CREATE INDEX events_city ON events(city_key, start_ts);
+CREATE INDEX events_organizer ON events(organizer);
+CREATE TABLE event_categories (
+    category TEXT NOT NULL,
+    event_id INTEGER NOT NULL REFERENCES events(id),
+    PRIMARY KEY (category, event_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE events_fts USING fts5(
+    title, description,
+    content='events', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+-- Подстрока города в городе, адресе и тексте (как catalog.city_matches) — по триграммам, без полного просмотра
+CREATE VIRTUAL TABLE events_place USING fts5(
+    haystack,
+    content='events', content_rowid='id',
+    tokenize='trigram'
+);
+"""
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Текст пользователя → запрос FTS5: основы значимых слов через OR, по префиксу."""
+    terms = []
+    for word in WORD_RX.findall((text or "").lower().replace("ё", "е")):
+        if len(word) < 3 or word in STOP_WORDS:
+            continue
+        stem = RU_ENDINGS_RX.sub("", word)
+        if len(stem) < 3:
+            stem = word
+        term = f'"{stem}"*'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms) or None
+
+
+class CatalogDB:
+    """
+    Каталог событий в SQLite: B-tree индексы по дате, началу/концу, городу,
+    организатору и категориям плюс FTS5 по названию и описанию.
+
+    Поиск по городу, интервалу и словам — один SQL-запрос с ранжированием bm25.
+    Город ищется как в Agent: точное совпадение с городом события (по индексу)
+    или вхождение в адрес, название или описание.
+    База по умолчанию в памяти и пересобирается целиком при каждой новой версии
+    каталога: новая копия строится рядом, а затем подменяет старую, так что
+    запросы во время перестроения идут по прежней версии.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path != ":memory:" and os.path.exists(path):
+            self._conn = self._connect(path)
+
+    def __len__(self):
+        conn = self._conn
+        if conn is None:
+            return 0
+        with self._lock:
+            return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        return sqlite3.connect(path, check_same_thread=False)
+
+    def load(self, events: List[Dict]):
+        """Строит базу заново по списку событий (формат data/events.json)."""
+        target = self.path if self.path == ":memory:" else f"{self.path}.tmp"
+        if target != ":memory:" and os.path.exists(target):
+            os.remove(target)
+        conn = self._connect(target)
+        conn.executescript(SCHEMA)
+        rows = []
+        tags = []
+        for event_id, ev in enumerate(events, start=1):
+            bounds = event_bounds(ev)
+            loc = ev.get("location") or {}
+            org = ev.get("organizer") or {}
+            title = ev.get("title") or ""
+            description = ev.get("description") or ""
+            haystack = " | ".join(
+                f for f in (loc.get("city"), loc.get("address_full"), title, description or title) if f
+            ).lower()
+            tags.extend((name, event_id) for name in dict.fromkeys(event_categories(ev)))
+            rows.append((
+                event_id,
+                ev.get("url"),
+                # unicode61 не сводит «ё» к «е» — нормализуем сами, как и слова запроса
+                title.replace("ё", "е").replace("Ё", "Е"),
+                description.replace("ё", "е").replace("Ё", "Е"),
+                (ev.get("schedule") or {}).get("date"),
+                bounds[1].strftime("%Y-%m-%d") if bounds else None,
+                bounds[0].strftime(TS_FORMAT) if bounds else None,
+                bounds[1].strftime(TS_FORMAT) if bounds else None,
+                (loc.get("city") or "").strip().lower() or None,
+                org.get("name"),
+                haystack,
+                json.dumps(ev, ensure_ascii=False),
+            ))
+        conn.executemany(
+            "INSERT INTO events (id, url, title, description, date, date_end, start_ts, end_ts, city_key, "
+            "organizer, haystack, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.executemany("INSERT INTO event_categories (category, event_id) VALUES (?, ?)", tags)
+        conn.execute("INSERT INTO events_fts(events_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO events_place(events_place) VALUES ('rebuild')")
+        conn.execute("ANALYZE")
+        conn.commit()
+
+        if target != ":memory:":
+            conn.close()
+            with self._lock:
+                if self._conn is not None:
+                    self._conn.close()
+                os.replace(target, self.path)
+                self._conn = self._connect(self.path)
+        else:
+            with self._lock:
+                self._conn = conn
+
+    def search(
+        self,
+        *,
+        city: Optional[str] = None,
+        start: datetime,
+        end: datetime,
+        text: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        События, пересекающиеся с (start, end) и подходящие по городу.
+        С text — только совпавшие по словам, лучшие по bm25 первыми
+        (название весит больше описания); без text — по времени начала.
+        С categories — только события хотя бы одной из этих категорий.
+        Индексы отбирают события по интервалу «первый день — последний день»,
+        а ежедневные часы многодневных событий проверяются уже в Python,
+        поэтому limit применяется после этой проверки.
+        Город — подстрока города, адреса, названия или описания, как
+        у catalog.city_matches, но через триграммный индекс events_place;
+        названия короче трёх символов триграммы не покрывают — для них instr.
+        """
+        params: Dict = {"start": start.strftime(TS_FORMAT), "end": end.strftime(TS_FORMAT)}
+        where = ["e.start_ts < :end", "e.end_ts > :start"]
+        city = (city or "").strip().lower()
+        if len(city) >= 3:
+            params["place"] = '"' + city.replace('"', '""') + '"'
+            where.append("e.id IN (SELECT rowid FROM events_place WHERE events_place MATCH :place)")
+        elif city:
+            params["city"] = city
+            where.append("instr(e.haystack, :city) > 0")
+        if categories:
+            names = []
+            for i, name in enumerate(categories):
+                params[f"cat{i}"] = name
+                names.append(f":cat{i}")
+            where.append(
+                f"e.id IN (SELECT event_id FROM event_categories WHERE category IN ({', '.join(names)}))"
+            )
+
+        query = fts_query(text) if text else None
+        if query:
+            params["q"] = query
+            sql = (
+                "SELECT e.payload FROM events_fts f JOIN events e ON e.id = f.rowid "
+                f"WHERE events_fts MATCH :q AND {' AND '.join(where)} "
+                "ORDER BY bm25(events_fts, 5.0, 1.0), e.start_ts"
+            )
+        else:
+            sql = f"SELECT e.payload FROM events e WHERE {' AND '.join(where)} ORDER BY e.start_ts"
+
+        conn = self._conn
+        if conn is None:
+            return []
+        with self._lock:
+            rows = conn.execute(sql, params).fetchall()
+        found = []
+        for (payload,) in rows:
+            ev = json.loads(payload)
+            bounds = event_bounds(ev)
+            if bounds is None or not occurs_within(bounds, start, end):
+                continue
+            found.append(ev)
+            if limit is not None and len(found) >= limit:
+                break
+        return found
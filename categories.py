@@ -0,0 +1,217 @@
+# categories.py
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Категории те же, что в квизе мини-приложения (VOL_CATEGORIES в index.html);
+# slug совпадает с именем иконки в miniapp_data/categories
+OTHER = "Другое"
+MIN_SCORE = 2
+MAX_TAGS = 3
+TITLE_WEIGHT = 3
+
+
+@dataclass
+class Category:
+    name: str
+    slug: str
+    stems: List[str]
+
+
+# Основы слов: совпадение ищется с начала слова, так что «животн» ловит
+# «животные», «животным», «животных». Допустимы фрагменты регулярных выражений.
+CATEGORIES = [
+    Category("Здравоохранение и ЗОЖ", "health", [
+        "здравоохран", "здоров", "зож", "медицин", "медик", "больниц", "госпитал", "поликлиник",
+        "пациент", "врач", "донор", "донорск", "кров[ьи]", "профилактик", "диспансер", "хоспис",
+    ]),
+    Category("ЧС", "emergency", [
+        "чс(?![а-я])", "мчс", "чрезвычайн", "спасател", "пожар", "паводк", "наводнен", "эвакуац",
+        "пострадавш", "беженц", "гуманитарн", "стихийн",
+    ]),
+    Category("Ветераны и историческая память", "veterans", [
+        "ветеран", "вов(?![а-я])", "великой отечественной", "дня победы", "день победы", "бессмертн",
+        "мемориал", "воинск", "захоронен", "историческ", "памятник",
+    ]),
+    Category("Дети и молодёжь", "children", [
+        "дети", "детей", "детск", "детям", "детьми", "ребен", "ребят", "школьник", "подрост",
+        "молодеж", "сирот", "воспитанник", "юнарм", "вожат",
+    ]),
+    Category("Спорт и события", "sport", [
+        "спорт", "марафон", "забег", "турнир", "соревнован", "чемпионат", "фестивал", "форум",
+        "олимпиад", "эстафет", "матч",
+    ]),
+    Category("Животные", "animals", [
+        "животн", "приют", "собак", "кошек", "кошк", "котик", "кот(?:ы|ов|ам|ик|ят|ен)", "питомц", "хвостик",
+        "бездомн", "зоозащит", "вольер", "передержк", "лошад",
+    ]),
+    Category("Старшее поколение", "elderly", [
+        "пожил", "пенсионер", "старшего поколен", "старшее поколен", "бабушк", "дедушк",
+        "долголет", "престарел", "серебрян", "геронто",
+    ]),
+    Category("Люди с ОВЗ", "disability", [
+        "овз(?![а-я])", "инвалид", "ограниченными возможност", "особыми потребност", "слабовидящ",
+        "незряч", "слабослыш", "глух", "колясоч", "инклюзи", "аутизм", "ментальн",
+        "психо-?неврологическ", "пни(?![а-я])",
+    ]),
+    Category("Экология", "ecology", [
+        "эколог", "природ", "субботник", "уборк", "мусор", "раздельн", "вторсыр", "переработк",
+        "озеленен", "деревьев", "заповедн", "лесн", "водоем",
+    ]),
+    Category("Культура и искусство", "culture", [
+        "культур", "искусств", "музе", "театр", "концерт", "выставк", "библиотек", "творческ",
+        "художеств", "музык", "кинопоказ", "хоров",
+    ]),
+    Category("Поиск пропавших", "missing", [
+        "пропавш", "лизаалерт", "лиза ?алерт", "поисково-спасат", "поиск людей", "поисковик",
+    ]),
+    Category("Урбанистика", "urban", [
+        "урбан", "благоустр", "городской сред", "городская сред", "общественн[ыо][хем] пространств",
+        "дворов", "дворы", "навигаци",
+    ]),
+    Category("Интеллектуальная помощь", "intellectual", [
+        "pro ?bono", "консультац", "перевод", "дизайн", "маркетинг", "smm", "фотограф",
+        "видеосъем", "копирайт", "программист", "it-", "аналитик", "ведение соцсет",
+    ]),
+    Category("Права человека", "human-rights", [
+        "прав человек", "правозащит", "юрид", "правов", "дискриминац", "защит[аеуы] прав",
+    ]),
+    Category("Образование", "education", [
+        # «курс», «урок», «школ» сюда не входят: «на курсе», «возле школы» — не про образование
+        "образован", "образовательн", "обучен", "обучающ", "лекци", "мастер-класс", "просвещ",
+        "тренинг", "семинар",
+    ]),
+    Category("Коронавирус", "covid", [
+        "коронавирус", "covid", "ковид", "пандеми", "самоизоляц",
+    ]),
+    Category("Наука", "science", [
+        "наук", "научн", "исследован", "ученых", "ученые", "лаборатор", "эксперимент",
+    ]),
+    Category("Наставничество", "mentoring", [
+        "наставни", "ментор", "шефств", "тьютор", "старший друг", "старшего друга",
+    ]),
+    Category("СВО", "svo", [
+        "сво(?![а-я])", "специальной военной", "участник[аиов]* сво", "мобилизован", "военнослужащ",
+        "бойц", "фронт(?:а|у|е|ом|ов)?(?![а-я])", "маскировочн", "окопн", "#мывместе",
+    ]),
+    Category(OTHER, "other", []),
+]
+BY_NAME: Dict[str, Category] = {c.name: c for c in CATEGORIES}
+
+_RULES = [
+    (c.name, re.compile(r"(?<![0-9a-zа-я])(?:" + "|".join(c.stems) + ")"))
+    for c in CATEGORIES if c.stems
+]
+
+
+# То же, но до конца слова: вырезать названную категорию из запроса целиком
+_WORD_RULES = [
+    re.compile(r"(?<![0-9a-zа-я])(?:" + "|".join(c.stems) + r")[0-9a-zа-я-]*")
+    for c in CATEGORIES if c.stems
+]
+QUERY_WORD_RX = re.compile(r"[0-9a-zа-я#]+(?:-[0-9a-zа-я]+)*")
+# Слова запроса, которые ничего не уточняют сверх категории, города и даты
+FILLER_RX = re.compile(
+    r"(?:волонт|добровол|помо[гчщ]|помощ|мероприят|событи|акци|хоч|найд|найт|покаж|подбер|посоветуй|"
+    r"интерес|связан|сфер|направлен|категори|тематик|пожалуйст|можно|какие|какое|какой|где|"
+    r"сегодн|завтр|послезавтр|выходн|недел|месяц|январ|феврал|март|апрел|июн|июл|август|"
+    r"сентябр|октябр|ноябр|декабр)[а-я]*"
+    r"|ма[йяе]|год[ау]?|для|при|или|все|мне|меня|нас|как|что|это|есть|тем[аеуы]?|област[ьи]"
+)
+
+
+def _norm(text: Optional[str]) -> str:
+    return (text or "").lower().replace("ё", "е")
+
+
+def _scores(text: str, weight: int, scores: Dict[str, int]):
+    for name, rx in _RULES:
+        hits = len(rx.findall(text))
+        if hits:
+            scores[name] = scores.get(name, 0) + hits * weight
+
+
+def categorize(title: Optional[str], description: Optional[str] = None) -> List[str]:
+    """
+    Категории события по ключевым словам: совпадение в названии весит
+    TITLE_WEIGHT, в описании — 1. Берутся до MAX_TAGS лучших с весом
+    не меньше MIN_SCORE; если ничего не набралось — «Другое».
+    """
+    scores: Dict[str, int] = {}
+    _scores(_norm(title), TITLE_WEIGHT, scores)
+    _scores(_norm(description), 1, scores)
+    # При равном весе — в порядке CATEGORIES
+    tags = sorted((name for name, _ in _RULES if scores.get(name, 0) >= MIN_SCORE),
+                  key=lambda name: -scores[name])
+    return tags[:MAX_TAGS] or [OTHER]
+
+
+def event_categories(ev: Dict) -> List[str]:
+    """Категории, проставленные парсером, а для старых снимков — вычисленные на лету."""
+    tags = ev.get("categories")
+    if tags:
+        return tags
+    return categorize(ev.get("title"), ev.get("description"))
+
+
+def detect_categories(user_text: Optional[str]) -> List[str]:
+    """Категории, явно названные в запросе пользователя («экология в Москве»)."""
+    scores: Dict[str, int] = {}
+    _scores(_norm(user_text), 1, scores)
+    return [name for name, _ in _RULES if name in scores]
+
+
+def split_categories(user_text: Optional[str], *, ignore: Iterable[Optional[str]] = ()) -> Tuple[List[str], str]:
+    """
+    Категории из запроса и то, что в нём осталось сверх них: слова категорий,
+    служебные слова, даты и слова из ignore (город) вырезаются. Пустой
+    остаток — запрос целиком про категорию, и отбора по тегам достаточно.
+    """
+    text = _norm(user_text)
+    categories = detect_categories(text)
+    for rx in _WORD_RULES:
+        text = rx.sub(" ", text)
+    # Город в любом падеже: «Москва» → «москв…»
+    prefixes = [w[:max(4, len(w) - 2)] for v in ignore for w in QUERY_WORD_RX.findall(_norm(v)) if len(w) > 2]
+    rest = [
+        w for w in QUERY_WORD_RX.findall(text)
+        if len(w) > 2 and not FILLER_RX.fullmatch(w) and not any(w.startswith(p) for p in prefixes)
+    ]
+    return categories, " ".join(rest)
+
+
+def event_key(ev: Dict) -> str:
+    """Устойчивый ключ события между версиями каталога: URL, а без него — название и расписание."""
+    return ev.get("url") or repr((ev.get("title"), sorted((ev.get("schedule") or {}).items())))
+
+
+class CategoryIndex:
+    """
+    Обратный индекс «категория → события» по текущей версии каталога.
+    Отбор по категории — пересечение с уже найденными по городу и дате
+    событиями, без обращений к LLM. Членство хранится по event_key, а не
+    по id() словаря: id освобождённых событий старой версии переиспользуются.
+    """
+
+    def __init__(self, events: List[Dict]):
+        self._members: Dict[str, Set[str]] = {}
+        for ev in events:
+            key = event_key(ev)
+            for name in event_categories(ev):
+                self._members.setdefault(name, set()).add(key)
+
+    def counts(self) -> Dict[str, int]:
+        """Число событий по категориям в порядке CATEGORIES."""
+        return {c.name: len(self._members.get(c.name, ())) for c in CATEGORIES}
+
+    def matches(self, ev: Dict, categories: List[str]) -> bool:
+        """Попадает ли событие хотя бы в одну из categories."""
+        key = event_key(ev)
+        return any(key in self._members.get(name, ()) for name in categories)
+
+    def filter(self, events: Iterable[Dict], categories: List[str]) -> List[Dict]:
+        """События из events, попавшие хотя бы в одну из categories."""
+        members: Set[str] = set()
+        for name in categories:
+            members |= self._members.get(name, set())
+        return [ev for ev in events if event_key(ev) in members]
@@ -0,0 +1,190 @@
+# city_resolver.py
+import csv
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+GAZETTEER_CSV = "data/ru_cities.csv"
+CITY_CACHE_DB = "data/city_cache.db"
+
+# Тип населённого пункта перед названием: «г Ростов-на-Дону», «г. Химки», «пгт Сириус»
+SETTLEMENT_RX = re.compile(
+    r"^(?:г\.?\s*о\.?|городской округ|город|гор\.?|г\.?|пгт\.?|рп\.?|р\.п\.|пос\.?|п\.?|"
+    r"с\.?|село|д\.?|деревня|ст-ца|станица|аул)\s+(?P<name>[A-Za-zА-Яа-яЁё].*)$",
+    re.IGNORECASE,
+)
+# Части адреса, которые точно не город
+STREET_RX = re.compile(
+    r"^(?:ул|улица|пр-кт|проспект|пл|площадь|пер|переулок|наб|набережная|б-р|бульвар|ш|шоссе|"
+    r"проезд|пр-д|тупик|аллея|мкр|микрорайон|д|дом|к|корп|стр|зд|влд|кв)\b\.?",
+    re.IGNORECASE,
+)
+REGION_RX = re.compile(r"\b(?:обл|область|край|респ|республика|ао|автономный округ|аобл)\b", re.IGNORECASE)
+
+
+def _key(s: str) -> str:
+    return re.sub(r"\s+", " ", s.replace("ё", "е").replace("Ё", "Е")).strip(" .").lower()
+
+
+def _region_key(region: str) -> str:
+    """«Ростовская обл» и «Ростовская область» → «ростовская»; «Респ Татарстан» → «татарстан»."""
+    words = [w for w in _key(region).replace("-", " ").split() if not REGION_RX.fullmatch(w)]
+    return words[0] if words else ""
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли между двумя точками, км."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+@dataclass
+class City:
+    name: str
+    region: str
+    lat: float
+    lon: float
+    population: int
+
+
+class Gazetteer:
+    """Справочник населённых пунктов России: название → города с координатами."""
+
+    def __init__(self, path: str = GAZETTEER_CSV):
+        self.cities: List[City] = []
+        self._by_name: Dict[str, List[City]] = {}
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                city = City(
+                    name=row["name"],
+                    region=row["region"],
+                    lat=float(row["lat"]),
+                    lon=float(row["lon"]),
+                    population=int(row.get("population") or 0),
+                )
+                self.cities.append(city)
+                self._by_name.setdefault(_key(city.name), []).append(city)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def lookup(self, name: str, region: str = "") -> Optional[City]:
+        """Город по названию; при омонимах выбирает совпавший регион, иначе самый крупный."""
+        found = self._by_name.get(_key(name))
+        if not found:
+            return None
+        if region:
+            rkey = _region_key(region)
+            same = [c for c in found if _region_key(c.region) == rkey]
+            if same:
+                found = same
+        return max(found, key=lambda c: c.population)
+
+
+class CityResolver:
+    """
+    Определяет город по строке адреса без браузера.
+
+    Адрес режется по запятым: часть с типом населённого пункта («г Химки»)
+    или совпадающая с городом справочника («Россия, Москва, …») даёт город,
+    часть с «обл»/«край»/«респ» — регион для выбора между тёзками.
+    Результаты, в том числе найденные через Яндекс.Карты, сохраняются
+    в SQLite, так что один и тот же адрес разбирается только один раз.
+    """
+
+    def __init__(self, gazetteer_path: str = GAZETTEER_CSV, cache_path: str = CITY_CACHE_DB):
+        self.gazetteer = Gazetteer(gazetteer_path)
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS resolutions (
+                address TEXT PRIMARY KEY,
+                city TEXT NOT NULL,
+                region TEXT NOT NULL,
+                source TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def resolve(self, address: str) -> Optional[Tuple[str, str]]:
+        """Возвращает (город, регион) или None; регион может быть пустым."""
+        if not address:
+            return None
+        key = _key(address)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT city, region FROM resolutions WHERE address = ?", (key,)
+            ).fetchone()
+        if row:
+            self.stats["cache"] += 1
+            return row[0], row[1]
+
+        hit = self._parse(address)
+        if hit is None:
+            self.stats["miss"] += 1
+            return None
+        city, region, source = hit
+        self.stats[source] += 1
+        self._store(key, city, region, source)
+        return city, region
+
+    def remember(self, address: str, city: str, region: str = "", source: str = "browser"):
+        """Сохраняет город, найденный другим способом (например, через Яндекс.Карты)."""
+        if not address or not city:
+            return
+        self.stats[source] += 1
+        self._store(_key(address), city, region, source)
+
+    def summary(self) -> str:
+        total = sum(self.stats.values())
+        if not total:
+            return "адресов не было"
+        offline = total - self.stats["miss"] - self.stats["browser"]
+        parts = ", ".join(f"{k} {v}" for k, v in self.stats.most_common())
+        return f"адресов {total}, без браузера {offline} ({offline / total:.0%}): {parts}"
+
+    def _parse(self, address: str) -> Optional[Tuple[str, str, str]]:
+        parts = [p.strip() for p in address.split(",") if p.strip()]
+        region = next((p for p in parts if REGION_RX.search(p) and not SETTLEMENT_RX.match(p)), "")
+
+        for part in parts:
+            m = SETTLEMENT_RX.match(part)
+            if m:
+                name = m.group("name").strip()
+                city = self.gazetteer.lookup(name, region)
+                if city:
+                    return city.name, region or city.region, "gazetteer"
+                # Тип пункта указан явно — верим адресу, даже если пункта нет в справочнике
+                return name, region, "prefix"
+
+        for part in parts:
+            if STREET_RX.match(part) or part is region:
+                continue
+            city = self.gazetteer.lookup(part, region)
+            if city:
+                return city.name, region or city.region, "gazetteer"
+        return None
+
+    def _store(self, key: str, city: str, region: str, source: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resolutions (address, city, region, source, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, city, region, source, time.time()),
+            )
+            self._conn.commit()
@@ -3,31 +3,63 @@ import time
 import sys
 import logging
 import json
-from datetime import datetime
-from typing import Optional, Tuple, Dict, List
+import argparse
+import asyncio
+import hashlib
+import multiprocessing as mp
+import os
+import subprocess
+from contextlib import nullcontext
+from fnmatch import fnmatchcase
+from pathlib import Path
+from queue import Empty
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional, Tuple, Dict, List
 from urllib.parse import urljoin
 
+import aiohttp
 import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException, WebDriverException, StaleElementReferenceException, ElementClickInterceptedException
-from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException, StaleElementReferenceException, ElementClickInterceptedException, NoSuchElementException
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
+import soupsieve as sv
+from bs4 import BeautifulSoup, SoupStrainer
+
+from catalog import CATALOG_DIR, publish_snapshot
+from categories import categorize
+from city_resolver import CITY_CACHE_DB, GAZETTEER_CSV, CityResolver
 
 BASE_URL = "https://dobro.mail.ru/volunteers/"
 OUT_JSON = "data/events.json"
+DIFF_JSON = "data/events_diff.json"
+SPOOL_DIR = "data/crawl"
 LOG_FILE = "data/parser.log"
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(LOG_FILE, "w", "utf-8")
-    ]
-)
+HTTP_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Language": "ru-RU,ru;q=0.9",
+}
+# Без этих полей запись бесполезна для поиска — такие карточки добираем браузером
+REQUIRED_FIELDS = ("title", "date_iso", "city")
+
 log = logging.getLogger("dobro.rf")
 
+
+def setup_logging(filemode: str = "w"):
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(processName)s %(message)s",
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler(LOG_FILE, filemode, "utf-8")
+        ]
+    )
+
+
 RU_MONTHS = {
     "января": "01", "февраля": "02", "марта": "03", "апреля": "04",
     "мая": "05", "июня": "06", "июля": "07", "августа": "08",
@@ -35,10 +67,47 @@ RU_MONTHS = {
 }
 DATE_RX = re.compile(r"(?P<d>\d{1,2})\s+(?P<m>[А-Яа-я]+)\s*(?P<y>\d{4})?", re.IGNORECASE)
 TIME_RX = re.compile(r"(?P<h>\d{1,2})[:.](?P<m>\d{2})")
+# «19 августа – 15 ноября 2025», «10 – 14 ноября 2025»
+DATE_RANGE_RX = re.compile(
+    r"(?<![\d:])(?P<d1>\d{1,2})(?:\s+(?P<m1>[А-Яа-я]+))?(?:\s+(?P<y1>\d{4}))?"
+    r"\s*[–—-]\s*"
+    r"(?P<d2>\d{1,2})\s+(?P<m2>[А-Яа-я]+)(?:\s+(?P<y2>\d{4}))?",
+    re.IGNORECASE,
+)
+ISO_DATE_RX = re.compile(r"\d{4}-\d{2}-\d{2}")
+EVENT_ID_RX = re.compile(r"/event/(\d+)")
+WS_RX = re.compile(r"\s+")
+NEXT_DATA_RX = re.compile(
+    r"<script[^>]*\bid=[\"']__NEXT_DATA__[\"'][^>]*>(.*?)</script>", re.DOTALL | re.IGNORECASE
+)
+
+# Селекторы карточки: компилируются один раз при импорте, а не на каждой странице
+TITLE_SEL = sv.compile("h1, h2.EventInfo_event-title__3DHyd, h2[class*='EventInfo_event-title']")
+LOCATION_SEL = sv.compile("span.CardTypes_card-location__title__aCIPk, span[class*='card-location__title']")
+TIME_SEL = sv.compile("span.CardTypes_card-time__title__QoS6L, span[class*='card-time__title']")
+ORGANIZER_SEL = sv.compile(".EventInfo_event__organization__EdRYe, .EventInfo_event-info__organizer-title__owGDk")
+ORGANIZER_LINK_SEL = sv.compile("a[href*='/organizations/']")
+CONTACT_NAME_SEL = sv.compile(
+    ".EventContacts_event-contacts__contact-name__DtYJx, [class*='event-contacts__contact-name']"
+)
+CONTACT_POSITION_SEL = sv.compile(
+    ".EventContacts_event-contacts__contact-position__7w0Zr, [class*='event-contacts__contact-position']"
+)
+CONTACT_PHONE_SEL = sv.compile(
+    ".EventContacts_event-contacts__phone-text__NuFca, [class*='event-contacts__phone-text']"
+)
+CONTACT_VK_SEL = sv.compile(".SocialMediaBlock_socials__GFSLa a[href^='https://vk.com/']")
+DESCRIPTION_SEL = sv.compile(".EventInfo_event-description__text__XCVRW, [class*='event-description__text']")
+JSON_SCRIPTS_SEL = sv.compile("script[type='application/json']")
+YAMAPS_CITY_SEL = sv.compile(
+    "h1.home-panel-content-view__header-text, h1[class*='home-panel-content-view__header-text']"
+)
+ONLY_LINKS = SoupStrainer("a")
+ONLY_H1 = SoupStrainer("h1")
 
 
 def norm(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "").strip())
+    return WS_RX.sub(" ", (s or "").strip())
 
 
 def ru_date_to_iso(text: str) -> Optional[str]:
@@ -53,6 +122,40 @@ def ru_date_to_iso(text: str) -> Optional[str]:
     return f"{int(y):04d}-{int(RU_MONTHS[m_ru]):02d}-{d:02d}"
 
 
+def ru_date_range_to_iso(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Даты начала и конца из строки расписания:
+      «19 августа – 15 ноября 2025» -> ("2025-08-19", "2025-11-15")
+      «10 – 14 ноября 2025»         -> ("2025-11-10", "2025-11-14")
+      «15 ноября 2025»              -> ("2025-11-15", "2025-11-15")
+    Понимает и ISO-строку из __NEXT_DATA__ («2025-11-14T10:00 — 2025-11-15T15:00»).
+    """
+    text = text or ""
+    iso = ISO_DATE_RX.findall(text)
+    if iso:
+        return iso[0], iso[-1]
+
+    m = DATE_RANGE_RX.search(text)
+    if m:
+        m1 = (m.group("m1") or m.group("m2")).lower()
+        m2 = m.group("m2").lower()
+        if m1 in RU_MONTHS and m2 in RU_MONTHS:
+            y2 = int(m.group("y2") or datetime.now().year)
+            mon1, mon2 = int(RU_MONTHS[m1]), int(RU_MONTHS[m2])
+            # «20 декабря – 15 января 2026»: начало в предыдущем году
+            y1 = int(m.group("y1") or (y2 - 1 if mon1 > mon2 else y2))
+            try:
+                start = date(y1, mon1, int(m.group("d1")))
+                end = date(y2, mon2, int(m.group("d2")))
+            except ValueError:
+                start = end = None
+            if start and end and start <= end:
+                return start.isoformat(), end.isoformat()
+
+    single = ru_date_to_iso(text)
+    return single, single
+
+
 def extract_times(text: str) -> Tuple[Optional[str], Optional[str]]:
     ts = TIME_RX.findall(text or "")
     fmt = lambda t: f"{int(t[0]):02d}:{int(t[1]):02d}"
@@ -62,7 +165,91 @@ def extract_times(text: str) -> Tuple[Optional[str], Optional[str]]:
         return fmt(ts[0]), None
     return fmt(ts[0]), fmt(ts[1])
 
-def driver_build():
+# Профили блокировки ресурсов в Chrome: странице для разбора нужен только DOM.
+# Шаблоны — в синтаксисе Network.setBlockedURLs (звёздочка — любая подстрока).
+MEDIA_BLOCK_PATTERNS = [
+    "*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*",
+    "*/_next/image*",
+    "*.woff*", "*.ttf*", "*.otf*", "*.eot*",
+    "*.mp4*", "*.webm*", "*.m3u8*", "*.mp3*",
+]
+TRACKER_BLOCK_PATTERNS = [
+    "*mc.yandex.ru*", "*top-fwz1.mail.ru*", "*googletagmanager.com*", "*google-analytics.com*",
+    "*vk.com/rtrg*", "*ad.mail.ru*", "*an.yandex.ru*", "*doubleclick.net*", "*tns-counter.ru*",
+]
+BLOCK_PROFILES = {
+    "off": {"patterns": [], "images": True},
+    "media": {"patterns": MEDIA_BLOCK_PATTERNS, "images": False},
+    "strict": {"patterns": MEDIA_BLOCK_PATTERNS + TRACKER_BLOCK_PATTERNS, "images": False},
+}
+DEFAULT_BLOCK_PROFILE = "media"
+# Без этих ресурсов не работают «Показать ещё», раскрытие описания и карта —
+# шаблон, задевающий любой из них, в браузер не передаётся
+MUST_LOAD_URLS = [
+    "https://dobro.mail.ru/_next/static/chunks/pages/_app.js",
+    "https://dobro.mail.ru/_next/static/css/app.css",
+    "https://dobro.mail.ru/api/v2/events/?page=2",
+    "https://dobro.ru/_next/static/chunks/main.js",
+    "https://api-maps.yandex.ru/2.1/?lang=ru_RU",
+    "https://yandex.ru/maps/?text=Москва",
+]
+
+PAGE_METRICS_JS = """
+const nav = performance.getEntriesByType('navigation')[0];
+const res = performance.getEntriesByType('resource');
+let bytes = nav ? nav.transferSize : 0;
+for (const r of res) bytes += r.transferSize || 0;
+const load = nav && nav.loadEventEnd ? nav.loadEventEnd - nav.startTime : performance.now();
+return {bytes: bytes, resources: res.length, load_ms: load};
+"""
+
+
+def blocked_patterns(profile: str) -> List[str]:
+    patterns = []
+    for pat in BLOCK_PROFILES[profile]["patterns"]:
+        hit = next((u for u in MUST_LOAD_URLS if fnmatchcase(u, pat)), None)
+        if hit:
+            log.warning("Шаблон блокировки %s задевает %s — пропускаю", pat, hit)
+            continue
+        patterns.append(pat)
+    return patterns
+
+
+def page_metrics(drv) -> Dict:
+    """Сколько байт и ресурсов загрузила текущая страница и за сколько мс (Performance API)."""
+    try:
+        return drv.execute_script(PAGE_METRICS_JS) or {}
+    except WebDriverException:
+        return {}
+
+
+class LoadStats:
+    """Суммарный трафик и время загрузки страниц в текущем процессе."""
+
+    def __init__(self):
+        self.pages = 0
+        self.bytes = 0
+        self.load_ms = 0.0
+
+    def add(self, metrics: Dict):
+        if not metrics:
+            return
+        self.pages += 1
+        self.bytes += int(metrics.get("bytes") or 0)
+        self.load_ms += float(metrics.get("load_ms") or 0.0)
+
+    def summary(self, profile: str) -> str:
+        if not self.pages:
+            return f"профиль {profile}: страниц не было"
+        return (f"профиль {profile}: страниц {self.pages}, в среднем "
+                f"{self.bytes / self.pages / 1024:.0f} КБ и {self.load_ms / self.pages / 1000:.1f}s на страницу")
+
+
+load_stats = LoadStats()
+
+
+def driver_build(block_profile: str = DEFAULT_BLOCK_PROFILE):
+    profile = BLOCK_PROFILES[block_profile]
     opts = uc.ChromeOptions()
     opts.add_argument("--headless=new")
     opts.add_argument("--disable-gpu")
@@ -73,20 +260,132 @@ def driver_build():
         "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
         "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128 Safari/537.36"
     )
+    if not profile["images"]:
+        opts.add_argument("--blink-settings=imagesEnabled=false")
+        opts.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
     d = uc.Chrome(options=opts)
     d.set_page_load_timeout(60)
     d.set_script_timeout(60)
+    d.block_profile = block_profile
+    patterns = blocked_patterns(block_profile)
+    if patterns:
+        try:
+            d.execute_cdp_cmd("Network.enable", {})
+            d.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        except WebDriverException as e:
+            log.warning("CDP-блокировка ресурсов не включилась: %s", e)
+    log.info("Chrome запущен, профиль блокировки: %s (%d шаблонов)", block_profile, len(patterns))
     return d
 
 
+def compare_block_profiles(urls: List[str], profiles: List[str]) -> Dict[str, Dict]:
+    """
+    Открывает одни и те же карточки под разными профилями (кэш браузера выключен)
+    и печатает, сколько трафика и времени загрузки экономит каждый профиль
+    относительно первого в списке.
+    """
+    report = {}
+    for name in profiles:
+        drv = driver_build(name)
+        stats = LoadStats()
+        try:
+            drv.execute_cdp_cmd("Network.setCacheDisabled", {"cacheDisabled": True})
+            for url in urls:
+                try:
+                    drv.get(url)
+                    wait_ready(drv, 45)
+                except TimeoutException:
+                    log.warning("Timeout при открытии %s", url)
+                    continue
+                stats.add(page_metrics(drv))
+        finally:
+            drv.quit()
+        report[name] = {"pages": stats.pages, "bytes": stats.bytes, "load_ms": stats.load_ms}
+        log.info("Сравнение профилей: %s", stats.summary(name))
+
+    base = report[profiles[0]]
+    print(f"{'профиль':10} {'страниц':>8} {'КБ/стр':>8} {'s/стр':>7} {'экономия КБ':>12} {'экономия s':>11}")
+    for name, r in report.items():
+        n = r["pages"] or 1
+        kb, sec = r["bytes"] / n / 1024, r["load_ms"] / n / 1000
+        base_n = base["pages"] or 1
+        saved_kb = base["bytes"] / base_n / 1024 - kb
+        saved_s = base["load_ms"] / base_n / 1000 - sec
+        print(f"{name:10} {r['pages']:>8} {kb:>8.0f} {sec:>7.1f} {saved_kb:>12.0f} {saved_s:>11.1f}")
+    return report
+
+
+class WaitStats:
+    """Учёт времени страницы: сколько ушло на ожидание браузера, а сколько на работу."""
+
+    def __init__(self):
+        self.total_wait = 0.0
+        self.total_time = 0.0
+        self.pages = 0
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.waited = 0.0
+
+    def add_wait(self, seconds: float):
+        self.waited += seconds
+        self.total_wait += seconds
+
+    def finish_page(self) -> Tuple[float, float]:
+        """Закрывает страницу; возвращает (ожидание, работа) в секундах."""
+        elapsed = time.perf_counter() - self.started
+        self.total_time += elapsed
+        self.pages += 1
+        return self.waited, elapsed - self.waited
+
+    def summary(self) -> str:
+        work = self.total_time - self.total_wait
+        return (f"страниц {self.pages}: ожидание {self.total_wait:.1f}s, работа {work:.1f}s "
+                f"({self.total_wait / self.total_time:.0%} времени в ожидании)" if self.total_time else
+                f"страниц {self.pages}")
+
+
+wait_stats = WaitStats()
+
+
+def wait_until(drv, condition, timeout: float, *, poll: float = 0.05, max_poll: float = 1.0, factor: float = 1.6):
+    """
+    Ждёт, пока condition(drv) вернёт истинное значение, и возвращает его.
+    Опрос начинается часто и постепенно реже (poll → max_poll), поэтому быстрые
+    ответы сайта ловятся почти сразу, а долгие не грузят браузер.
+    Подходит для условий из expected_conditions; время попадает в wait_stats.
+    """
+    t0 = time.perf_counter()
+    deadline = t0 + timeout
+    try:
+        while True:
+            try:
+                value = condition(drv)
+                if value:
+                    return value
+            except (NoSuchElementException, StaleElementReferenceException):
+                pass
+            now = time.perf_counter()
+            if now >= deadline:
+                raise TimeoutException(f"условие не выполнилось за {timeout:g}s")
+            time.sleep(min(poll, deadline - now))
+            poll = min(poll * factor, max_poll)
+    finally:
+        wait_stats.add_wait(time.perf_counter() - t0)
+
+
 def wait_ready(drv, t=45):
-    WebDriverWait(drv, t).until(
-        lambda d: d.execute_script("return document.readyState") == "complete"
-    )
+    wait_until(drv, lambda d: d.execute_script("return document.readyState") == "complete", t)
+
+
+def count_links(drv) -> int:
+    return drv.execute_script("return document.getElementsByTagName('a').length")
 
 
 def click_show_more_until_end(drv):
     clicks = 0
+    stalls = 0
     while True:
         try:
             btns = drv.find_elements(
@@ -100,14 +399,24 @@ def click_show_more_until_end(drv):
             drv.execute_script(
                 "arguments[0].scrollIntoView({block:'center'});", btn
             )
-            time.sleep(2.2)
-            if not btn.is_enabled() or not btn.is_displayed():
+            try:
+                wait_until(drv, EC.element_to_be_clickable(btn), 5)
+            except TimeoutException:
                 log.info("Кнопка «Показать ещё» недоступна — конец ленты.")
                 break
+            before = count_links(drv)
             btn.click()
             clicks += 1
             log.info("Клик «Показать ещё» #%d… жду подгрузку", clicks)
-            time.sleep(3.2)
+            try:
+                # Подгрузка закончилась, когда в ленте стало больше ссылок
+                wait_until(drv, lambda d: count_links(d) > before, 15)
+                stalls = 0
+            except TimeoutException:
+                stalls += 1
+                log.warning("После клика #%d новые карточки не появились", clicks)
+                if stalls >= 2:
+                    break
         except Exception as e:
             log.warning("Не удалось кликнуть «Показать ещё»: %s", e)
             break
@@ -115,10 +424,11 @@ def click_show_more_until_end(drv):
 
 
 def collect_detail_links_from_feed(html: str) -> List[str]:
-    soup = BeautifulSoup(html, "lxml")
+    # Из ленты нужны только ссылки — остальную разметку lxml даже не разворачивает в дерево
+    soup = BeautifulSoup(html, "lxml", parse_only=ONLY_LINKS)
     links = []
     for a in soup.find_all("a"):
-        if "Подробнее" in norm(a.get_text()):
+        if "Подробнее" in a.get_text():
             href = a.get("href")
             if href:
                 if href.startswith("/"):
@@ -135,22 +445,52 @@ def collect_detail_links_from_feed(html: str) -> List[str]:
     log.info("Ссылок «Подробнее» собрано: %d", len(out))
     return out
 
-def try_next_data(html: str):
-    soup = BeautifulSoup(html, "lxml")
-    sc = soup.find("script", id="__NEXT_DATA__", type="application/json")
-    if sc and sc.string:
-        try:
-            return json.loads(sc.string)
-        except json.JSONDecodeError:
-            pass
-    for s in soup.find_all("script", type="application/json"):
-        txt = s.string or ""
-        if '"pageProps"' in txt:
+
+class DetailPage:
+    """
+    Карточка, разобранная один раз: дерево BeautifulSoup и __NEXT_DATA__
+    общие для всех извлекающих функций.
+    """
+
+    def __init__(self, html: str):
+        self.html = html or ""
+        self.soup = BeautifulSoup(self.html, "lxml")
+        self._next_data = None
+        self._next_data_ready = False
+
+    def next_data(self) -> Optional[Dict]:
+        if not self._next_data_ready:
+            self._next_data = self._read_next_data()
+            self._next_data_ready = True
+        return self._next_data
+
+    def _read_next_data(self) -> Optional[Dict]:
+        m = NEXT_DATA_RX.search(self.html)
+        if m:
             try:
-                return json.loads(txt)
+                return json.loads(m.group(1))
             except json.JSONDecodeError:
                 pass
-    return None
+        for s in JSON_SCRIPTS_SEL.select(self.soup):
+            txt = s.string or ""
+            if '"pageProps"' in txt:
+                try:
+                    return json.loads(txt)
+                except json.JSONDecodeError:
+                    pass
+        return None
+
+    def text(self, selector) -> str:
+        el = selector.select_one(self.soup)
+        return norm(el.get_text()) if el else ""
+
+    def attr(self, selector, name: str) -> str:
+        el = selector.select_one(self.soup)
+        return (el.get(name) or "") if el else ""
+
+
+def try_next_data(html: str):
+    return DetailPage(html).next_data()
 
 
 def read_city_from_yamaps_html(html: str) -> Optional[str]:
@@ -158,11 +498,8 @@ def read_city_from_yamaps_html(html: str) -> Optional[str]:
     Разбирает HTML Яндекс.Карт и достаёт город из
     <h1 class="home-panel-content-view__header-text">Санкт-Петербург</h1>
     """
-    soup = BeautifulSoup(html, "lxml")
-    h = soup.select_one(
-        "h1.home-panel-content-view__header-text, "
-        "h1[class*='home-panel-content-view__header-text']"
-    )
+    soup = BeautifulSoup(html, "lxml", parse_only=ONLY_H1)
+    h = YAMAPS_CITY_SEL.select_one(soup)
     if h:
         city = norm(h.get_text())
         return city or None
@@ -177,10 +514,12 @@ def click_open_on_yandex_maps(drv) -> bool:
     Возвращает True, если второй клик удалось сделать.
     """
     try:
-        btn = WebDriverWait(drv, 10).until(
+        btn = wait_until(
+            drv,
             EC.presence_of_element_located(
                 (By.XPATH, "//*[contains(text(),'Показать на карте')]")
-            )
+            ),
+            10,
         )
         log.info("Нашёл «Показать на карте»: tag=%s, class=%s",
                  btn.tag_name, btn.get_attribute("class"))
@@ -189,7 +528,6 @@ def click_open_on_yandex_maps(drv) -> bool:
             drv.execute_script(
                 "arguments[0].scrollIntoView({block:'center'});", btn
             )
-            time.sleep(1.3)
         except Exception:
             pass
 
@@ -199,7 +537,6 @@ def click_open_on_yandex_maps(drv) -> bool:
             drv.execute_script("arguments[0].click();", btn)
 
         log.info("Кликнул «Показать на карте». Жду появление оверлея…")
-        time.sleep(2.0)
     except TimeoutException:
         log.error("Не нашёл элемент с текстом «Показать на карте».")
         return False
@@ -207,10 +544,12 @@ def click_open_on_yandex_maps(drv) -> bool:
         log.warning("Ошибка при поиске/клике «Показать на карте»: %s", e)
         return False
     try:
-        ymaps_el = WebDriverWait(drv, 10).until(
-            EC.presence_of_element_located(
+        ymaps_el = wait_until(
+            drv,
+            EC.element_to_be_clickable(
                 (By.XPATH, "//*[contains(text(),'Открыть в Яндекс-Картах') or contains(text(),'Открыть в Яндекс.Картах')]")
-            )
+            ),
+            10,
         )
         log.info("Нашёл «Открыть в Яндекс-Картах»: tag=%s, class=%s",
                  ymaps_el.tag_name, ymaps_el.get_attribute("class"))
@@ -219,7 +558,6 @@ def click_open_on_yandex_maps(drv) -> bool:
             drv.execute_script(
                 "arguments[0].scrollIntoView({block:'center'});", ymaps_el
             )
-            time.sleep(1.3)
         except Exception:
             pass
 
@@ -251,10 +589,10 @@ def try_get_city_from_yandex(drv) -> Optional[str]:
 
     if not click_open_on_yandex_maps(drv):
         return None
-    for _ in range(20):
-        time.sleep(1.4)
-        if len(drv.window_handles) > len(handles_before):
-            break
+    try:
+        wait_until(drv, EC.new_window_is_opened(list(handles_before)), 28)
+    except TimeoutException:
+        pass
 
     new_tab = None
     handles_after = set(drv.window_handles)
@@ -273,9 +611,15 @@ def try_get_city_from_yandex(drv) -> Optional[str]:
     try:
         try:
             wait_ready(drv, 30)
+            wait_until(
+                drv,
+                EC.presence_of_element_located(
+                    (By.CSS_SELECTOR, "h1[class*='home-panel-content-view__header-text']")
+                ),
+                10,
+            )
         except TimeoutException:
             pass
-        time.sleep(1.0)
         html = drv.page_source or ""
         city = read_city_from_yamaps_html(html)
         if city:
@@ -303,12 +647,34 @@ def try_get_city_from_yandex(drv) -> Optional[str]:
     return city
 
 
+_city_resolver: Optional[CityResolver] = None
+
+
+def get_city_resolver() -> CityResolver:
+    # Создаётся лениво: у каждого процесса-воркера своё соединение с кэшем
+    global _city_resolver
+    if _city_resolver is None:
+        _city_resolver = CityResolver(GAZETTEER_CSV, CITY_CACHE_DB)
+    return _city_resolver
+
+
+def city_point(city: Optional[str], region: Optional[str] = None) -> Tuple[Optional[float], Optional[float]]:
+    """Координаты города по справочнику — для поиска «в радиусе N км» в боте."""
+    found = get_city_resolver().gazetteer.lookup(city, region or "") if city else None
+    return (found.lat, found.lon) if found else (None, None)
+
+
+def log_city_stats():
+    if _city_resolver is not None:
+        log.info("Определение города: %s", _city_resolver.summary())
+
+
 def extract_from_detail(html: str, url: str) -> Dict:
-    soup = BeautifulSoup(html, "lxml")
-    data = try_next_data(html)
+    page = DetailPage(html)
+    data = page.next_data()
 
     rec = {k: "" for k in [
-        "title", "date_iso", "time_start", "time_end", "datetime_raw",
+        "title", "date_iso", "date_end", "time_start", "time_end", "datetime_raw",
         "address_full", "city", "region",
         "organizer_name", "organizer_url",
         "contact_name", "contact_position", "contact_phone", "contact_vk",
@@ -336,6 +702,7 @@ def extract_from_detail(html: str, url: str) -> Dict:
             d1, t1 = split_iso(start_iso)
             d2, t2 = split_iso(end_iso)
             rec["date_iso"] = d1 or d2
+            rec["date_end"] = d2 or d1
             rec["time_start"] = t1
             rec["time_end"] = t2
             rec["datetime_raw"] = (start_iso + " — " + end_iso).strip(" —")
@@ -362,78 +729,45 @@ def extract_from_detail(html: str, url: str) -> Dict:
             rec["contact_vk"] = contact.get("vk") or ""
             rec["description"] = (event.get("description") or "").strip()
     if not rec["title"]:
-        el = soup.select_one("h1, h2.EventInfo_event-title__3DHyd, h2[class*='EventInfo_event-title']")
-        if el:
-            rec["title"] = norm(el.get_text())
+        rec["title"] = page.text(TITLE_SEL)
 
     if not rec["address_full"]:
-        el = soup.select_one(
-            "span.CardTypes_card-location__title__aCIPk, span[class*='card-location__title']"
-        )
-        if el:
-            rec["address_full"] = norm(el.get_text())
+        rec["address_full"] = page.text(LOCATION_SEL)
 
     if not rec["city"]:
-        m = re.search(
-            r"(?:г\.?\s*|город\s+)([^,]+)",
-            rec["address_full"],
-            re.IGNORECASE
-        )
-        if m:
-            rec["city"] = norm(m.group(1))
+        hit = get_city_resolver().resolve(rec["address_full"])
+        if hit:
+            rec["city"] = hit[0]
+            rec["region"] = rec["region"] or hit[1]
 
     if not any([rec["date_iso"], rec["time_start"], rec["time_end"]]):
-        el = soup.select_one(
-            "span.CardTypes_card-time__title__QoS6L, span[class*='card-time__title']"
-        )
-        text = norm(el.get_text()) if el else norm(soup.get_text())[:3000]
+        el = TIME_SEL.select_one(page.soup)
+        text = norm(el.get_text()) if el else norm(page.soup.get_text())[:3000]
         rec["datetime_raw"] = text
-        rec["date_iso"] = ru_date_to_iso(text) or ""
+        # «19 августа – 15 ноября 2025»: и начало, и конец, иначе длинные события теряются в поиске
+        start, end = ru_date_range_to_iso(text)
+        rec["date_iso"], rec["date_end"] = start or "", end or ""
         t1, t2 = extract_times(text)
         rec["time_start"], rec["time_end"] = t1 or "", t2 or ""
 
     if not rec["organizer_name"]:
-        org = soup.select_one(
-            ".EventInfo_event__organization__EdRYe, .EventInfo_event-info__organizer-title__owGDk"
-        )
-        if org:
-            rec["organizer_name"] = norm(org.get_text())
+        rec["organizer_name"] = page.text(ORGANIZER_SEL)
     if not rec["organizer_url"]:
-        a = soup.select_one("a[href*='/organizations/']")
-        if a:
-            rec["organizer_url"] = urljoin("https://dobro.ru", a.get("href"))
+        href = page.attr(ORGANIZER_LINK_SEL, "href")
+        if href:
+            rec["organizer_url"] = urljoin("https://dobro.ru", href)
 
     if not rec["contact_name"]:
-        el = soup.select_one(
-            ".EventContacts_event-contacts__contact-name__DtYJx, [class*='event-contacts__contact-name']"
-        )
-        if el:
-            rec["contact_name"] = norm(el.get_text())
+        rec["contact_name"] = page.text(CONTACT_NAME_SEL)
     if not rec["contact_position"]:
-        el = soup.select_one(
-            ".EventContacts_event-contacts__contact-position__7w0Zr, [class*='event-contacts__contact-position']"
-        )
-        if el:
-            rec["contact_position"] = norm(el.get_text())
+        rec["contact_position"] = page.text(CONTACT_POSITION_SEL)
     if not rec["contact_phone"]:
-        el = soup.select_one(
-            ".EventContacts_event-contacts__phone-text__NuFca, [class*='event-contacts__phone-text']"
-        )
-        if el:
-            rec["contact_phone"] = norm(el.get_text())
+        rec["contact_phone"] = page.text(CONTACT_PHONE_SEL)
     if not rec["contact_vk"]:
-        a = soup.select_one(
-            ".SocialMediaBlock_socials__GFSLa a[href^='https://vk.com/']"
-        )
-        if a:
-            rec["contact_vk"] = a.get("href")
+        rec["contact_vk"] = page.attr(CONTACT_VK_SEL, "href")
 
     if not rec["description"]:
-        el = soup.select_one(
-            ".EventInfo_event-description__text__XCVRW, [class*='event-description__text']"
-        )
-        if el:
-            rec["description"] = norm(el.get_text())
+        rec["description"] = page.text(DESCRIPTION_SEL)
 
     return rec
 
@@ -460,7 +794,6 @@ def expand_description(drv, timeout=6) -> bool:
 
     try:
         drv.execute_script("arguments[0].scrollIntoView({block:'center'});", btn)
-        time.sleep(0.25)
         try:
             btn.click()
         except (ElementClickInterceptedException, StaleElementReferenceException):
@@ -471,13 +804,14 @@ def expand_description(drv, timeout=6) -> bool:
         return False
 
     try:
-        WebDriverWait(drv, timeout).until(
+        wait_until(
+            drv,
             lambda d: len(d.find_elements(
                 By.CSS_SELECTOR,
                 ".EventInfo_event-description__text--hidden___lkKa"
-            )) == 0
+            )) == 0,
+            timeout,
         )
-        time.sleep(1.2)
         return True
     except Exception:
         return True
@@ -485,29 +819,41 @@ def expand_description(drv, timeout=6) -> bool:
 
 def parse_detail(drv, url: str) -> Dict:
     log.info("Открываю карточку: %s", url)
+    wait_stats.reset()
     try:
         drv.get(url)
         wait_ready(drv, 45)
-        time.sleep(1.8)
+        try:
+            # Next.js дорисовывает карточку после readyState — ждём заголовок
+            wait_until(drv, EC.presence_of_element_located((By.CSS_SELECTOR, "h1, h2[class*='EventInfo_event-title']")), 10)
+        except TimeoutException:
+            log.warning("   ! Заголовок карточки не появился за 10s")
+
+        # Метрики снимаем до раскрытия описания и карты: нужна именно загрузка страницы
+        metrics = page_metrics(drv)
 
         if expand_description(drv):
             log.info("Описание раскрыто.")
 
         html = drv.page_source or ""
+        cpu0 = time.process_time()
         rec = extract_from_detail(html, url)
+        parse_cpu = time.process_time() - cpu0
 
         if not rec.get("city"):
-            log.info("   → город пуст в карточке, пробую Яндекс.Карты…")
+            # Последний шанс: адрес не разобрался офлайн — спрашиваем Яндекс.Карты
+            log.info("   → город не определён по адресу, пробую Яндекс.Карты…")
             city_from_ymaps = try_get_city_from_yandex(drv)
             if city_from_ymaps:
                 rec["city"] = city_from_ymaps
+                get_city_resolver().remember(rec["address_full"], city_from_ymaps)
                 if not rec.get("address_full"):
                     rec["address_full"] = city_from_ymaps
 
         log.info("   └ title: %s", rec["title"] or "—")
         log.info("   └ addr : %s", rec["address_full"] or "—")
         log.info("   └ city : %s", rec["city"] or "—")
-        log.info("   └ date : %s  time: %s–%s", rec["date_iso"] or "—",
+        log.info("   └ date : %s – %s  time: %s–%s", rec["date_iso"] or "—", rec["date_end"] or "—",
                  rec["time_start"] or "—", rec["time_end"] or "—")
         log.info("   └ org  : %s | %s", rec["organizer_name"] or "—",
                  rec["organizer_url"] or "—")
@@ -515,6 +861,13 @@ def parse_detail(drv, url: str) -> Dict:
                  rec["contact_name"] or "—", rec["contact_position"] or "—",
                  rec["contact_phone"] or "—", rec["contact_vk"] or "—")
         log.info("   └ desc : %d символов", len(rec.get("description", "")))
+        if metrics:
+            load_stats.add(metrics)
+            log.info("   └ load : %d КБ, ресурсов %d, %.1fs", metrics["bytes"] // 1024,
+                     metrics["resources"], metrics["load_ms"] / 1000)
+        waited, worked = wait_stats.finish_page()
+        log.info("   └ time : ожидание %.1fs, работа %.1fs, разбор HTML %.0f ms CPU",
+                 waited, worked, parse_cpu * 1000)
 
         if not rec["title"]:
             log.warning("   ! Заголовок не извлечён (%s)", url)
@@ -524,8 +877,12 @@ def parse_detail(drv, url: str) -> Dict:
     except WebDriverException as e:
         log.error("WebDriverException для %s: %s", url, e)
 
+    return empty_record(url)
+
+
+def empty_record(url: str) -> Dict:
     return {
-        "title": "", "date_iso": "", "time_start": "", "time_end": "",
+        "title": "", "date_iso": "", "date_end": "", "time_start": "", "time_end": "",
         "datetime_raw": "", "address_full": "", "city": "", "region": "",
         "organizer_name": "", "organizer_url": "",
         "contact_name": "", "contact_position": "",
@@ -533,6 +890,407 @@ def parse_detail(drv, url: str) -> Dict:
         "description": "", "url": url
     }
 
+def driver_alive(drv) -> bool:
+    try:
+        _ = drv.current_url
+        return True
+    except Exception:
+        return False
+
+
+def parse_detail_with_restart(drv, url: str, start_lock=None):
+    """
+    parse_detail, переживающий падение Chrome: если после разбора сессия
+    браузера мертва, драйвер пересоздаётся и карточка разбирается ещё раз.
+    Возвращает (drv, rec) — драйвер может оказаться новым. start_lock —
+    общая блокировка запуска браузеров у параллельных воркеров.
+    """
+    rec = parse_detail(drv, url)
+    if rec.get("title") or driver_alive(drv):
+        return drv, rec
+
+    log.warning("Браузер упал на %s — перезапускаю драйвер", url)
+    try:
+        drv.quit()
+    except Exception:
+        pass
+    with start_lock if start_lock is not None else nullcontext():
+        drv = driver_build(getattr(drv, "block_profile", DEFAULT_BLOCK_PROFILE))
+    return drv, parse_detail(drv, url)
+
+
+def _detail_worker(tasks, results, start_lock, block_profile=DEFAULT_BLOCK_PROFILE):
+    """
+    Процесс-воркер: поднимает свой Chrome и разбирает карточки (i, url)
+    из общей очереди, пока не получит None.
+    """
+    if not logging.getLogger().handlers:
+        setup_logging("a")
+    drv = None
+    try:
+        while True:
+            item = tasks.get()
+            if item is None:
+                break
+            i, url = item
+            try:
+                if drv is None:
+                    # undetected_chromedriver патчит общий бинарник — запускаем браузеры по одному
+                    with start_lock:
+                        drv = driver_build(block_profile)
+                drv, rec = parse_detail_with_restart(drv, url, start_lock)
+            except Exception as e:
+                log.error("Воркер не смог разобрать %s: %s", url, e)
+                rec = empty_record(url)
+                # Следующая карточка поднимет новый браузер — этот закрываем, а не бросаем
+                if drv is not None:
+                    try:
+                        drv.quit()
+                    except Exception:
+                        pass
+                drv = None
+            results.put((i, rec))
+    finally:
+        log.info("Ожидание браузера: %s", wait_stats.summary())
+        log.info("Загрузка страниц: %s", load_stats.summary(block_profile))
+        log_city_stats()
+        if drv is not None:
+            try:
+                drv.quit()
+            except Exception:
+                pass
+
+
+def crawl_details_parallel(links: List[str], workers: int, on_record: Callable[[Dict], None],
+                           block_profile: str = DEFAULT_BLOCK_PROFILE):
+    """
+    Разбирает карточки пулом из workers процессов с отдельным Chrome в каждом.
+    Каждая запись передаётся в on_record сразу, как только воркер её вернул;
+    порядок итогового каталога задаёт сортировка в write_catalog.
+    """
+    ctx = mp.get_context()
+    tasks, results, start_lock = ctx.Queue(), ctx.Queue(), ctx.Lock()
+    for item in enumerate(links):
+        tasks.put(item)
+    for _ in range(workers):
+        tasks.put(None)
+
+    procs = [
+        ctx.Process(target=_detail_worker, args=(tasks, results, start_lock, block_profile), name=f"worker-{n + 1}")
+        for n in range(workers)
+    ]
+    for p in procs:
+        p.start()
+
+    received = [False] * len(links)
+    done = ok = fail = 0
+    while done < len(links):
+        try:
+            i, rec = results.get(timeout=10)
+        except Empty:
+            if not any(p.is_alive() for p in procs):
+                log.error("Все воркеры завершились, не обработано карточек: %d", len(links) - done)
+                break
+            continue
+        received[i] = True
+        on_record(rec)
+        done += 1
+        if rec.get("title"):
+            ok += 1
+        else:
+            fail += 1
+        log.info("ОБРАБОТАНО [%d/%d] ok=%d fail=%d", done, len(links), ok, fail)
+
+    for p in procs:
+        p.join(timeout=30)
+        if p.is_alive():
+            p.terminate()
+
+    for i, url in enumerate(links):
+        if not received[i]:
+            on_record(empty_record(url))
+
+
+def crawl_details_browser(links: List[str], workers: int, on_record: Callable[[Dict], None], drv=None,
+                          block_profile: str = DEFAULT_BLOCK_PROFILE):
+    """Разбор карточек через Selenium: в текущем браузере или пулом воркеров."""
+    if workers > 1:
+        if drv is not None:
+            # Лента уже собрана — освобождаем этот браузер до запуска воркеров
+            drv.quit()
+        crawl_details_parallel(links, workers, on_record, block_profile)
+        return
+
+    if drv is None:
+        drv = driver_build(block_profile)
+    ok = fail = 0
+    for i, url in enumerate(links, 1):
+        drv, rec = parse_detail_with_restart(drv, url)
+        if rec.get("title"):
+            ok += 1
+        else:
+            fail += 1
+        on_record(rec)
+        log.info("ОБРАБОТАНО [%d/%d] ok=%d fail=%d", i, len(links), ok, fail)
+    drv.quit()
+    log.info("Ожидание браузера: %s", wait_stats.summary())
+    log.info("Загрузка страниц: %s", load_stats.summary(block_profile))
+    log_city_stats()
+
+
+async def _fetch_pages(urls: List[str], concurrency: int, timeout: float,
+                       on_page: Callable[[str, Optional[str]], None]):
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, headers=HTTP_HEADERS, timeout=client_timeout) as session:
+        async def fetch_one(url: str):
+            html = None
+            try:
+                async with session.get(url) as resp:
+                    if resp.status != 200:
+                        log.warning("HTTP %d для %s", resp.status, url)
+                    else:
+                        html = await resp.text()
+            except Exception as e:
+                log.warning("HTTP-ошибка для %s: %s", url, e)
+            on_page(url, html)
+
+        await asyncio.gather(*(fetch_one(u) for u in urls))
+
+
+def fetch_pages_http(urls: List[str], on_page: Callable[[str, Optional[str]], None],
+                     concurrency: int = 8, timeout: float = 30.0):
+    """
+    Скачивает страницы общим пулом соединений aiohttp и отдаёт каждую в
+    on_page(url, html) по мере готовности (html=None — запрос не удался),
+    не держа в памяти весь набор страниц.
+    """
+    asyncio.run(_fetch_pages(urls, concurrency, timeout, on_page))
+
+
+def has_required_fields(rec: Dict) -> bool:
+    return all(rec.get(k) for k in REQUIRED_FIELDS)
+
+
+def load_saved_pages(html_dir: str) -> Dict[str, str]:
+    """
+    Сохранённые страницы карточек для офлайн-прогона: файл <id>.html
+    соответствует https://dobro.ru/event/<id>.
+    """
+    pages = {}
+    for path in sorted(Path(html_dir).glob("*.html")):
+        url = f"https://dobro.ru/event/{path.stem}" if path.stem.isdigit() else path.resolve().as_uri()
+        pages[url] = path.read_text(encoding="utf-8")
+    return pages
+
+
+def crawl_details(links: List[str], *, workers: int = 1, use_http: bool = True,
+                  http_concurrency: int = 8, drv=None, block_profile: str = DEFAULT_BLOCK_PROFILE,
+                  on_record: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Сначала пробует взять карточки простым HTTP-запросом, браузером открывает
+    только те, где не хватило обязательных полей.
+    Если задан on_record, записи отдаются в него по одной и не накапливаются
+    (возвращается пустой список), иначе возвращается список всех записей.
+    """
+    collected: List[Dict] = []
+    emit = on_record or collected.append
+
+    todo = list(links)
+    if use_http:
+        t0 = time.perf_counter()
+        need_browser = []
+
+        def on_page(url: str, html: Optional[str]):
+            rec = extract_from_detail(html, url) if html else None
+            if rec and has_required_fields(rec):
+                emit(rec)
+            else:
+                need_browser.append(url)
+
+        fetch_pages_http(links, on_page, concurrency=http_concurrency)
+        log.info("HTTP: %d/%d карточек разобрано без браузера за %.1fs",
+                 len(links) - len(need_browser), len(links), time.perf_counter() - t0)
+        order = {u: i for i, u in enumerate(links)}
+        todo = sorted(need_browser, key=order.__getitem__)
+
+    if todo:
+        log.info("Открываю в браузере: %d карточек", len(todo))
+        crawl_details_browser(todo, workers, emit, drv, block_profile)
+    elif drv is not None:
+        drv.quit()
+    return collected
+
+
+def write_catalog(objects: List[Dict], path: str = OUT_JSON) -> List[Dict]:
+    """
+    Сортирует готовые объекты (rec_to_object) по дате/времени/названию и
+    атомарно публикует каталог: пишет во временный файл и подменяет его rename'ом.
+    """
+    data = sorted(
+        objects,
+        key=lambda o: (
+            o["schedule"].get("date") or "9999-12-31",
+            o["schedule"].get("time_start") or "99:99",
+            o.get("title") or "",
+            o.get("url") or ""
+        )
+    )
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return data
+
+
+class CrawlSpool:
+    """
+    Промежуточное состояние обхода в каталоге SPOOL_DIR:
+      plan.json      — ссылки из ленты и список карточек к разбору (пишется один раз при старте);
+      records.ndjson — разобранные записи, по одной JSON-строке, дописываются сразу после разбора.
+    records.ndjson служит и чекпойнтом: при --resume по нему видно, какие ссылки уже обработаны.
+    """
+
+    def __init__(self, directory: str = SPOOL_DIR):
+        self.dir = Path(directory)
+        self.plan_path = self.dir / "plan.json"
+        self.records_path = self.dir / "records.ndjson"
+        self._fh = None
+
+    def start(self, links: List[str], to_parse: List[str], incremental: bool):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        plan = {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "incremental": incremental,
+            "links": links,
+            "to_parse": to_parse,
+        }
+        tmp = self.plan_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(plan, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.plan_path)
+        self.records_path.write_text("", encoding="utf-8")
+
+    def load_plan(self) -> Optional[Dict]:
+        try:
+            return json.loads(self.plan_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def records(self) -> List[Dict]:
+        out = []
+        try:
+            with open(self.records_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        out.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Недописанная строка после падения — эту карточку разберём заново
+                        log.warning("Пропускаю повреждённую строку в %s", self.records_path)
+        except OSError:
+            pass
+        return out
+
+    def processed_urls(self) -> set:
+        return {r["url"] for r in self.records() if r.get("url")}
+
+    def append(self, rec: Dict):
+        if self._fh is None:
+            self._fh = open(self.records_path, "a", encoding="utf-8")
+        self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._fh.flush()
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def clear(self):
+        self.close()
+        for p in (self.records_path, self.plan_path):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def event_id(url: str) -> str:
+    m = EVENT_ID_RX.search(url or "")
+    return m.group(1) if m else (url or "").split("?")[0]
+
+
+def object_hash(obj: Dict) -> str:
+    return hashlib.sha1(json.dumps(obj, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_catalog(path: str) -> Dict[str, Dict]:
+    """Предыдущий каталог по id события; пустой, если файла ещё нет."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return {event_id(o.get("url")): o for o in data if o.get("url")}
+
+
+def event_expired(obj: Dict, today: date) -> bool:
+    sch = obj.get("schedule") or {}
+    end = sch.get("date_end")
+    if not end:
+        # Каталоги, записанные до появления date_end
+        _, end = ru_date_range_to_iso(sch.get("datetime_raw") or "")
+        end = end or sch.get("date")
+    return bool(end) and end < today.isoformat()
+
+
+def refresh_slice(ids: List[str], days: int, today: date) -> List[str]:
+    """
+    Часть уже известных событий, которую перепроверяем сегодня: каждое событие
+    попадает в свой день по хэшу id, так что за days дней обновляется весь каталог.
+    """
+    if days <= 1:
+        return list(ids)
+    bucket = today.toordinal() % days
+    return [i for i in ids if int(hashlib.sha1(i.encode()).hexdigest(), 16) % days == bucket]
+
+
+def merge_incremental(links: List[str], prev: Dict[str, Dict], fresh: Dict[str, Dict],
+                      today: date) -> Tuple[List[Dict], Dict]:
+    """
+    Собирает новый каталог из ленты: свежеразобранные записи + прошлые версии
+    остальных событий. Возвращает (objects, diff).
+    """
+    objects, added, changed, expired = [], [], [], []
+    seen = set()
+    for url in links:
+        eid = event_id(url)
+        if eid in seen:
+            continue
+        seen.add(eid)
+        obj = fresh.get(eid) or prev.get(eid)
+        if obj is None:
+            continue
+        if event_expired(obj, today):
+            expired.append(eid)
+            continue
+        if eid not in prev:
+            added.append(eid)
+        elif eid in fresh and object_hash(fresh[eid]) != object_hash(prev[eid]):
+            changed.append(eid)
+        objects.append(obj)
+
+    removed = sorted(set(prev) - seen) + [e for e in expired if e in prev]
+    diff = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+    }
+    return objects, diff
+
+
 def empty_to_none(x):
     if x is None:
         return None
@@ -541,11 +1299,13 @@ def empty_to_none(x):
 
 
 def rec_to_object(rec: Dict) -> Dict:
+    lat, lon = city_point(empty_to_none(rec.get("city")), empty_to_none(rec.get("region")))
     return {
         "title": empty_to_none(rec.get("title")),
         "url": empty_to_none(rec.get("url")),
         "schedule": {
             "date": empty_to_none(rec.get("date_iso")),
+            "date_end": empty_to_none(rec.get("date_end") or rec.get("date_iso")),
             "time_start": empty_to_none(rec.get("time_start")),
             "time_end": empty_to_none(rec.get("time_end")),
             "datetime_raw": empty_to_none(rec.get("datetime_raw")),
@@ -554,6 +1314,8 @@ def rec_to_object(rec: Dict) -> Dict:
             "address_full": empty_to_none(rec.get("address_full")),
             "city": empty_to_none(rec.get("city")),
             "region": empty_to_none(rec.get("region")),
+            "lat": lat,
+            "lon": lon,
         },
         "organizer": {
             "name": empty_to_none(rec.get("organizer_name")),
@@ -566,58 +1328,233 @@ def rec_to_object(rec: Dict) -> Dict:
             "vk": empty_to_none(rec.get("contact_vk")),
         },
         "description": empty_to_none(rec.get("description")),
+        # Теги по ключевым словам: бот отбирает по ним без запросов к LLM
+        "categories": categorize(rec.get("title"), rec.get("description")),
     }
 
 
+def finalize_crawl(spool: CrawlSpool, links: List[str], incremental: bool, out: str,
+                   publish_dir: Optional[str] = None) -> List[Dict]:
+    """
+    Собирает каталог из спула: сортирует, атомарно публикует out и,
+    в инкрементальном режиме, пишет diff. С publish_dir дополнительно выкладывает
+    версионный снимок, который подхватит работающий бот (catalog.Catalog).
+    После успешной публикации спул удаляется.
+    """
+    spool.close()
+    # Если карточку разобрали дважды (повтор после падения), берём последнюю версию
+    events = list({r["url"]: r for r in spool.records()}.values())
+
+    diff = None
+    if incremental:
+        # Неудачный разбор не должен затирать прошлую версию события
+        fresh = {event_id(r["url"]): rec_to_object(r) for r in events if r.get("title")}
+        objects, diff = merge_incremental(links, load_catalog(out), fresh, date.today())
+    else:
+        objects = [rec_to_object(r) for r in events]
+
+    data = write_catalog(objects, out)
+    if publish_dir:
+        publish_snapshot(data, publish_dir)
+    if diff is not None:
+        with open(DIFF_JSON, "w", encoding="utf-8") as f:
+            json.dump(diff, f, ensure_ascii=False, indent=2)
+        log.info("Изменения: добавлено %d, изменено %d, удалено %d (%s)",
+                 len(diff["added"]), len(diff["changed"]), len(diff["removed"]), DIFF_JSON)
+    spool.clear()
+    return data
+
+
+SCHEDULE_INTERVAL_RX = re.compile(r"^(\d+)\s*([mhd])$")
+SCHEDULE_TIMES_RX = re.compile(r"^\d{1,2}:\d{2}(?:\s*,\s*\d{1,2}:\d{2})*$")
+SCHEDULE_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def next_run(spec: str, last_start: datetime, now: datetime) -> datetime:
+    """
+    Время следующего обхода по расписанию:
+      «6h», «30m», «1d»  — интервал от начала прошлого обхода;
+      «03:00,15:00»      — ежедневно в указанное время.
+    """
+    spec = spec.strip().lower()
+    m = SCHEDULE_INTERVAL_RX.match(spec)
+    if m:
+        return max(last_start + timedelta(**{SCHEDULE_UNITS[m.group(2)]: int(m.group(1))}), now)
+    if SCHEDULE_TIMES_RX.match(spec):
+        slots = sorted(
+            datetime.strptime(t.strip(), "%H:%M").time() for t in spec.split(",")
+        )
+        for day in (now.date(), now.date() + timedelta(days=1)):
+            for t in slots:
+                candidate = datetime.combine(day, t)
+                if candidate > now:
+                    return candidate
+    raise ValueError(f"непонятное расписание: {spec!r} (примеры: 6h, 30m, 03:00,15:00)")
+
+
+def run_scheduler(spec: str, child_args: List[str]):
+    """
+    Демон: по расписанию запускает инкрементальный обход отдельным процессом
+    (упавший Chrome или утечка памяти не копятся между запусками) и
+    публикует снимок каталога. Прерванный обход продолжается через --resume.
+    """
+    next_run(spec, datetime.now(), datetime.now())  # проверяем расписание до первого запуска
+    log.info("Планировщик запущен: %s", spec)
+    while True:
+        started = datetime.now()
+        cmd = [sys.executable, os.path.abspath(__file__), *child_args]
+        if CrawlSpool().load_plan():
+            cmd.append("--resume")
+        log.info("Плановый обход: %s", " ".join(cmd[2:]))
+        try:
+            rc = subprocess.run(cmd).returncode
+        except OSError as e:
+            log.error("Не удалось запустить обход: %s", e)
+            rc = -1
+        took = (datetime.now() - started).total_seconds()
+        if rc == 0:
+            log.info("Плановый обход завершён за %.0fs", took)
+        else:
+            log.error("Плановый обход завершился с кодом %s за %.0fs", rc, took)
+
+        when = next_run(spec, started, datetime.now())
+        log.info("Следующий обход: %s", when.strftime("%Y-%m-%d %H:%M"))
+        time.sleep(max(0.0, (when - datetime.now()).total_seconds()))
+
+
 def main():
-    try:
-        drv = driver_build()
-    except Exception as e:
-        log.critical("Браузер не стартовал: %s", e)
+    ap = argparse.ArgumentParser(description="Парсер мероприятий dobro.mail.ru")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="число параллельных браузеров для разбора карточек")
+    ap.add_argument("--no-http", action="store_true",
+                    help="не пробовать HTTP, открывать все карточки в браузере")
+    ap.add_argument("--http-concurrency", type=int, default=8,
+                    help="число одновременных HTTP-запросов к карточкам")
+    ap.add_argument("--html-dir",
+                    help="офлайн: разобрать сохранённые страницы карточек (<id>.html) без сети и браузера")
+    ap.add_argument("--out", default=OUT_JSON, help="куда записать каталог")
+    ap.add_argument("--incremental", action="store_true",
+                    help="разбирать только новые события и часть известных, остальное взять из прошлого каталога")
+    ap.add_argument("--refresh-days", type=int, default=7,
+                    help="инкрементальный режим: за сколько дней по кругу перепроверяются все известные события")
+    ap.add_argument("--block", choices=list(BLOCK_PROFILES), default=DEFAULT_BLOCK_PROFILE,
+                    help="какие ресурсы не загружать в Chrome: off — ничего, media — картинки, шрифты и видео, "
+                         "strict — ещё и счётчики/реклама")
+    ap.add_argument("--compare-block", nargs="+", metavar="URL",
+                    help="замерить трафик и время загрузки этих карточек под всеми профилями блокировки и выйти")
+    ap.add_argument("--publish", nargs="?", const=CATALOG_DIR, metavar="DIR",
+                    help=f"выложить результат версионным снимком в DIR (по умолчанию {CATALOG_DIR}) — "
+                         "бот подхватит его без перезапуска")
+    ap.add_argument("--schedule", metavar="SPEC",
+                    help="режим демона: инкрементальный обход с публикацией по расписанию "
+                         "(6h, 30m, 1d или 03:00,15:00)")
+    ap.add_argument("--append-log", action="store_true", help=f"дописывать {LOG_FILE}, а не перезаписывать")
+    ap.add_argument("--resume", action="store_true",
+                    help=f"продолжить прерванный обход из {SPOOL_DIR}, не собирая ленту заново")
+    args = ap.parse_args()
+
+    setup_logging("a" if args.resume or args.append_log or args.schedule else "w")
+
+    if args.schedule:
+        child_args = [
+            "--incremental", "--append-log",
+            "--publish", args.publish or CATALOG_DIR,
+            "--out", args.out,
+            "--workers", str(args.workers),
+            "--http-concurrency", str(args.http_concurrency),
+            "--refresh-days", str(args.refresh_days),
+            "--block", args.block,
+        ]
+        if args.no_http:
+            child_args.append("--no-http")
+        run_scheduler(args.schedule, child_args)
         return
 
-    log.info("Открываю ленту: %s", BASE_URL)
-    drv.get(BASE_URL)
-    wait_ready(drv, 60)
-    time.sleep(1.0)
-
-    click_show_more_until_end(drv)
-    links = collect_detail_links_from_feed(drv.page_source or "")
-    if not links:
-        log.error("Ссылок «Подробнее» не найдено. Проверьте верстку/тексты.")
-        drv.quit()
+    if args.compare_block:
+        compare_block_profiles(args.compare_block, list(BLOCK_PROFILES))
         return
 
-    events: List[Dict] = []
-    ok = fail = 0
+    if args.html_dir:
+        pages = load_saved_pages(args.html_dir)
+        events = [extract_from_detail(html, url) for url, html in pages.items()]
+        for rec in events:
+            if not has_required_fields(rec):
+                missing = [k for k in REQUIRED_FIELDS if not rec.get(k)]
+                log.warning("Не хватает полей %s: %s", ", ".join(missing), rec["url"])
+        log_city_stats()
+        data = write_catalog([rec_to_object(r) for r in events], args.out)
+        print(f"Готово: {args.out} ({len(data)} записей)")
+        return
 
-    for i, url in enumerate(links, 1):
-        rec = parse_detail(drv, url)
-        if rec.get("title"):
-            ok += 1
-        else:
-            fail += 1
-        events.append(rec)
-        log.info("ОБРАБОТАНО [%d/%d] ok=%d fail=%d", i, len(links), ok, fail)
+    spool = CrawlSpool()
+    drv = None
+    if args.resume:
+        plan = spool.load_plan()
+        if not plan:
+            log.error("Нечего продолжать: нет %s", spool.plan_path)
+            return
+        links, incremental = plan["links"], plan["incremental"]
+        done = spool.processed_urls()
+        to_parse = [u for u in plan["to_parse"] if u not in done]
+        log.info("Продолжаю обход от %s: готово %d, осталось %d",
+                 plan["started_at"], len(done), len(to_parse))
+    else:
+        try:
+            drv = driver_build(args.block)
+        except Exception as e:
+            log.critical("Браузер не стартовал: %s", e)
+            return
 
-    drv.quit()
-    log.info("Парсинг завершён. Всего записей: %d", len(events))
-    events_sorted = sorted(
-        events,
-        key=lambda r: (
-            r.get("date_iso") or "9999-12-31",
-            r.get("time_start") or "99:99",
-            r.get("title") or ""
+        log.info("Открываю ленту: %s", BASE_URL)
+        drv.get(BASE_URL)
+        wait_ready(drv, 60)
+        try:
+            wait_until(drv, EC.presence_of_element_located((By.XPATH, "//a[contains(.,'Подробнее')]")), 20)
+        except TimeoutException:
+            log.warning("Карточки в ленте не появились за 20s")
+
+        click_show_more_until_end(drv)
+        links = collect_detail_links_from_feed(drv.page_source or "")
+        if not links:
+            log.error("Ссылок «Подробнее» не найдено. Проверьте верстку/тексты.")
+            drv.quit()
+            return
+
+        incremental = args.incremental
+        to_parse = links
+        if incremental:
+            prev = load_catalog(args.out)
+            new_links = [u for u in links if event_id(u) not in prev]
+            known = {event_id(u): u for u in links if event_id(u) in prev}
+            refresh = [known[i] for i in refresh_slice(list(known), args.refresh_days, date.today())]
+            to_parse = new_links + refresh
+            log.info("Инкрементальный режим: в ленте %d, новых %d, перепроверяю %d из %d известных",
+                     len(links), len(new_links), len(refresh), len(known))
+        spool.start(links, to_parse, incremental)
+
+    t0 = time.perf_counter()
+    try:
+        crawl_details(
+            to_parse,
+            workers=args.workers,
+            use_http=not args.no_http,
+            http_concurrency=args.http_concurrency,
+            drv=drv,
+            block_profile=args.block,
+            on_record=spool.append,
         )
-    )
+    finally:
+        spool.close()
 
-    data = [rec_to_object(r) for r in events_sorted]
+    elapsed = time.perf_counter() - t0
+    log.info("Парсинг завершён. Разобрано карточек: %d за %.0fs (%.2f стр/с, воркеров: %d)",
+             len(to_parse), elapsed, len(to_parse) / elapsed if elapsed else 0.0, max(args.workers, 1))
 
-    with open(OUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=False)
+    log_city_stats()
+    data = finalize_crawl(spool, links, incremental, args.out, args.publish)
 
-    print(f"Готово: {OUT_JSON} ({len(data)} записей)")
-    log.info("ГОТОВО: %s (%d записей)", OUT_JSON, len(data))
+    print(f"Готово: {args.out} ({len(data)} записей)")
+    log.info("ГОТОВО: %s (%d записей)", args.out, len(data))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+# doc_cache.py
+import json
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import xxhash
+from PIL import Image
+
+# 64-битный dHash режем на 4 полосы по 16 бит: если расстояние Хэмминга ≤ 3,
+# хотя бы одна полоса совпадает точно, и кандидатов можно искать по индексу.
+BANDS = 4
+BAND_BITS = 16
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def content_hash(raw: bytes) -> str:
+    return xxhash.xxh3_128_hexdigest(raw)
+
+
+def perceptual_hash(raw: bytes) -> int:
+    """dHash 8x8: сравнение соседних пикселей уменьшенной серой копии."""
+    img = Image.open(BytesIO(raw))
+    img.draft("L", (64, 64))
+    img = img.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    px = img.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return value
+
+
+def _to_signed(v: int) -> int:
+    # SQLite INTEGER — знаковое 64-битное
+    return v - (1 << 64) if v >= (1 << 63) else v
+
+
+def _to_unsigned(v: int) -> int:
+    return v + (1 << 64) if v < 0 else v
+
+
+def _bands(phash: int) -> List[int]:
+    return [(phash >> (i * BAND_BITS)) & BAND_MASK for i in range(BANDS)]
+
+
+class VerificationCache:
+    """
+    Кэш вердиктов проверки документов.
+
+    Вердикт переиспользуется только при точном совпадении xxh3-хэша содержимого:
+    похожие, но разные документы (например, сертификаты одного шаблона с разными
+    именами) должны проверяться заново. Близкий dHash используется лишь для того,
+    чтобы пометить возможный дубликат (пересжатая или обрезанная копия).
+    Вердикты вытесняются по времени последнего обращения; история засчитанных
+    документов (submissions) хранится всегда.
+    """
+
+    def __init__(self, path: str = "data/vision_cache.db", *, max_entries: int = 10000, max_distance: int = 3):
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._max_distance = max_distance
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS verdicts (
+                content_hash TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_hit_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS verdicts_last_hit ON verdicts(last_hit_at);
+
+            CREATE TABLE IF NOT EXISTS submissions (
+                content_hash TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                phash INTEGER NOT NULL,
+                band0 INTEGER NOT NULL,
+                band1 INTEGER NOT NULL,
+                band2 INTEGER NOT NULL,
+                band3 INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, user_id)
+            );
+            CREATE INDEX IF NOT EXISTS submissions_band0 ON submissions(band0);
+            CREATE INDEX IF NOT EXISTS submissions_band1 ON submissions(band1);
+            CREATE INDEX IF NOT EXISTS submissions_band2 ON submissions(band2);
+            CREATE INDEX IF NOT EXISTS submissions_band3 ON submissions(band3);
+            """
+        )
+        self._conn.commit()
+
+    def get(self, chash: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM verdicts WHERE content_hash = ?", (chash,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE verdicts SET last_hit_at = ?, hits = hits + 1 WHERE content_hash = ?",
+                (time.time(), chash),
+            )
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def put(self, chash: str, result: Dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (content_hash, result, created_at, last_hit_at) "
+                "VALUES (?, ?, ?, ?)",
+                (chash, json.dumps(result, ensure_ascii=False), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def find_submissions(self, chash: str, phash: int, user_id: Optional[str]) -> Dict:
+        """
+        Кто уже получил очки за этот документ (только чтение, ничего не записывает):
+        {"already_sent": bool, "other_users": [...], "similar_users": [...]}.
+        other_users — точные копии, similar_users — близкие по dHash.
+        """
+        uid = str(user_id) if user_id is not None else None
+        with self._lock:
+            exact = [
+                r[0] for r in self._conn.execute(
+                    "SELECT user_id FROM submissions WHERE content_hash = ? ORDER BY created_at", (chash,)
+                )
+            ]
+            similar = []
+            for other_hash, other_user, other_phash in self._conn.execute(
+                "SELECT content_hash, user_id, phash FROM submissions "
+                "WHERE band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?",
+                _bands(phash),
+            ):
+                if other_hash == chash:
+                    continue
+                if (_to_unsigned(other_phash) ^ phash).bit_count() <= self._max_distance:
+                    similar.append(other_user)
+
+        return {
+            "already_sent": uid is not None and uid in exact,
+            "other_users": [u for u in exact if u != uid],
+            "similar_users": sorted({u for u in similar if u != uid}),
+        }
+
+    def record_submission(self, chash: str, phash: int, user_id) -> bool:
+        """
+        Отмечает документ засчитанным пользователю. Вызывается, только когда
+        очки действительно начислены: отказ или таймаут не мешают прислать
+        тот же файл ещё раз. False — эти байты уже
+        засчитаны (этому или другому пользователю), очки начислять нельзя.
+        """
+        with self._lock:
+            if self._conn.execute(
+                "SELECT 1 FROM submissions WHERE content_hash = ? LIMIT 1", (chash,)
+            ).fetchone():
+                return False
+            self._conn.execute(
+                "INSERT INTO submissions "
+                "(content_hash, user_id, phash, band0, band1, band2, band3, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (chash, str(user_id), _to_signed(phash), *_bands(phash), time.time()),
+            )
+            self._conn.commit()
+        return True
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()
+        extra = count - self._max_entries
+        if extra > 0:
+            self._conn.execute(
+                "DELETE FROM verdicts WHERE content_hash IN "
+                "(SELECT content_hash FROM verdicts ORDER BY last_hit_at LIMIT ?)",
+                (extra,),
+            )
@@ -0,0 +1,312 @@
+# events_api.py
+import base64
+import gzip
+import json
+import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, time as dtime
+from typing import Dict, List, Optional, Set, Tuple
+
+import xxhash
+
+from catalog import city_matches, event_bounds, occurs_within
+from categories import BY_NAME, CATEGORIES, event_categories
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаём gzip
+    brotli = None
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+SUMMARY_CHARS = 240
+# Сколько разных ответов (набор фильтров × страница) держать на одну версию каталога
+RESPONSE_CACHE_SIZE = 512
+# Ответы сжимаются на лету для каждого нового набора фильтров: уровни — компромисс
+# скорости и размера, максимальное сжатие — только у статики (build_assets.py)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+EVENT_ID_RX = re.compile(r"/event/(\d+)")
+
+
+class BadRequest(ValueError):
+    """Неверные параметры запроса — отдаётся клиенту как 400."""
+
+
+def _event_id(url: str) -> str:
+    m = EVENT_ID_RX.search(url or "")
+    return m.group(1) if m else xxhash.xxh3_64_hexdigest((url or "").encode("utf-8"))
+
+
+def _public_event(ev: Dict, bounds: Tuple[datetime, datetime]) -> Dict:
+    sch = ev.get("schedule") or {}
+    loc = ev.get("location") or {}
+    org = ev.get("organizer") or {}
+    description = (ev.get("description") or "").strip()
+    if len(description) > SUMMARY_CHARS:
+        description = description[:SUMMARY_CHARS].rsplit(" ", 1)[0] + "…"
+    return {
+        "id": _event_id(ev.get("url")),
+        "title": ev.get("title"),
+        "url": ev.get("url"),
+        "date": bounds[0].date().isoformat(),
+        "date_end": bounds[1].date().isoformat(),
+        "time_start": sch.get("time_start"),
+        "time_end": sch.get("time_end"),
+        "city": loc.get("city"),
+        "address": loc.get("address_full"),
+        "lat": loc.get("lat"),
+        "lon": loc.get("lon"),
+        "organizer": org.get("name"),
+        "categories": event_categories(ev),
+        "summary": description or None,
+    }
+
+
+def _parse_date(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m-%d")
+    except ValueError:
+        raise BadRequest(f"{name}: ожидается дата YYYY-MM-DD")
+
+
+def encode_cursor(key: Tuple[str, str]) -> str:
+    return base64.urlsafe_b64encode(f"{key[0]}|{key[1]}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        start, event_id = raw.split("|", 1)
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest("cursor: неверный курсор")
+    return start, event_id
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """Кодировки из заголовка Accept-Encoding, кроме явно запрещённых (q=0)."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, q = part.partition(";")
+        q = q.strip().lower()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        if name.strip():
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class Encoded:
+    """Готовый ответ: тело в нескольких кодировках и строгий ETag на каждую."""
+
+    def __init__(self, bodies: Dict[str, Tuple[bytes, str]]):
+        # Байты зависят от кодировки — у каждой свой строгий ETag
+        self.bodies = bodies
+
+    @classmethod
+    def from_payload(cls, payload: Dict, tag: str) -> "Encoded":
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        bodies = {
+            "identity": (body, f'"{tag}"'),
+            "gzip": (gzip.compress(body, GZIP_LEVEL, mtime=0), f'"{tag}-gz"'),
+        }
+        if brotli is not None:
+            bodies["br"] = (brotli.compress(body, quality=BROTLI_QUALITY), f'"{tag}-br"')
+        return cls(bodies)
+
+    def pick(self, accept_encoding: str) -> Tuple[str, bytes, str]:
+        """(кодировка, тело, ETag) по заголовку Accept-Encoding."""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.bodies:
+                return (encoding, *self.bodies[encoding])
+        return ("identity", *self.bodies["identity"])
+
+
+class _Snapshot:
+    def __init__(self, events: List[Dict]):
+        rows = []
+        for ev in events:
+            bounds = event_bounds(ev)
+            if bounds is None:
+                continue
+            item = _public_event(ev, bounds)
+            key = (bounds[0].strftime("%Y-%m-%dT%H:%M"), item["id"])
+            rows.append((key, bounds, item))
+        rows.sort(key=lambda r: r[0])
+        self.keys = [r[0] for r in rows]
+        self.rows = rows
+        # Версия — по содержимому: правка data/events.json без смены имени тоже её меняет
+        self.version = xxhash.xxh3_64_hexdigest(
+            json.dumps([r[2] for r in rows], ensure_ascii=False, sort_keys=True).encode("utf-8")
+        )
+        self.cache: "OrderedDict[Tuple, Encoded]" = OrderedDict()
+        self.lock = threading.Lock()
+
+
+class EventFeed:
+    """
+    Данные для /api/events и /api/categories из снимка каталога в памяти.
+
+    На каждую версию каталога (load — слушатель catalog.Catalog) события
+    один раз приводятся к публичному виду и сортируются по (начало, id).
+    Ответы кодируются в JSON, gzip и brotli один раз на версию и набор
+    параметров: список категорий и первая страница без фильтров — сразу
+    при загрузке, остальное — при первом запросе, с вытеснением LRU.
+    ETag строгий и зависит от версии каталога, параметров и кодировки,
+    поэтому повторный запрос с If-None-Match отвечается 304 без тела.
+    Курсор — ключ последнего события страницы, а не смещение: страницы
+    не «съезжают», даже если между запросами вышла новая версия.
+    """
+
+    def __init__(self, events: Optional[List[Dict]] = None):
+        self._snapshot = _Snapshot([])
+        if events is not None:
+            self.load(events)
+
+    @property
+    def version(self) -> str:
+        return self._snapshot.version
+
+    def __len__(self):
+        return len(self._snapshot.rows)
+
+    def load(self, events: List[Dict]):
+        snap = _Snapshot(events)
+        self._render(snap, ("categories",), lambda: self._categories_payload(snap))
+        self._render(snap, self._events_key({}), lambda: self._events_payload(snap, {}))
+        self._snapshot = snap
+
+    # --- параметры запроса ------------------------------------------------
+
+    @staticmethod
+    def parse_events_query(query) -> Dict:
+        """query (MultiDict или dict) → нормализованные фильтры; BadRequest при ошибке."""
+        params: Dict = {}
+        city = (query.get("city") or "").strip()
+        if city:
+            params["city"] = city.lower()
+        date_from = _parse_date(query.get("date_from"), "date_from")
+        date_to = _parse_date(query.get("date_to"), "date_to")
+        if date_from and date_to and date_to < date_from:
+            raise BadRequest("date_to раньше date_from")
+        if date_from:
+            params["date_from"] = date_from.date().isoformat()
+        if date_to:
+            params["date_to"] = date_to.date().isoformat()
+        raw_categories = query.get("category") or ""
+        if raw_categories:
+            names = []
+            for name in raw_categories.split(","):
+                name = name.strip()
+                found = BY_NAME.get(name) or next((c for c in CATEGORIES if c.slug == name), None)
+                if found is None:
+                    raise BadRequest(f"category: неизвестная категория {name!r}")
+                if found.name not in names:
+                    names.append(found.name)
+            params["category"] = tuple(sorted(names))
+        try:
+            limit = int(query.get("limit") or DEFAULT_LIMIT)
+        except ValueError:
+            raise BadRequest("limit: ожидается число")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise BadRequest(f"limit: от 1 до {MAX_LIMIT}")
+        if limit != DEFAULT_LIMIT:
+            params["limit"] = limit
+        cursor = query.get("cursor")
+        if cursor:
+            params["cursor"] = decode_cursor(cursor)
+        return params
+
+    @staticmethod
+    def _events_key(params: Dict) -> Tuple:
+        return ("events",) + tuple(sorted(params.items()))
+
+    # --- ответы -----------------------------------------------------------
+
+    def events(self, params: Dict) -> Encoded:
+        snap = self._snapshot
+        return self._render(snap, self._events_key(params), lambda: self._events_payload(snap, params))
+
+    def categories(self) -> Encoded:
+        snap = self._snapshot
+        return self._render(snap, ("categories",), lambda: self._categories_payload(snap))
+
+    # Готовый ответ из кэша без сборки: при промахе (None) events()/categories()
+    # стоит вызывать в пуле потоков — сериализация и сжатие занимают миллисекунды
+
+    def cached_events(self, params: Dict) -> Optional[Encoded]:
+        return self._cached(self._snapshot, self._events_key(params))
+
+    def cached_categories(self) -> Optional[Encoded]:
+        return self._cached(self._snapshot, ("categories",))
+
+    @staticmethod
+    def _cached(snap: _Snapshot, key: Tuple) -> Optional[Encoded]:
+        with snap.lock:
+            hit = snap.cache.get(key)
+            if hit is not None:
+                snap.cache.move_to_end(key)
+            return hit
+
+    @staticmethod
+    def _render(snap: _Snapshot, key: Tuple, build) -> Encoded:
+        hit = EventFeed._cached(snap, key)
+        if hit is not None:
+            return hit
+        tag = f"{snap.version}-{xxhash.xxh3_64_hexdigest(repr(key).encode('utf-8'))}"
+        encoded = Encoded.from_payload(build(), tag)
+        with snap.lock:
+            snap.cache[key] = encoded
+            while len(snap.cache) > RESPONSE_CACHE_SIZE:
+                snap.cache.popitem(last=False)
+        return encoded
+
+    @staticmethod
+    def _categories_payload(snap: _Snapshot) -> Dict:
+        counts: Dict[str, int] = {}
+        for _, _, item in snap.rows:
+            for name in item["categories"]:
+                counts[name] = counts.get(name, 0) + 1
+        return {
+            "version": snap.version,
+            "items": [
+                {"name": c.name, "slug": c.slug, "icon": f"categories/{c.slug}.png", "count": counts.get(c.name, 0)}
+                for c in CATEGORIES
+            ],
+        }
+
+    @staticmethod
+    def _events_payload(snap: _Snapshot, params: Dict) -> Dict:
+        limit = params.get("limit", DEFAULT_LIMIT)
+        city = params.get("city")
+        categories = set(params.get("category") or ())
+        window = None
+        if "date_from" in params or "date_to" in params:
+            start = datetime.strptime(params.get("date_from", "0001-01-01"), "%Y-%m-%d")
+            end = datetime.combine(
+                datetime.strptime(params.get("date_to", "9999-12-31"), "%Y-%m-%d").date(), dtime(23, 59)
+            )
+            window = (start, end)
+
+        pos = bisect_right(snap.keys, params["cursor"]) if "cursor" in params else 0
+        items = []
+        last_key = next_cursor = None
+        for key, bounds, item in snap.rows[pos:]:
+            if window is not None and not occurs_within(bounds, *window):
+                continue
+            if city and not city_matches(city, item["city"], item["address"] or "", "", ""):
+                continue
+            if categories and categories.isdisjoint(item["categories"]):
+                continue
+            if len(items) == limit:
+                next_cursor = encode_cursor(last_key)
+                break
+            items.append(item)
+            last_key = key
+        return {"version": snap.version, "items": items, "next_cursor": next_cursor}
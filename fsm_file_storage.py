@@ -1,7 +1,7 @@
 # fsm_file_storage.py
 import json
 from pathlib import Path
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Tuple, Union
 import threading
 
 class FSMFileStorage:
@@ -37,6 +37,11 @@ class FSMFileStorage:
     def get_data(self, user_id: int) -> Any:
         return self._data.get(user_id, {}).get("data")
 
+    def iter_data(self) -> List[Tuple[int, Any]]:
+        # Снимок под замком, чтобы не упасть на изменении словаря во время обхода
+        with self._lock:
+            return [(user_id, entry.get("data")) for user_id, entry in self._data.items()]
+
     def change_state(self, user_id: int, new_state: Any):
         with self._lock:
             if user_id not in self._data:
@@ -0,0 +1,166 @@
+# image_prep.py
+import time
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# Форматы, которые можно отправить в GigaChat без перекодирования
+PASSTHROUGH_FORMATS = {"JPEG", "PNG"}
+
+# Сигнатуры в начале файла: проверяем до того, как качать и декодировать всё тело
+MAGIC_BYTES = [
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+]
+MAGIC_PROBE_BYTES = 16
+# Бюджет пикселей на загрузку в GigaChat (≈ 2048×2048): ограничение по площади,
+# а не по длинной стороне, — высокий скриншот телефона сохраняет ширину и мелкий текст
+MAX_UPLOAD_PIXELS = 2048 * 2048
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    for magic, fmt in MAGIC_BYTES:
+        if head.startswith(magic):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def check_image_bounds(raw: bytes, max_pixels: int) -> Tuple[str, Tuple[int, int]]:
+    """
+    Читает только заголовок изображения и отсекает «бомбы»: файлы, которые
+    весят немного, но распаковываются в гигантский растр.
+    """
+    img = Image.open(BytesIO(raw))
+    w, h = img.size
+    if w * h > max_pixels:
+        raise ValueError(f"слишком большое разрешение {w}x{h} (> {max_pixels} пикселей)")
+    return img.format or "", img.size
+
+
+def _fit_pixels(size: Tuple[int, int], max_pixels: int) -> Tuple[int, int]:
+    """Размер с теми же пропорциями и площадью не больше max_pixels."""
+    w, h = size
+    ratio = (max_pixels / (w * h)) ** 0.5
+    return max(1, int(w * ratio)), max(1, int(h * ratio))
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode == "RGB":
+        return img
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # Прозрачность кладём на белый фон: JPEG альфа-канал не поддерживает
+        rgba = img.convert("RGBA")
+        bg = Image.new("RGB", rgba.size, (255, 255, 255))
+        bg.paste(rgba, mask=rgba.getchannel("A"))
+        return bg
+    return img.convert("RGB")
+
+
+def prepare_image(
+    raw: bytes,
+    *,
+    max_pixels: int = MAX_UPLOAD_PIXELS,
+    quality: int = 85,
+    image_format: str = "JPEG",
+    passthrough_bytes: int = 1_500_000,
+) -> Tuple[BytesIO, str, Dict]:
+    """
+    Готовит изображение к загрузке в GigaChat:
+      - маленькие JPEG/PNG без EXIF отдаёт как есть;
+      - большие уменьшает до площади не больше max_pixels, сохраняя пропорции
+        (для JPEG декодирование сразу в уменьшенном масштабе через draft);
+      - поворачивает по EXIF и перекодирует в JPEG/WebP без метаданных;
+      - если перекодированный файл не меньше исходного JPEG/PNG без EXIF,
+        отдаёт оригинал (в том числе после уменьшения).
+    Возвращает (file_like, filename, stats).
+    """
+    t0 = time.perf_counter()
+    img = Image.open(BytesIO(raw))
+    src_format = img.format or ""
+    src_size = img.size
+    stats = {
+        "src_format": src_format,
+        "src_size": src_size,
+        "src_bytes": len(raw),
+        "passthrough": False,
+    }
+
+    needs_resize = src_size[0] * src_size[1] > max_pixels
+    has_exif = bool(img.info.get("exif"))
+    if (
+        src_format in PASSTHROUGH_FORMATS
+        and not needs_resize
+        and not has_exif
+        and len(raw) <= passthrough_bytes
+    ):
+        ext = "jpg" if src_format == "JPEG" else "png"
+        out = BytesIO(raw)
+        stats.update(
+            passthrough=True,
+            out_format=src_format,
+            out_size=src_size,
+            out_bytes=len(raw),
+            decode_ms=(time.perf_counter() - t0) * 1000,
+            encode_ms=0.0,
+        )
+        out.name = f"upload.{ext}"
+        return out, out.name, stats
+
+    if needs_resize and src_format == "JPEG":
+        # draft выбирает масштаб DCT (1/2, 1/4, 1/8) не меньше запрошенного размера
+        img.draft("RGB", _fit_pixels(src_size, max_pixels))
+
+    img = ImageOps.exif_transpose(img)
+    if img.size[0] * img.size[1] > max_pixels:
+        # reducing_gap включает быстрый Image.reduce перед финальным ресемплингом
+        img.thumbnail(_fit_pixels(img.size, max_pixels), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    img = _to_rgb(img)
+    t1 = time.perf_counter()
+
+    image_format = image_format.upper()
+    out = BytesIO()
+    if image_format == "WEBP":
+        img.save(out, format="WEBP", quality=quality, method=4)
+        ext = "webp"
+    else:
+        image_format = "JPEG"
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+        ext = "jpg"
+        if src_format == "PNG":
+            # Плоские скриншоты в PNG часто компактнее, чем в JPEG, — оставляем меньший вариант
+            png = BytesIO()
+            img.save(png, format="PNG")
+            if png.tell() < out.tell():
+                out, image_format, ext = png, "PNG", "png"
+    t2 = time.perf_counter()
+
+    out_bytes = out.tell()
+    img_size = img.size
+    if src_format in PASSTHROUGH_FORMATS and not has_exif and out_bytes >= len(raw):
+        # Перекодирование не помогло (например, плоский PNG-скриншот) — отдаём оригинал:
+        # он не тяжелее и читается не хуже уменьшенной копии
+        ext = "jpg" if src_format == "JPEG" else "png"
+        out = BytesIO(raw)
+        image_format = src_format
+        out_bytes = len(raw)
+        img_size = src_size
+        stats["passthrough"] = True
+
+    out.seek(0)
+    out.name = f"upload.{ext}"
+    stats.update(
+        out_format=image_format,
+        out_size=img_size,
+        out_bytes=out_bytes,
+        decode_ms=(t1 - t0) * 1000,
+        encode_ms=(t2 - t1) * 1000,
+    )
+    return out, out.name, stats
@@ -0,0 +1,86 @@
+# leaderboard.py
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Leaderboard:
+    """
+    Рейтинг волонтёров по очкам.
+
+    Хранит отсортированный список пар (-score, user_id), поэтому место пользователя
+    ищется бинарным поиском за O(log n), а обновление очков не требует
+    перечитывать и пересортировывать данные всех пользователей.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores: Dict[int, float] = {}
+        self._names: Dict[int, str] = {}
+        self._order: List[Tuple[float, int]] = []
+
+    @classmethod
+    def from_storage(cls, storage) -> "Leaderboard":
+        board = cls()
+        board.rebuild(storage)
+        return board
+
+    def rebuild(self, storage):
+        """Полностью пересобирает рейтинг из FSM-хранилища (вызывается при старте бота)."""
+        scores: Dict[int, float] = {}
+        names: Dict[int, str] = {}
+        for user_id, data in storage.iter_data():
+            if not isinstance(data, dict):
+                continue
+            score = data.get("score") or 0
+            if score > 0:
+                scores[user_id] = score
+            if data.get("name"):
+                names[user_id] = data["name"]
+
+        with self._lock:
+            self._scores = scores
+            self._names = names
+            self._order = sorted((-s, uid) for uid, s in scores.items())
+
+    def update(self, user_id: int, score: float, name: Optional[str] = None):
+        with self._lock:
+            if name:
+                self._names[user_id] = name
+
+            old = self._scores.pop(user_id, None)
+            if old is not None:
+                i = bisect.bisect_left(self._order, (-old, user_id))
+                if i < len(self._order) and self._order[i] == (-old, user_id):
+                    del self._order[i]
+
+            if score > 0:
+                self._scores[user_id] = score
+                bisect.insort(self._order, (-score, user_id))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """
+        Место пользователя (1 — лучший). Пользователи с одинаковым счётом делят место.
+        None, если у пользователя ещё нет очков.
+        """
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            # (-score,) меньше любой пары (-score, user_id) → число строго лучших результатов
+            return bisect.bisect_left(self._order, (-score,)) + 1
+
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            out = []
+            for neg_score, user_id in self._order[:n]:
+                out.append({
+                    "rank": bisect.bisect_left(self._order, (neg_score,)) + 1,
+                    "user_id": user_id,
+                    "name": self._names.get(user_id),
+                    "score": -neg_score,
+                })
+            return out
+
+    def __len__(self) -> int:
+        return len(self._order)
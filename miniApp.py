@@ -1,14 +1,30 @@
 # uploader.py
+import asyncio
+import json
 import os
-import uuid
 import logging
 from pathlib import Path
+from typing import Optional
 from aiohttp import web
 from urllib.parse import parse_qs
 
+from catalog import CATALOG_DIR, Catalog
+from events_api import BadRequest, Encoded, EventFeed
+from static_assets import DIST_DIR, StaticAssets
+from upload_store import (MAX_FILE_BYTES, USER_MAX_FILES, USER_QUOTA_BYTES, NotAnImage, QuotaExceeded, StoredUpload,
+                          UploadStore, format_size)
+from verify_queue import VERIFY_QUEUE_DB, VerifyQueue
+from webapp_auth import INIT_DATA_MAX_AGE, InvalidInitData, webapp_user_id
+
 # Путь для сохранения файлов (настройте по желанию)
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Запас на заголовки multipart и поле init_data сверх лимита на файл
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Каталог для /api/events: те же снимки, что публикует планировщик парсера
+EVENTS_FALLBACK = "data/events.json"
+# Файлы с хэшем в имени не меняются никогда — кэш на год без перепроверки
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
 
 # HTML-страница mini-app
 HTML_TEMPLATE = '''
@@ -18,6 +34,7 @@ HTML_TEMPLATE = '''
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width, initial-scale=1">
   <title>Загрузка файла</title>
+  <script src="https://st.max.ru/js/max-web-app.js"></script>
   <style>
     body { font-family: -apple-system, BlinkMacSystemFont, sans-serif; padding: 20px; }
     input[type="file"] { width: 100%; margin: 10px 0; }
@@ -27,20 +44,19 @@ HTML_TEMPLATE = '''
 <body>
   <h2>Загрузите файл</h2>
   <form id="uploadForm" enctype="multipart/form-data">
-    <input type="hidden" name="user_id" id="user_id" value="">
+    <input type="hidden" name="init_data" id="init_data" value="">
     <input type="file" name="file" required>
     <button type="submit">Отправить</button>
   </form>
   <div id="status"></div>
 
   <script>
-    // Получаем user_id из URL-параметров
-    const urlParams = new URLSearchParams(window.location.search);
-    const userId = urlParams.get('user_id');
-    if (!userId) {
-      document.body.innerHTML = '<h2>Ошибка: не указан user_id</h2>';
+    // Пользователя сервер определяет по подписанной initData, которую передаёт MAX
+    const initData = window.WebApp && window.WebApp.initData;
+    if (!initData) {
+      document.body.innerHTML = '<h2>Ошибка: откройте страницу как мини-приложение в MAX</h2>';
     } else {
-      document.getElementById('user_id').value = userId;
+      document.getElementById('init_data').value = initData;
     }
 
     document.getElementById('uploadForm').addEventListener('submit', async (e) => {
@@ -73,53 +89,185 @@ routes = web.RouteTableDef()
 
 @routes.get('/')
 async def handle_index(request):
-    user_id = request.query.get('user_id')
-    if not user_id:
-        return web.Response(text="Не указан user_id", status=400)
     return web.Response(text=HTML_TEMPLATE, content_type='text/html')
 
 @routes.post('/upload')
 async def handle_upload(request):
+    store: UploadStore = request.app["upload_store"]
+    if request.content_length and request.content_length > store.max_file_bytes + MULTIPART_OVERHEAD:
+        return web.json_response(
+            {"error": f"Файл больше {format_size(store.max_file_bytes)}"}, status=413
+        )
     try:
         reader = await request.multipart()
         user_id = None
-        file_field = None
+        stored: Optional[StoredUpload] = None
 
         async for part in reader:
-            if part.name == 'user_id':
-                user_id = (await part.read()).decode('utf-8').strip()
+            if part.name == 'init_data':
+                # Поле идёт до файла: неподписанная загрузка отклоняется, не доходя до диска
+                init_data = (await part.read()).decode('utf-8').strip()
+                user_id = webapp_user_id(init_data, request.app["bot_token"],
+                                         max_age=request.app["init_data_max_age"])
             elif part.name == 'file':
-                file_field = part
-
-        if not user_id or not file_field:
-            return web.json_response({"error": "Отсутствует user_id или файл"}, status=400)
-
-        # Генерируем имя: user_id_num
-        num = str(uuid.uuid4().hex[:8])
-        filename = f"{user_id}_{num}"
-        filepath = UPLOAD_DIR / filename
-
-        # Сохраняем файл
-        with open(filepath, 'wb') as f:
-            while True:
-                chunk = await file_field.read_chunk()
-                if not chunk:
+                if not user_id:
                     break
-                f.write(chunk)
+                # Пишем по мере получения: файл целиком в памяти до записи не собирается
+                stored = await store.save(user_id, _iter_chunks(part))
+
+        if not user_id or stored is None:
+            return web.json_response({"error": "Отсутствует init_data или файл"}, status=400)
 
-        logging.info(f"Файл сохранён: {filepath}")
-        return web.json_response({"status": "ok", "filename": filename})
+        logging.info("Файл сохранён: %s (%d байт, пользователь %s%s)",
+                     stored.path, stored.size, user_id, ", повтор" if stored.duplicate else "")
+        queue: Optional[VerifyQueue] = request.app["verify_queue"]
+        job_id = None
+        if queue is not None:
+            # Проверяет и присылает результат бот; если он в этом же процессе,
+            # байты достанутся ему из памяти без повторного чтения с диска
+            job_id = await asyncio.to_thread(
+                queue.enqueue, user_id, source="upload", file_path=stored.path, raw=stored.raw,
+                meta={"digest": stored.digest},
+            )
+        return web.json_response({
+            "status": "ok",
+            "filename": stored.digest,
+            "size": stored.size,
+            "duplicate": stored.duplicate,
+            "queued": job_id is not None,
+            "job_id": job_id,
+        })
 
+    except InvalidInitData as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except QuotaExceeded as e:
+        return web.json_response({"error": str(e)}, status=413)
+    except NotAnImage as e:
+        return web.json_response({"error": str(e)}, status=415)
     except Exception as e:
         logging.exception("Ошибка при загрузке")
         return web.json_response({"error": str(e)}, status=500)
 
-def create_app():
-    app = web.Application()
+
+async def _iter_chunks(part):
+    while True:
+        chunk = await part.read_chunk()
+        if not chunk:
+            break
+        yield chunk
+
+
+def _conditional_response(request, encoded: Encoded, *, content_type: str = "application/json",
+                          cache_control: str = "no-cache") -> web.Response:
+    encoding, body, etag = encoded.pick(request.headers.get("Accept-Encoding", ""))
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        # По умолчанию кэшировать можно, но перед использованием — сверить ETag
+        "Cache-Control": cache_control,
+    }
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        if "*" in tags or etag in tags:
+            return web.Response(status=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    charset = "utf-8" if content_type.startswith("text/") or content_type == "application/json" else None
+    return web.Response(body=body, headers=headers, content_type=content_type, charset=charset)
+
+
+@routes.get('/api/events')
+async def handle_events(request):
+    """
+    События текущей версии каталога.
+    Параметры: city, date_from, date_to (YYYY-MM-DD), category (название
+    или slug, через запятую), limit (до 200), cursor (next_cursor прошлой страницы).
+    """
+    feed: EventFeed = request.app["event_feed"]
+    try:
+        params = EventFeed.parse_events_query(request.query)
+    except BadRequest as e:
+        return web.json_response({"error": str(e)}, status=400)
+    encoded = feed.cached_events(params)
+    if encoded is None:
+        # Промах кэша: сборка JSON и сжатие — в пуле потоков, а не в цикле событий
+        encoded = await asyncio.get_running_loop().run_in_executor(None, feed.events, params)
+    return _conditional_response(request, encoded)
+
+
+@routes.get('/api/categories')
+async def handle_categories(request):
+    feed: EventFeed = request.app["event_feed"]
+    encoded = feed.cached_categories()
+    if encoded is None:
+        encoded = await asyncio.get_running_loop().run_in_executor(None, feed.categories)
+    return _conditional_response(request, encoded)
+
+
+@routes.get('/app')
+async def handle_app(request):
+    return _static_response(request, "index.html")
+
+
+@routes.get('/assets/{name}')
+async def handle_asset(request):
+    return _static_response(request, "assets/" + request.match_info["name"])
+
+
+def _static_response(request, name: str) -> web.Response:
+    found = request.app["static_assets"].get(name)
+    if found is None:
+        raise web.HTTPNotFound()
+    encoded, content_type, immutable = found
+    return _conditional_response(request, encoded, content_type=content_type,
+                                 cache_control=IMMUTABLE_CACHE if immutable else "no-cache")
+
+
+def create_app(catalog: Optional[Catalog] = None, *, bot_token: str, store: Optional[UploadStore] = None,
+               queue: Optional[VerifyQueue] = None, assets: Optional[StaticAssets] = None,
+               init_data_max_age: float = INIT_DATA_MAX_AGE):
+    """
+    bot_token — токен бота MAX: им подписана initData, по которой /upload
+    определяет пользователя. queue — общая с ботом очередь проверки (verify_queue.VerifyQueue);
+    без неё загрузки только сохраняются. assets — собранная build_assets.py
+    статика для /app и /assets/.
+    """
+    store = store or UploadStore(str(UPLOAD_DIR))
+    app = web.Application(client_max_size=store.max_file_bytes + MULTIPART_OVERHEAD)
     app.add_routes(routes)
+    app["upload_store"] = store
+    app["bot_token"] = bot_token
+    app["init_data_max_age"] = init_data_max_age
+    app["verify_queue"] = queue
+    app["static_assets"] = assets or StaticAssets(DIST_DIR)
+    if catalog is None:
+        catalog = Catalog(CATALOG_DIR, fallback=EVENTS_FALLBACK)
+        catalog.watch()
+    feed = EventFeed()
+    # Ответы пересобираются и сжимаются один раз на каждую новую версию каталога
+    catalog.add_listener(feed.load)
+    app["event_feed"] = feed
     return app
 
 # Запуск сервера (для отдельного процесса или совместно с ботом через asyncio)
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    web.run_app(create_app(), host="192.168.1.137", port=8080)
\ No newline at end of file
+
+    with open("cfg.json", "r", encoding="utf-8") as f:
+        data = json.load(f)
+    store = UploadStore(
+        str(UPLOAD_DIR),
+        max_file_bytes=data.get("upload_max_file_bytes", MAX_FILE_BYTES),
+        user_quota_bytes=data.get("upload_user_quota_bytes", USER_QUOTA_BYTES),
+        user_max_files=data.get("upload_user_max_files", USER_MAX_FILES),
+    )
+    store.cleanup_tmp()
+    queue = VerifyQueue(data.get("verify_queue_path", VERIFY_QUEUE_DB))
+    app = create_app(
+        bot_token=data["Token_MAX"],
+        store=store,
+        queue=queue,
+        init_data_max_age=data.get("webapp_init_data_max_age", INIT_DATA_MAX_AGE),
+    )
+    web.run_app(app, host="192.168.1.137", port=8080)
\ No newline at end of file
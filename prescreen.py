@@ -0,0 +1,318 @@
+# prescreen.py
+"""
+Дешёвая локальная предпроверка изображения до запросов к GigaChat.
+
+    python prescreen.py photo.jpg screenshot.png          # признаки и решение
+    python prescreen.py --add-ref dobro1.png dobro2.png   # эталонные скриншоты dobro.ru
+"""
+import argparse
+import json
+import logging
+import re
+import shutil
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps, ImageStat
+
+from image_prep import _to_rgb
+
+try:
+    import pytesseract
+except ImportError:  # OCR необязателен: без него решают только признаки растра
+    pytesseract = None
+
+REFS_PATH = "data/prescreen_refs.json"
+
+REJECT, CANDIDATE, UNSURE = "reject", "candidate", "unsure"
+# Фото без текста набирают 0.1–0.25: ниже порога — только совсем «не документы»
+REJECT_THRESHOLD = 0.1
+ACCEPT_THRESHOLD = 0.75
+
+# Анализ идёт на уменьшенной серой копии: длинная сторона не больше
+ANALYSIS_SIDE = 512
+OCR_SIDE = 1600
+MIN_SIDE = 160
+MAX_ASPECT = 6.0
+# Вытянутые изображения анализируются крупнее: короткая сторона не меньше LONG_SHORT_SIDE,
+# иначе строки длинного скриншота сливаются; длинная сторона — не больше LONG_MAX_SIDE
+LONG_SHORT_SIDE = 256
+LONG_MAX_SIDE = 4096
+# Ниже этого text_lines у вытянутого изображения нет строк текста: баннер или склейка фото
+LONG_MIN_TEXT_LINES = 0.2
+BLANK_STDDEV = 4.0
+MIN_EDGE_DENSITY = 0.003
+EDGE_LEVEL = 32
+# Строка «с текстом», если на ней столько доли пикселей-границ
+INK_ROW = 0.02
+LIGHT_LEVEL = 200
+# Схожесть гистограмм (пересечение, 0..1), при которой снимок похож на эталон dobro.ru
+HIST_MATCH = 0.9
+# Гистограмма HSV: 8×4×4 корзин на каждую из трёх горизонтальных полос (шапка, середина, низ)
+H_BINS, S_BINS, V_BINS = 8, 4, 4
+LAYOUT_BANDS = 3
+
+OCR_KEYWORDS = re.compile(
+    r"волонт|добровол|добро\.?ру|dobro|час(ов|а)?\b|сертификат|благодарн|грамот|книжк|удостоверен",
+    re.IGNORECASE,
+)
+OCR_WORD = re.compile(r"[а-яёa-z]{3,}", re.IGNORECASE)
+
+log = logging.getLogger("prescreen")
+
+
+@dataclass
+class Prescreen:
+    decision: str
+    score: float
+    reasons: List[str] = field(default_factory=list)
+    features: Dict[str, float] = field(default_factory=dict)
+    ms: float = 0.0
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+    def to_result(self) -> Dict:
+        """Вердикт в формате ClassifierLlm для уверенного отказа — без обращения к модели."""
+        return {
+            "description": "Отклонено локальной предпроверкой: " + "; ".join(self.reasons),
+            "classification": {
+                "is_volunteer_proof": False,
+                "confidence": round(1.0 - self.score, 2),
+                "hours": 0,
+                "category": "other",
+                "reasons": self.reasons,
+                "missing_or_suspicious": [],
+                "needs_clarification": [
+                    "скриншот dobro.ru, разворот волонтёрской книжки или сертификат, где читается текст"
+                ],
+            },
+            "raw_model_text": "",
+            "mode": "prescreen",
+        }
+
+
+def _clamp(x: float) -> float:
+    return max(0.0, min(1.0, x))
+
+
+def layout_histogram(img: Image.Image) -> List[float]:
+    """Нормированные HSV-гистограммы трёх горизонтальных полос: цвет шапки, фона и кнопок."""
+    hsv = img.convert("RGB").convert("HSV")
+    h, s, v = hsv.split()
+    # Совместный индекс корзины h·16 + s·4 + v в одном канале L (максимум 127)
+    joint = ImageChops.add(
+        ImageChops.add(h.point(lambda x: x * H_BINS // 256 * S_BINS * V_BINS),
+                       s.point(lambda x: x * S_BINS // 256 * V_BINS)),
+        v.point(lambda x: x * V_BINS // 256),
+    )
+    bins = H_BINS * S_BINS * V_BINS
+    out: List[float] = []
+    width, height = joint.size
+    for band in range(LAYOUT_BANDS):
+        crop = joint.crop((0, height * band // LAYOUT_BANDS, width, max(height * (band + 1) // LAYOUT_BANDS, 1)))
+        hist = crop.histogram()[:bins]
+        total = sum(hist) or 1
+        out += [c / total for c in hist]
+    return out
+
+
+def histogram_similarity(a: List[float], b: List[float]) -> float:
+    """
+    Пересечение гистограмм по худшей из полос: 1 — одинаковое распределение цветов.
+    Белый фон есть у любого документа, поэтому среднее по полосам завышало бы
+    сходство — совпасть должны и фирменная шапка, и низ экрана.
+    """
+    if len(a) != len(b) or not a:
+        return 0.0
+    n = len(a) // LAYOUT_BANDS
+    return min(
+        sum(min(x, y) for x, y in zip(a[i * n:(i + 1) * n], b[i * n:(i + 1) * n]))
+        for i in range(LAYOUT_BANDS)
+    )
+
+
+class ReferenceLayouts:
+    """Гистограммы известных скриншотов dobro.ru (data/prescreen_refs.json)."""
+
+    def __init__(self, path: str = REFS_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.refs: Dict[str, List[float]] = {}
+        if self.path.exists():
+            self.refs = json.loads(self.path.read_text(encoding="utf-8"))
+
+    def best_match(self, hist: List[float]) -> float:
+        return max((histogram_similarity(hist, ref) for ref in self.refs.values()), default=0.0)
+
+    def add(self, name: str, raw: bytes):
+        img = _analysis_image(raw)
+        with self._lock:
+            self.refs[name] = [round(x, 5) for x in layout_histogram(img)]
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self.refs), encoding="utf-8")
+
+
+def ocr_available() -> bool:
+    return pytesseract is not None and shutil.which("tesseract") is not None
+
+
+def _analysis_image(raw: bytes, side: int = ANALYSIS_SIDE) -> Image.Image:
+    img = Image.open(BytesIO(raw))
+    # Для JPEG декодируем сразу в уменьшенном масштабе
+    img.draft("RGB", (side, side))
+    img = _to_rgb(ImageOps.exif_transpose(img))
+    img.thumbnail((side, side), Image.Resampling.BILINEAR)
+    return img
+
+
+def _text_features(gray: Image.Image) -> Dict[str, float]:
+    edges = gray.filter(ImageFilter.FIND_EDGES).point(lambda x: 255 if x > EDGE_LEVEL else 0)
+    edge_density = ImageStat.Stat(edges).mean[0] / 255
+    # Доля пикселей-границ по строкам: BOX-уменьшение до ширины 1 считает среднее по строке
+    rows = [v / 255 for v in edges.resize((1, edges.height), Image.Resampling.BOX).tobytes()]
+    ink = [r > INK_ROW for r in rows]
+    transitions = sum(a != b for a, b in zip(ink, ink[1:]))
+    # У текста строки «с чернилами» чередуются с пустыми межстрочными промежутками;
+    # у фотографии текстура сплошная, у пустого скриншота строк нет совсем
+    text_lines = _clamp(transitions / max(len(rows) / 8, 1))
+    return {
+        "edge_density": round(edge_density, 4),
+        "ink_rows": round(sum(ink) / max(len(ink), 1), 3),
+        "text_lines": round(text_lines, 3),
+    }
+
+
+def prescreen(
+    raw: bytes,
+    *,
+    reject_threshold: float = REJECT_THRESHOLD,
+    accept_threshold: float = ACCEPT_THRESHOLD,
+    refs: Optional[ReferenceLayouts] = None,
+    ocr: bool = False,
+) -> Prescreen:
+    """
+    Оценивает, похоже ли изображение на документ/скриншот с подтверждением.
+
+    score ∈ [0, 1] — «документность»: светлый фон, мало цвета, структура
+    строк текста, сходство с эталонными скриншотами dobro.ru и (если есть
+    tesseract) ключевые слова. Решение:
+      reject    — заведомо не подтверждение (крошечное, однотонное, пустой
+                  скриншот, вытянутое без строк текста, score < reject_threshold):
+                  к модели не идём; вытянутое со строками текста (длинный
+                  скриншот) по score не отклоняется;
+      candidate — очень похоже на документ: хватит одного запроса к модели;
+      unsure    — обычная проверка.
+    Фотографии с мероприятий тоже бывают подтверждением, поэтому порог отказа
+    по score низкий; подбирать его — по отчёту bench_prescreen.py.
+    """
+    t0 = time.perf_counter()
+    img = Image.open(BytesIO(raw))
+    width, height = img.size
+    features: Dict[str, float] = {"width": width, "height": height}
+    reasons: List[str] = []
+
+    def done(decision: str, score: float) -> Prescreen:
+        return Prescreen(decision, round(score, 3), reasons, features, round((time.perf_counter() - t0) * 1000, 1))
+
+    short, long = min(width, height), max(width, height)
+    aspect = long / max(short, 1)
+    features["aspect"] = round(aspect, 2)
+    if short < MIN_SIDE:
+        reasons.append(f"слишком маленькое изображение ({width}×{height})")
+        return done(REJECT, 0.0)
+    # Длинный скриншот страницы dobro.ru «во всю прокрутку» — обычное подтверждение,
+    # поэтому одни пропорции не повод для отказа: решают строки текста
+    long_image = aspect > MAX_ASPECT
+    side = min(int(LONG_SHORT_SIDE * aspect), LONG_MAX_SIDE) if long_image else ANALYSIS_SIDE
+    small = _analysis_image(raw, side)
+    gray = small.convert("L")
+    stat = ImageStat.Stat(gray)
+    features["stddev"] = round(stat.stddev[0], 2)
+    if stat.stddev[0] < BLANK_STDDEV:
+        reasons.append("изображение почти однотонное")
+        return done(REJECT, 0.0)
+
+    features.update(_text_features(gray))
+    if features["edge_density"] < MIN_EDGE_DENSITY:
+        reasons.append("на изображении почти нет деталей и текста (пустой скриншот)")
+        return done(REJECT, 0.0)
+    if long_image:
+        if features["text_lines"] < LONG_MIN_TEXT_LINES:
+            reasons.append(f"необычные пропорции {aspect:.1f}:1 без строк текста — похоже на баннер или склейку")
+            return done(REJECT, 0.0)
+        reasons.append(f"вытянутое изображение {aspect:.1f}:1 со строками текста (длинный скриншот?)")
+
+    light = ImageStat.Stat(gray.point(lambda x: 255 if x > LIGHT_LEVEL else 0)).mean[0] / 255
+    saturation = ImageStat.Stat(small.convert("RGB").convert("HSV").getchannel("S")).mean[0] / 255
+    features["light_background"] = round(light, 3)
+    features["saturation"] = round(saturation, 3)
+
+    score = 0.35 * light + 0.25 * (1.0 - saturation) + 0.4 * features["text_lines"]
+
+    if refs is not None and refs.refs:
+        similarity = refs.best_match(layout_histogram(small))
+        features["layout_similarity"] = round(similarity, 3)
+        if similarity >= HIST_MATCH:
+            score = max(score, accept_threshold)
+            reasons.append(f"похоже на скриншот dobro.ru (сходство {similarity:.2f})")
+
+    if ocr and ocr_available():
+        big = _analysis_image(raw, OCR_SIDE).convert("L")
+        try:
+            text = pytesseract.image_to_string(big, lang="rus+eng", timeout=10)
+        except Exception as e:  # tesseract без русского языка, таймаут и т.п.
+            log.warning("OCR не удался: %s", e)
+        else:
+            words = len(OCR_WORD.findall(text))
+            keywords = len(OCR_KEYWORDS.findall(text))
+            features["ocr_words"] = words
+            features["ocr_keywords"] = keywords
+            if keywords >= 2:
+                score = max(score, accept_threshold)
+                reasons.append(f"в тексте есть слова о волонтёрстве ({keywords})")
+            elif words < 3 and features["text_lines"] < 0.3:
+                score *= 0.5
+                reasons.append("текст на изображении не распознан")
+
+    score = _clamp(score)
+    if long_image and score < accept_threshold:
+        # Признаки растра откалиброваны на обычных пропорциях: отказ по оценке не даём
+        return done(UNSURE, score)
+    if score < reject_threshold:
+        reasons.append(f"не похоже на документ или скриншот (оценка {score:.2f} < {reject_threshold:.2f})")
+        return done(REJECT, score)
+    if score >= accept_threshold:
+        return done(CANDIDATE, score)
+    return done(UNSURE, score)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("files", nargs="+")
+    ap.add_argument("--add-ref", action="store_true", help="добавить файлы как эталонные скриншоты dobro.ru")
+    ap.add_argument("--refs", default=REFS_PATH)
+    ap.add_argument("--ocr", action="store_true", help="распознавать текст (нужны pytesseract и tesseract)")
+    args = ap.parse_args(argv)
+
+    refs = ReferenceLayouts(args.refs)
+    for name in args.files:
+        raw = Path(name).read_bytes()
+        if args.add_ref:
+            refs.add(Path(name).name, raw)
+            print(f"{name}: добавлен в {args.refs}")
+            continue
+        res = prescreen(raw, refs=refs, ocr=args.ocr)
+        print(f"{name}: {res.decision} ({res.score:.2f}, {res.ms:.0f} ms) {'; '.join(res.reasons)}")
+        print("   ", json.dumps(res.features, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
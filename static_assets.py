@@ -0,0 +1,54 @@
+# static_assets.py
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from events_api import Encoded
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+# Сжатые копии, которые build_assets.py кладёт рядом с текстовыми файлами
+PRECOMPRESSED_SUFFIX = {"gzip": ".gz", "br": ".br"}
+ETAG_SUFFIX = {"identity": "", "gzip": "-gz", "br": "-br"}
+
+log = logging.getLogger("static_assets")
+
+
+class StaticAssets:
+    """
+    Сборка build_assets.py в памяти: index.html и файлы assets/ (всего сотни КБ).
+
+    Файлы читаются один раз при запуске, вместе со сжатыми заранее копиями —
+    на запрос ничего не сжимается и не читается с диска. Имена в assets/
+    содержат хэш содержимого, поэтому их можно кэшировать бессрочно
+    (Cache-Control: immutable); index.html — точка входа без хэша
+    и сверяется с сервером по ETag.
+    """
+
+    def __init__(self, root: str = DIST_DIR):
+        self.root = Path(root)
+        self.version: Optional[str] = None
+        self._files: Dict[str, Tuple[Encoded, str, bool]] = {}
+        self.load()
+
+    def load(self):
+        manifest_path = self.root / MANIFEST_NAME
+        if not manifest_path.exists():
+            log.warning("Нет %s — статика мини-приложения не собрана (python build_assets.py)", manifest_path)
+            return
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        files = {}
+        for name, info in manifest["files"].items():
+            bodies = {"identity": ((self.root / name).read_bytes(), f'"{info["hash"]}"')}
+            for encoding in info["encodings"]:
+                path = self.root / (name + PRECOMPRESSED_SUFFIX[encoding])
+                bodies[encoding] = (path.read_bytes(), f'"{info["hash"]}{ETAG_SUFFIX[encoding]}"')
+            files[name] = (Encoded(bodies), info["type"], info["immutable"])
+        self._files = files
+        self.version = manifest["version"]
+        log.info("Статика мини-приложения: %d файлов, версия %s", len(files), self.version)
+
+    def get(self, name: str) -> Optional[Tuple[Encoded, str, bool]]:
+        """(тела по кодировкам, Content-Type, immutable) или None."""
+        return self._files.get(name)
@@ -0,0 +1,206 @@
+# upload_store.py
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+import xxhash
+
+from image_prep import MAGIC_PROBE_BYTES, sniff_image_format
+
+UPLOAD_DIR = "uploads"
+MAX_FILE_BYTES = 20 * 1024 * 1024
+USER_QUOTA_BYTES = 200 * 1024 * 1024
+USER_MAX_FILES = 200
+
+
+def format_size(n: int) -> str:
+    if n >= 1024 * 1024:
+        return f"{n / (1024 * 1024):.0f} МБ"
+    if n >= 1024:
+        return f"{n / 1024:.0f} КБ"
+    return f"{n} байт"
+
+
+class QuotaExceeded(Exception):
+    """Файл больше лимита или не помещается в квоту пользователя."""
+
+
+class NotAnImage(Exception):
+    """Сигнатура файла не похожа ни на один поддерживаемый формат изображений."""
+
+
+@dataclass
+class StoredUpload:
+    user_id: str
+    digest: str
+    path: str
+    size: int
+    raw: bytes
+    duplicate: bool
+
+
+class UploadStore:
+    """
+    Хранилище загрузок, адресуемое по содержимому.
+
+    Файл пишется потоком во временный файл через aiofiles; по ходу считается
+    xxh3-128, а слишком большой файл обрывается на первом лишнем чанке;
+    файл без сигнатуры изображения обрывается по первым байтам.
+    Квота пользователя (байты и число файлов) проверяется, когда хэш уже
+    известен, — до переноса файла в хранилище. Готовый файл переименовывается
+    в objects/<2 символа>/<хэш>: одинаковое содержимое хранится один раз,
+    а повторная загрузка того же файла тем же пользователем квоту не тратит.
+    Байты файла остаются в памяти (не больше max_file_bytes) и отдаются
+    на проверку без повторного чтения с диска.
+    """
+
+    def __init__(
+        self,
+        root: str = UPLOAD_DIR,
+        db_path: Optional[str] = None,
+        *,
+        max_file_bytes: int = MAX_FILE_BYTES,
+        user_quota_bytes: int = USER_QUOTA_BYTES,
+        user_max_files: int = USER_MAX_FILES,
+    ):
+        self.root = Path(root)
+        self.max_file_bytes = max_file_bytes
+        self.user_quota_bytes = user_quota_bytes
+        self.user_max_files = user_max_files
+        (self.root / "tmp").mkdir(parents=True, exist_ok=True)
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path or str(self.root / "uploads.db"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                user_id TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (user_id, digest)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest
+
+    def usage(self, user_id: str) -> Tuple[int, int]:
+        """(байт, файлов) в квоте пользователя."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM uploads WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row[0], row[1]
+
+    def _check_quota(self, user_id: str, digest: str, size: int) -> bool:
+        """
+        Проверяет квоту для уже посчитанного хэша; True — пользователь этот файл
+        уже загружал, и квота не тратится. Квота сверяется с сохранёнными файлами:
+        параллельные загрузки одного пользователя могут превысить её не больше
+        чем на размер файла.
+        """
+        with self._lock:
+            if self._conn.execute(
+                "SELECT 1 FROM uploads WHERE user_id = ? AND digest = ?", (user_id, digest)
+            ).fetchone():
+                return True
+            used, files = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM uploads WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if files >= self.user_max_files:
+            raise QuotaExceeded(f"Превышено число файлов: не больше {self.user_max_files}")
+        if used >= self.user_quota_bytes:
+            raise QuotaExceeded("Квота на загрузки исчерпана")
+        if used + size > self.user_quota_bytes:
+            raise QuotaExceeded("Файл не помещается в оставшуюся квоту")
+        return False
+
+    async def save(self, user_id: str, chunks: AsyncIterator[bytes]) -> StoredUpload:
+        """
+        Принимает поток чанков; QuotaExceeded — если файл не помещается в лимиты,
+        NotAnImage — если это не изображение. SQLite — в потоке, не в цикле событий.
+        Поток обрывается на max_file_bytes; квота пользователя проверяется после
+        хэширования, чтобы повторная загрузка уже сохранённого файла проходила всегда.
+        """
+        hasher = xxhash.xxh3_128()
+        parts = []
+        size = 0
+        sniffed = None
+        tmp = self.root / "tmp" / uuid.uuid4().hex
+        try:
+            async with aiofiles.open(tmp, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        raise QuotaExceeded(f"Файл больше {format_size(self.max_file_bytes)}")
+                    hasher.update(chunk)
+                    parts.append(chunk)
+                    if sniffed is None and size >= MAGIC_PROBE_BYTES:
+                        sniffed = self._sniff(parts)
+                    await f.write(chunk)
+            if sniffed is None:
+                sniffed = self._sniff(parts)
+            digest = hasher.hexdigest()
+            duplicate = await asyncio.to_thread(self._check_quota, user_id, digest, size)
+            target = self.object_path(digest)
+            if await aiofiles.os.path.exists(target):
+                # Такое содержимое уже лежит — второй копии не нужно
+                await aiofiles.os.remove(tmp)
+            else:
+                await aiofiles.os.makedirs(target.parent, exist_ok=True)
+                await aiofiles.os.replace(tmp, target)
+        except BaseException:
+            if await aiofiles.os.path.exists(tmp):
+                await aiofiles.os.remove(tmp)
+            raise
+
+        inserted = await asyncio.to_thread(self._insert, user_id, digest, size)
+        return StoredUpload(
+            user_id=user_id,
+            digest=digest,
+            path=str(target),
+            size=size,
+            raw=b"".join(parts),
+            duplicate=duplicate or not inserted,
+        )
+
+    @staticmethod
+    def _sniff(parts) -> str:
+        fmt = sniff_image_format(b"".join(parts)[:MAGIC_PROBE_BYTES])
+        if fmt is None:
+            raise NotAnImage("Файл не распознан как изображение (JPEG, PNG, WebP, GIF, BMP, TIFF)")
+        return fmt
+
+    def _insert(self, user_id: str, digest: str, size: int) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO uploads (user_id, digest, size, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, digest, size, time.time()),
+            )
+            self._conn.commit()
+        return cur.rowcount == 1
+
+    def cleanup_tmp(self, older_than: float = 3600.0) -> int:
+        """Удаляет недописанные временные файлы (после падения процесса)."""
+        removed = 0
+        cutoff = time.time() - older_than
+        for p in (self.root / "tmp").iterdir():
+            try:
+                if p.stat().st_mtime < cutoff:
+                    os.remove(p)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
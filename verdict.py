@@ -0,0 +1,76 @@
+# verdict.py
+import json
+import re
+from typing import Any, Dict
+
+# Поля вердикта из prompts/system_prompt_classifier.txt
+CATEGORIES = {"dobro.ru_screenshot", "volunteer_book", "certificate", "badge", "event_photo", "other"}
+LIST_FIELDS = ("reasons", "missing_or_suspicious", "needs_clarification")
+MAX_HOURS = 10000
+
+FENCE_RX = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+
+class VerdictError(ValueError):
+    """Ответ модели — не JSON или не соответствует схеме вердикта."""
+
+
+def _number(data: Dict, key: str) -> float:
+    value = data.get(key)
+    # bool — подкласс int, но «hours: true» — это ошибка модели, а не час
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        if isinstance(value, str):
+            try:
+                return float(value.replace(",", "."))
+            except ValueError:
+                pass
+        raise VerdictError(f"{key}: ожидается число, получено {value!r}")
+    return float(value)
+
+
+def parse_verdict(text: str) -> Dict[str, Any]:
+    """
+    Достаёт JSON-вердикт из ответа модели и проверяет его по схеме.
+    Допускает обёртку в ```json … ``` и текст вокруг объекта; числа-строки
+    («12,5») приводит к числам. VerdictError — если вердикт не годится.
+    """
+    text = FENCE_RX.sub("", (text or "").strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        raise VerdictError("в ответе нет JSON-объекта")
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise VerdictError(f"неверный JSON: {e}")
+    if not isinstance(data, dict):
+        raise VerdictError("вердикт должен быть объектом")
+
+    proof = data.get("is_volunteer_proof")
+    if not isinstance(proof, bool):
+        raise VerdictError(f"is_volunteer_proof: ожидается true/false, получено {proof!r}")
+    confidence = _number(data, "confidence")
+    if not 0.0 <= confidence <= 1.0:
+        raise VerdictError(f"confidence вне [0, 1]: {confidence}")
+    hours = _number(data, "hours")
+    if not 0 <= hours <= MAX_HOURS:
+        raise VerdictError(f"hours вне [0, {MAX_HOURS}]: {hours}")
+    category = data.get("category", "other")
+    if category not in CATEGORIES:
+        raise VerdictError(f"category: неизвестная категория {category!r}")
+
+    verdict = dict(data)
+    verdict.update({
+        "is_volunteer_proof": proof,
+        "confidence": confidence,
+        # Как в двухшаговом пути: целые часы — int, «12,5» остаётся дробным
+        "hours": int(hours) if hours.is_integer() else hours,
+        "category": category,
+    })
+    for key in LIST_FIELDS:
+        value = data.get(key, [])
+        if isinstance(value, str):
+            value = [value] if value else []
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise VerdictError(f"{key}: ожидается список строк")
+        verdict[key] = value
+    return verdict
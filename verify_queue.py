@@ -0,0 +1,449 @@
+# verify_queue.py
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+VERIFY_QUEUE_DB = "data/verify_queue.db"
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 5.0
+BACKOFF_CAP = 300.0
+# Сколько загрузок держать в памяти, чтобы воркер в том же процессе не читал их с диска
+MAX_INLINE_JOBS = 32
+# На сколько задание в verified закрепляется за воркером, который отправляет результат
+DELIVERY_LEASE = 60.0
+
+QUEUED, RUNNING, VERIFIED, DONE, FAILED = "queued", "running", "verified", "done", "failed"
+
+log = logging.getLogger("verify_queue")
+
+
+class PermanentError(Exception):
+    """Ошибка, которую повтор не исправит (не картинка, слишком большой файл и т.п.)."""
+
+
+@dataclass
+class Job:
+    id: int
+    user_id: str
+    source: str
+    file_url: Optional[str]
+    file_path: Optional[str]
+    meta: Dict
+    status: str
+    attempts: int
+    created_at: float
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    deliveries: int = 0
+    reply: Optional[str] = None
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Экспоненциальная задержка перед попыткой attempt + 1, со случайным разбросом ±50%."""
+    delay = min(cap, base * 2 ** max(attempt - 1, 0))
+    return delay * random.uniform(0.5, 1.5)
+
+
+class VerifyQueue:
+    """
+    Очередь проверки документов в SQLite — общая для вложений в боте
+    и загрузок через мини-приложение (оба процесса пишут в один файл).
+
+    Задание проходит queued → running → verified → done | failed; при временной
+    ошибке оно возвращается в queued с отложенным next_run_at. В verified лежит
+    готовый результат, который ещё не дошёл до пользователя: done ставится
+    только после успешной отправки, а неудачная отправка повторяется с backoff.
+    Порядок внутри пользователя сохраняется: задание не выдаётся, пока у того
+    же пользователя есть более раннее незавершённое или недоставленное.
+    Задания, зависшие в running после падения процесса, recover() возвращает
+    в очередь, а недоставленные результаты отправляются заново.
+    """
+
+    def __init__(self, path: str = VERIFY_QUEUE_DB, *, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._inline: "OrderedDict[int, bytes]" = OrderedDict()
+        # Воркеры в этом процессе: без них байты в памяти держать незачем
+        self.local_workers = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                file_url TEXT,
+                file_path TEXT,
+                meta TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_run_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                result TEXT,
+                error TEXT,
+                deliveries INTEGER NOT NULL DEFAULT 0,
+                reply TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_due ON jobs(status, next_run_at);
+            CREATE INDEX IF NOT EXISTS jobs_user ON jobs(user_id, id);
+            """
+        )
+        # Базы, созданные до состояния verified
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "deliveries" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN deliveries INTEGER NOT NULL DEFAULT 0")
+        if "reply" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN reply TEXT")
+
+    @staticmethod
+    def _row_to_job(row) -> Job:
+        return Job(
+            id=row[0], user_id=row[1], source=row[2], file_url=row[3], file_path=row[4],
+            meta=json.loads(row[5]), status=row[6], attempts=row[7], created_at=row[8],
+            result=json.loads(row[9]) if row[9] else None, error=row[10], deliveries=row[11], reply=row[12],
+        )
+
+    _COLUMNS = (
+        "id, user_id, source, file_url, file_path, meta, status, attempts, created_at, result, error, "
+        "deliveries, reply"
+    )
+
+    def enqueue(self, user_id, *, source: str, file_url: Optional[str] = None, file_path: Optional[str] = None,
+                meta: Optional[Dict] = None, raw: Optional[bytes] = None) -> int:
+        """
+        Ставит документ в очередь. raw — уже прочитанные байты: если воркеры
+        работают в этом же процессе, они возьмут их из памяти, иначе прочитают file_path.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (user_id, source, file_url, file_path, meta, status, next_run_at, created_at, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(user_id), source, file_url, file_path, json.dumps(meta or {}, ensure_ascii=False),
+                 QUEUED, now, now, now),
+            )
+            job_id = cur.lastrowid
+            if raw is not None and self.local_workers:
+                self._inline[job_id] = raw
+                while len(self._inline) > MAX_INLINE_JOBS:
+                    self._inline.popitem(last=False)
+        return job_id
+
+    def take_bytes(self, job_id: int) -> Optional[bytes]:
+        with self._lock:
+            return self._inline.pop(job_id, None)
+
+    def recover(self) -> int:
+        """
+        Возвращает в очередь задания, оставшиеся в running после перезапуска,
+        и снимает аренду с недоставленных результатов, чтобы их отправили сразу.
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?", (QUEUED, now, RUNNING)
+            )
+            redeliver = self._conn.execute(
+                "UPDATE jobs SET next_run_at = ? WHERE status = ?", (now, VERIFIED)
+            )
+        return cur.rowcount + redeliver.rowcount
+
+    def claim(self) -> Optional[Job]:
+        """Берёт самое раннее готовое задание, соблюдая порядок внутри пользователя."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM jobs j "
+                    "WHERE j.status = ? AND j.next_run_at <= ? AND NOT EXISTS ("
+                    "  SELECT 1 FROM jobs k WHERE k.user_id = j.user_id AND k.id < j.id AND k.status IN (?, ?, ?)"
+                    ") ORDER BY j.next_run_at, j.id LIMIT 1",
+                    (QUEUED, now, QUEUED, RUNNING, VERIFIED),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (RUNNING, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = self._row_to_job(row)
+        job.status = RUNNING
+        job.attempts += 1
+        return job
+
+    def claim_delivery(self) -> Optional[Job]:
+        """Берёт готовый, но не доставленный результат и закрепляет его на DELIVERY_LEASE секунд."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM jobs WHERE status = ? AND next_run_at <= ? "
+                    "ORDER BY id LIMIT 1",
+                    (VERIFIED, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET next_run_at = ?, deliveries = deliveries + 1, updated_at = ? WHERE id = ?",
+                    (now + DELIVERY_LEASE, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = self._row_to_job(row)
+        job.deliveries += 1
+        return job
+
+    def next_due_in(self) -> Optional[float]:
+        """Через сколько секунд станет готово ближайшее отложенное задание или повтор отправки."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_run_at) FROM jobs WHERE status IN (?, ?)", (QUEUED, VERIFIED)
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def verified(self, job: Job, result: Dict):
+        """Сохраняет результат до отправки; задание закрепляется за текущим воркером, как в claim_delivery()."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, next_run_at = ?, "
+                "deliveries = deliveries + 1, updated_at = ? WHERE id = ?",
+                (VERIFIED, json.dumps(result, ensure_ascii=False), now + DELIVERY_LEASE, now, job.id),
+            )
+            self._inline.pop(job.id, None)
+        job.status = VERIFIED
+        job.result = result
+        job.error = None
+        job.deliveries += 1
+
+    def set_reply(self, job_id: int, reply: str):
+        """Запоминает отправляемый текст: повторная отправка не должна снова начислять очки."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET reply = ?, updated_at = ? WHERE id = ?", (reply, time.time(), job_id))
+
+    def complete(self, job_id: int):
+        """Результат доставлен."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE id = ?", (DONE, time.time(), job_id)
+            )
+            self._inline.pop(job_id, None)
+
+    def delivery_failed(self, job: Job, error: str) -> bool:
+        """Откладывает повтор отправки; False — попытки кончились, задание закрыто с ошибкой."""
+        now = time.time()
+        if job.deliveries >= self.max_attempts:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                    (DONE, f"результат не доставлен: {error}", now, job.id),
+                )
+            return False
+        delay = backoff_delay(job.deliveries)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET next_run_at = ?, error = ?, updated_at = ? WHERE id = ?",
+                (now + delay, error, now, job.id),
+            )
+        log.warning("Проверка #%d: отправка %d не удалась (%s), повтор через %.0fs",
+                    job.id, job.deliveries, error, delay)
+        return True
+
+    def fail(self, job_id: int, error: str):
+        self._finish(job_id, FAILED, error=error)
+
+    def retry(self, job: Job, error: str) -> bool:
+        """Откладывает задание с экспоненциальной задержкой; False — попытки кончились."""
+        if job.attempts >= self.max_attempts:
+            self.fail(job.id, error)
+            return False
+        delay = backoff_delay(job.attempts)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, next_run_at = ?, error = ?, updated_at = ? WHERE id = ?",
+                (QUEUED, time.time() + delay, error, time.time(), job.id),
+            )
+        log.warning("Проверка #%d: попытка %d не удалась (%s), повтор через %.0fs", job.id, job.attempts, error, delay)
+        return True
+
+    def _finish(self, job_id: int, status: str, *, result: Optional[Dict] = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                 time.time(), job_id),
+            )
+            self._inline.pop(job_id, None)
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def user_jobs(self, user_id, limit: int = 10) -> List[Job]:
+        """Последние задания пользователя, новые первыми."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (str(user_id), limit),
+            ).fetchall()
+        return [self._row_to_job(r) for r in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
+
+
+class VerifyWorkers:
+    """
+    Пул воркеров поверх VerifyQueue в цикле событий бота.
+
+    Каждый воркер берёт задание, выполняет verify(job) в пуле потоков
+    (GigaChat — синхронный клиент) и отдаёт результат в deliver(job, result, error).
+    Результат сохраняется в verified до отправки; если deliver упал, отправка
+    повторяется (job.deliveries > 1), поэтому deliver должен быть идемпотентным.
+    Временные ошибки уходят на повтор с backoff, PermanentError
+    и исчерпанные попытки — сразу в failed с сообщением пользователю.
+    Число воркеров ограничивает нагрузку на GigaChat: всплеск загрузок
+    копится в очереди и разбирается с постоянной скоростью. Поток прервать
+    нельзя, поэтому после timeout задание считается неудачным, но повтор
+    ставится, только когда поток закончился (запросы к GigaChat ограничены
+    своим таймаутом) или истёк drain_timeout — два запроса по одному
+    заданию параллельно не идут, а слот воркера не занят бесконечно.
+    Все обращения к SQLite идут через asyncio.to_thread: BEGIN IMMEDIATE может
+    ждать блокировку, которую держит мини-приложение, и цикл событий бота
+    при этом не останавливается.
+    """
+
+    def __init__(
+        self,
+        queue: VerifyQueue,
+        verify: Callable[[Job], Dict],
+        deliver: Callable[[Job, Optional[Dict], Optional[str]], Awaitable[None]],
+        *,
+        workers: int = 4,
+        timeout: float = 90.0,
+        drain_timeout: Optional[float] = None,
+        poll: float = 2.0,
+        executor=None,
+    ):
+        self.queue = queue
+        self.verify = verify
+        self.deliver = deliver
+        self.workers = workers
+        self.timeout = timeout
+        self.drain_timeout = timeout if drain_timeout is None else drain_timeout
+        self.poll = poll
+        self.executor = executor
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        recovered = await asyncio.to_thread(self.queue.recover)
+        if recovered:
+            log.info("Возвращено в очередь незавершённых проверок: %d", recovered)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(i)) for i in range(self.workers)]
+        self.queue.local_workers += len(self._tasks)
+
+    def notify(self):
+        """Будит воркеров после enqueue в этом же процессе (иначе — через poll секунд)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.queue.local_workers -= len(self._tasks)
+        self._tasks = []
+
+    async def _idle(self):
+        due = await asyncio.to_thread(self.queue.next_due_in)
+        wait = self.poll if due is None else min(self.poll, max(due, 0.05))
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _run(self, n: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await asyncio.to_thread(self.queue.claim_delivery)
+            if job is not None:
+                await self._deliver_verified(job)
+                continue
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                await self._idle()
+                continue
+            t0 = time.perf_counter()
+            future = loop.run_in_executor(self.executor, self.verify, job)
+            try:
+                try:
+                    result = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    await self._drain(job, future)
+                    raise
+            except PermanentError as e:
+                await asyncio.to_thread(self.queue.fail, job.id, str(e))
+                await self._deliver(job, None, str(e))
+            except Exception as e:
+                error = "таймаут проверки" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+                if not await asyncio.to_thread(self.queue.retry, job, error):
+                    log.error("Проверка #%d не удалась после %d попыток: %s", job.id, job.attempts, error)
+                    await self._deliver(job, None, error)
+            else:
+                await asyncio.to_thread(self.queue.verified, job, result)
+                log.info("Проверка #%d (%s, пользователь %s): %.2fs", job.id, job.source, job.user_id,
+                         time.perf_counter() - t0)
+                await self._deliver_verified(job)
+
+    async def _drain(self, job: Job, future: asyncio.Future):
+        """Ждёт конца потока после таймаута (не дольше drain_timeout); результат отбрасывается."""
+        log.warning("Проверка #%d: таймаут %.0fs, ждём остановки потока", job.id, self.timeout)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            log.error("Проверка #%d: поток не остановился за %.0fs", job.id, self.drain_timeout)
+        except Exception:
+            pass
+
+    async def _deliver_verified(self, job: Job):
+        """Отправляет сохранённый результат; done — только после успешной отправки."""
+        try:
+            await self.deliver(job, job.result, None)
+        except Exception as e:
+            log.exception("Не удалось отправить результат проверки #%d", job.id)
+            if not await asyncio.to_thread(self.queue.delivery_failed, job, f"{type(e).__name__}: {e}"):
+                log.error("Результат проверки #%d не доставлен после %d попыток", job.id, job.deliveries)
+        else:
+            await asyncio.to_thread(self.queue.complete, job.id)
+
+    async def _deliver(self, job: Job, result: Optional[Dict], error: Optional[str]):
+        try:
+            await self.deliver(job, result, error)
+        except Exception:
+            log.exception("Не удалось отправить результат проверки #%d", job.id)
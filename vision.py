@@ -1,16 +1,31 @@
 import os
 import re
+import time
+import logging
 import mimetypes
 from io import BytesIO
 import json
 import requests
 import urllib3
 from gigachat import GigaChat
-from PIL import Image
+
+from image_prep import MAGIC_PROBE_BYTES, MAX_UPLOAD_PIXELS, check_image_bounds, prepare_image, sniff_image_format
+from doc_cache import VerificationCache, content_hash, perceptual_hash
+from prescreen import ACCEPT_THRESHOLD, CANDIDATE, REFS_PATH, REJECT, REJECT_THRESHOLD, ReferenceLayouts, prescreen
+from verdict import VerdictError, parse_verdict
 
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+log = logging.getLogger("vision")
+
+# Типы, под которыми файловые хранилища отдают картинки без точного Content-Type
+GENERIC_CONTENT_TYPES = {"", "application/octet-stream", "binary/octet-stream"}
+
+CLASSIFIER_PROMPT = "prompts/system_prompt_classifier.txt"
+# Инструкции описателя и классификатора в одном промпте: картинка → сразу JSON-вердикт
+SINGLE_PASS_PROMPT = "prompts/system_prompt_single_pass.txt"
+
 
 
 with open("cfg.json", "r", encoding="utf-8") as f:
@@ -28,11 +43,41 @@ class ClassifierLlm:
         model = "GigaChat-2-Max",
         verify_ssl_certs = False,
         request_timeout = 15,
+        # Таймаут одного HTTP-запроса к GigaChat: без него зависший запрос держит поток пула вечно
+        gigachat_timeout: float = data.get("vision_gigachat_timeout", 30.0),
         language: str = "ru",
+        max_upload_pixels: int = data.get("vision_max_upload_pixels", MAX_UPLOAD_PIXELS),
+        image_quality: int = data.get("vision_image_quality", 85),
+        image_format: str = data.get("vision_image_format", "JPEG"),
+        cache_path: str = data.get("vision_cache_path", "data/vision_cache.db"),
+        cache_max_entries: int = data.get("vision_cache_max_entries", 10000),
+        max_download_bytes: int = data.get("vision_max_download_bytes", 20 * 1024 * 1024),
+        max_pixels: int = data.get("vision_max_pixels", 60_000_000),
+        single_pass: bool = data.get("vision_single_pass", False),
+        prescreen_enabled: bool = data.get("prescreen_enabled", True),
+        prescreen_reject_threshold: float = data.get("prescreen_reject_threshold", REJECT_THRESHOLD),
+        prescreen_accept_threshold: float = data.get("prescreen_accept_threshold", ACCEPT_THRESHOLD),
+        prescreen_ocr: bool = data.get("prescreen_ocr", False),
+        # Однопроходная проверка для явных документов — отдельный выключатель от vision_single_pass
+        prescreen_single_pass: bool = data.get("prescreen_single_pass", False),
+        prescreen_refs_path: str = data.get("prescreen_refs_path", REFS_PATH),
     ):
         self._language = language
         self._timeout = request_timeout
         self._ua = "ClassifierLlm/1.0 (+max-dobro-bot)"
+        self._max_upload_pixels = max_upload_pixels
+        self._image_quality = image_quality
+        self._image_format = image_format
+        self._max_download_bytes = max_download_bytes
+        self._max_pixels = max_pixels
+        self._single_pass = single_pass
+        self._prescreen_enabled = prescreen_enabled
+        self._prescreen_reject = prescreen_reject_threshold
+        self._prescreen_accept = prescreen_accept_threshold
+        self._prescreen_ocr = prescreen_ocr
+        self._prescreen_single_pass = prescreen_single_pass
+        self._prescreen_refs = ReferenceLayouts(prescreen_refs_path) if prescreen_enabled else None
+        self._cache = VerificationCache(cache_path, max_entries=cache_max_entries)
         
 
         self._client = GigaChat(
@@ -41,6 +86,7 @@ class ClassifierLlm:
             model=model,
             verify_ssl_certs=verify_ssl_certs,
             profanity_check=False,
+            timeout=gigachat_timeout,
         )
 
         self._classifier = GigaChat(
@@ -49,14 +95,130 @@ class ClassifierLlm:
             model="GigaChat-2-Max",
             verify_ssl_certs=verify_ssl_certs,
             profanity_check=False,
+            timeout=gigachat_timeout,
         )
 
-    def check_doc(self, file_url: str, *, prompt_path: str = "prompts/system_prompt_classifier") -> dict:
+    def check_doc(self, file_url: str, *, user_id=None, prompt_path: str = CLASSIFIER_PROMPT) -> dict:
+        """
+        Сначала формируе текстовое описание, потом по текстовому описанию возвращает вердикт
+        (в режиме single_pass — один запрос, см. _check_single_pass).
+        Вердикт кэшируется по хэшу содержимого: повторная отправка того же файла
+        не стоит ни одного запроса к модели. В поле "duplicate" — кому этот
+        (или очень похожий) документ уже засчитан; сама проверка ничего не
+        засчитывает — это делает record_submission при начислении очков.
+        """
+        return self.check_raw(self._fetch_image(file_url), user_id=user_id, prompt_path=prompt_path)
+
+    def check_raw(self, raw: bytes, *, user_id=None, prompt_path: str = CLASSIFIER_PROMPT) -> dict:
+        """То же, что check_doc, для уже полученных байтов (загрузки мини-приложения)."""
+        try:
+            # Загрузки мини-приложения не проходили _fetch_image: «бомбу» отсекаем до декодирования
+            check_image_bounds(raw, self._max_pixels)
+            chash = content_hash(raw)
+            phash = perceptual_hash(raw)
+        except Exception as e:
+            raise RuntimeError(f"Файл не распознан как изображение: {e}")
+
+        # Вердикт зависит от промпта: с нестандартным промптом — отдельная запись кэша
+        cache_key = chash if prompt_path == CLASSIFIER_PROMPT else f"{chash}:{prompt_path}"
+        result = self._cache.get(cache_key)
+        if result is not None:
+            log.info("check_doc: вердикт из кэша (%s)", chash)
+            result["cached"] = True
+        else:
+            screen = self.prescreen(raw)
+            if screen is not None and screen.decision == REJECT:
+                # Отказ предпроверки не кэшируем: порог настраивается, а пересчёт стоит миллисекунды
+                log.info("Предпроверка: отказ без запроса к модели за %.0f ms (%s)", screen.ms, "; ".join(screen.reasons))
+                result = screen.to_result()
+            else:
+                # Явный документ проверяем одним запросом вместо двух. У однопроходного
+                # режима свой промпт (SINGLE_PASS_PROMPT), поэтому нестандартный
+                # prompt_path всегда идёт двухшаговым путём
+                single_pass = self._single_pass or (
+                    self._prescreen_single_pass and screen is not None and screen.decision == CANDIDATE
+                )
+                if single_pass and prompt_path == CLASSIFIER_PROMPT:
+                    result = self._check_single_pass(raw, prompt_path)
+                else:
+                    result = self._check_two_step(raw, prompt_path)
+                self._cache.put(cache_key, result)
+            if screen is not None:
+                result["prescreen"] = screen.as_dict()
+            result["cached"] = False
+
+        result["duplicate"] = self._cache.find_submissions(chash, phash, user_id)
+        result["content_hash"] = chash
+        result["phash"] = phash
+        return result
+
+    def record_submission(self, result: dict, user_id) -> bool:
+        """Засчитывает проверенный документ пользователю; False — он уже засчитан раньше."""
+        return self._cache.record_submission(result["content_hash"], result["phash"], user_id)
+
+    def prescreen(self, raw: bytes):
+        """Локальная предпроверка (prescreen.prescreen) с настройками из cfg.json; None — выключена."""
+        if not self._prescreen_enabled:
+            return None
+        try:
+            return prescreen(
+                raw,
+                reject_threshold=self._prescreen_reject,
+                accept_threshold=self._prescreen_accept,
+                refs=self._prescreen_refs,
+                ocr=self._prescreen_ocr,
+            )
+        except Exception:
+            # Предпроверка — только оптимизация: при любой ошибке идём обычным путём
+            log.exception("Предпроверка не удалась")
+            return None
+
+    def _check_two_step(self, raw: bytes, prompt_path: str) -> dict:
+        result = self._classify(self._describe_raw(raw), prompt_path)
+        result["mode"] = "two_step"
+        return result
+
+    def _check_single_pass(self, raw: bytes, prompt_path: str) -> dict:
         """
-        Сначала формируе текстовое описание, потом по текстовому описанию возвращает вердикт.
+        Один запрос к vision-модели вместо двух последовательных: изображение
+        и объединённые инструкции описателя и классификатора, ответ — сразу
+        JSON-вердикт. Если ответ не проходит схему (verdict.parse_verdict) или
+        заблокирован модерацией, уже загруженный файл проходит обычный
+        двухшаговый путь — без повторной загрузки; prompt_path — промпт
+        классификатора только для этого отката.
         """
-        description = self.describe(file_url)
+        file_id = self._upload(raw)
+        t0 = time.perf_counter()
+        result = self._client.chat(
+            {
+                "messages": [
+                    {"role": "system", "content": self._load_prompt(SINGLE_PASS_PROMPT)},
+                    {"role": "user", "content": "Проверь это изображение.", "attachments": [file_id]},
+                ],
+                "temperature": 0.0,
+            }
+        )
+        choice = result.choices[0]
+        raw_text = (getattr(choice.message, "content", "") or "").strip()
+        try:
+            if getattr(choice, "finish_reason", "") == "blacklist":
+                raise VerdictError("ответ заблокирован модерацией (blacklist)")
+            verdict = parse_verdict(raw_text)
+        except VerdictError as e:
+            log.warning("Однопроходная проверка не удалась (%s), переходим к двум шагам", e)
+            result = self._classify(self._describe_uploaded(file_id), prompt_path)
+            result["mode"] = "fallback"
+            return result
+
+        log.info("Однопроходная проверка: %.2fs", time.perf_counter() - t0)
+        return {
+            "description": verdict.get("summary") or "\n".join(verdict.get("text_lines") or []),
+            "classification": verdict,
+            "raw_model_text": raw_text,
+            "mode": "single_pass",
+        }
 
+    def _classify(self, description: str, prompt_path: str) -> dict:
         system_prompt = self._load_classifier_prompt(prompt_path)
 
         result = self._classifier.chat({
@@ -92,9 +254,19 @@ class ClassifierLlm:
 
 
     def describe(self, file_url):
-        file_like, filename = self._download_image(file_url)
+        return self._describe_raw(self._fetch_image(file_url))
+
+    def _describe_raw(self, raw: bytes) -> str:
+        return self._describe_uploaded(self._upload(raw))
+
+    def _upload(self, raw: bytes) -> str:
+        file_like, filename = self._prepare_image(raw)
+        t0 = time.perf_counter()
         uploaded = self._client.upload_file(file_like)
+        log.info("upload_file: %s, %d байт за %.2fs", filename, file_like.getbuffer().nbytes, time.perf_counter() - t0)
+        return uploaded.id_
 
+    def _describe_uploaded(self, file_id: str) -> str:
         prompt = self._build_prompt()
 
         result = self._client.chat(
@@ -103,7 +275,7 @@ class ClassifierLlm:
                     {
                         "role": "user",
                         "content": prompt,
-                        "attachments": [uploaded.id_],
+                        "attachments": [file_id],
                     }
                 ],
                 "temperature": 0.1,
@@ -118,7 +290,13 @@ class ClassifierLlm:
             raise RuntimeError("Модель вернула пустое описание.")
         return text
 
-    def _download_image(self, url: str) -> tuple[BytesIO, str]:
+    def _fetch_image(self, url: str) -> bytes:
+        """
+        Потоково скачивает изображение в ограниченный буфер:
+        тип проверяется по заголовкам и первым байтам, загрузка обрывается,
+        как только тело превышает max_download_bytes.
+        """
+        t0 = time.perf_counter()
         try:
             resp = requests.get(
                 url,
@@ -130,31 +308,75 @@ class ClassifierLlm:
         except Exception as e:
             raise RuntimeError(f"Не удалось скачать изображение: {e}") from e
 
-        if resp.status_code != 200:
-            raise RuntimeError(f"HTTP {resp.status_code}: не удалось скачать изображение")
-
+        with resp:
+            if resp.status_code != 200:
+                raise RuntimeError(f"HTTP {resp.status_code}: не удалось скачать изображение")
+
+            content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if not content_type.startswith("image/") and content_type not in GENERIC_CONTENT_TYPES:
+                raise RuntimeError(f"Файл не является изображением (Content-Type: {content_type})")
+
+            declared = resp.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > self._max_download_bytes:
+                raise RuntimeError(f"Файл слишком большой: {int(declared)} байт")
+            t1 = time.perf_counter()
+
+            buf = bytearray()
+            sniffed = None
+            try:
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    buf += chunk
+                    if len(buf) > self._max_download_bytes:
+                        raise RuntimeError(f"Файл слишком большой: больше {self._max_download_bytes} байт")
+                    if sniffed is None and len(buf) >= MAGIC_PROBE_BYTES:
+                        sniffed = sniff_image_format(bytes(buf[:MAGIC_PROBE_BYTES]))
+                        if sniffed is None:
+                            raise RuntimeError("Скачанный файл не распознан как изображение")
+            except requests.RequestException as e:
+                raise RuntimeError(f"Не удалось скачать изображение: {e}") from e
+        t2 = time.perf_counter()
+
+        raw = bytes(buf)
         try:
-            img = Image.open(BytesIO(resp.content))
-            if img.mode not in ("RGB", "RGBA"):
-                img = img.convert("RGB")
+            if sniffed is None and sniff_image_format(raw) is None:
+                raise ValueError("неизвестная сигнатура файла")
+            fmt, size = check_image_bounds(raw, self._max_pixels)
         except Exception as e:
             raise RuntimeError(f"Скачанный файл не распознан как изображение: {e}")
+        t3 = time.perf_counter()
 
-        out = BytesIO()
-        if img.mode not in ("RGB", "RGBA"):
-            img = img.convert("RGB")
-        img.save(out, format="PNG")
-        out.seek(0)
+        log.info(
+            "Скачано %s %sx%s, %d байт: заголовки %.0f ms, тело %.0f ms, проверка %.0f ms",
+            fmt, *size, len(raw), (t1 - t0) * 1000, (t2 - t1) * 1000, (t3 - t2) * 1000,
+        )
+        return raw
 
+    def _prepare_image(self, raw: bytes) -> tuple[BytesIO, str]:
         try:
-            setattr(out, "name", "upload.png")
-        except Exception:
-            pass
+            out, filename, stats = prepare_image(
+                raw,
+                max_pixels=self._max_upload_pixels,
+                quality=self._image_quality,
+                image_format=self._image_format,
+            )
+        except Exception as e:
+            raise RuntimeError(f"Скачанный файл не распознан как изображение: {e}")
 
-        return out, "upload.png"
+        log.info(
+            "Изображение: %s %sx%s %d байт -> %s %sx%s %d байт (decode %.0f ms, encode %.0f ms%s)",
+            stats["src_format"], *stats["src_size"], stats["src_bytes"],
+            stats["out_format"], *stats["out_size"], stats["out_bytes"],
+            stats["decode_ms"], stats["encode_ms"],
+            ", без перекодирования" if stats["passthrough"] else "",
+        )
+        return out, filename
 
     def _build_prompt(self):
-        with open("prompts/system_prompt_describer.txt", "r", encoding="utf-8") as f:
+        return self._load_prompt("prompts/system_prompt_describer.txt")
+
+    @staticmethod
+    def _load_prompt(path: str) -> str:
+        with open(path, "r", encoding="utf-8") as f:
             return f.read()
 
     def _guess_filename(self, url, content_type=None):
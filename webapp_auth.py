@@ -0,0 +1,57 @@
+# webapp_auth.py
+import hashlib
+import hmac
+import json
+import time
+from typing import Dict
+from urllib.parse import parse_qsl
+
+# Сколько секунд initData считается свежей после auth_date
+INIT_DATA_MAX_AGE = 24 * 3600
+
+
+class InvalidInitData(ValueError):
+    """initData мини-приложения не прошла проверку — отдаётся клиенту как 400."""
+
+
+def validate_init_data(init_data: str, bot_token: str, *, max_age: float = INIT_DATA_MAX_AGE) -> Dict[str, str]:
+    """
+    Проверяет подпись initData, которую MAX передаёт мини-приложению
+    (window.WebApp.initData), и возвращает её поля без hash.
+
+    Ключ — HMAC-SHA256 токена бота с ключом "WebAppData"; подписана строка
+    из пар key=value всех полей, кроме hash, отсортированных по ключу
+    и соединённых переводом строки. auth_date старше max_age отклоняется.
+    """
+    if not init_data:
+        raise InvalidInitData("Отсутствует initData мини-приложения")
+    try:
+        fields = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+    except ValueError:
+        raise InvalidInitData("initData не разобрана")
+    received = fields.pop("hash", "")
+    check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode("utf-8"), hashlib.sha256).digest()
+    expected = hmac.new(secret, check_string.encode("utf-8"), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise InvalidInitData("Неверная подпись initData")
+    try:
+        auth_date = int(fields["auth_date"])
+    except (KeyError, ValueError):
+        raise InvalidInitData("В initData нет auth_date")
+    if time.time() - auth_date > max_age:
+        raise InvalidInitData("initData устарела, откройте мини-приложение заново")
+    return fields
+
+
+def webapp_user_id(init_data: str, bot_token: str, *, max_age: float = INIT_DATA_MAX_AGE) -> str:
+    """id пользователя из подписанной initData; только цифры — как user_id в боте."""
+    fields = validate_init_data(init_data, bot_token, max_age=max_age)
+    try:
+        user_id = json.loads(fields["user"])["id"]
+    except (KeyError, TypeError, ValueError):
+        raise InvalidInitData("В initData нет пользователя")
+    user_id = str(user_id)
+    if not user_id.isdigit():
+        raise InvalidInitData("Некорректный id пользователя")
+    return user_id